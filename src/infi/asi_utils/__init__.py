@@ -1,25 +1,36 @@
 """asi-utils, a partial cross-platform, pure-python implementation of sg3-utils
 
 Usage:
-    asi-utils turs                [options] <device> [--number=NUM]
-    asi-utils inq                 [options] <device> [--page=PG]
-    asi-utils luns                [options] <device> [--select=SR]
-    asi-utils rtpg                [options] <device> [--extended]
-    asi-utils readcap             [options] <device> [--long]
-    asi-utils pr_readkeys         [options] <device>
-    asi-utils pr_readreservation  [options] <device>
+    asi-utils turs                [options] <device>... [--number=NUM] [--queue-depth=QD]
+    asi-utils inq                 [options] <device>... [--page=PG]
+    asi-utils luns                [options] <device>... [--select=SR]
+    asi-utils rtpg                [options] <device>... [--extended]
+    asi-utils readcap             [options] <device>... [--long]
+    asi-utils pr_readkeys         [options] <device>...
+    asi-utils pr_readreservation  [options] <device>...
+    asi-utils pr_audit            [options] <device>... --keys=KEYS [--holder=KEY]
+    asi-utils pr_bulk             [options] <device>... --action=ACTION --key=KEY [--rollback] [--dry-run]
     asi-utils pr_register         [options] <device> <key>
     asi-utils pr_unregister       [options] <device> <key>
     asi-utils pr_reserve          [options] <device> <key>
     asi-utils pr_release          [options] <device> <key>
     asi-utils reserve             [options] <device> <third_party_device_id>
     asi-utils release             [options] <device> <third_party_device_id>
-    asi-utils raw                 [options] <device> <cdb>... [--request=RLEN] [--outfile=OFILE] [--infile=IFILE] [--send=SLEN]
-    asi-utils logs                [options] <device> [--page=PG]
+    asi-utils raw                 [options] <device> <cdb>... [--request=RLEN] [--outfile=OFILE] [--infile=IFILE] [--send=SLEN] [--count=CNT] [--chunk-size=CSZ]
+    asi-utils raw                 [options] <device> --script=FILE [--stop-on-check]
+    asi-utils logs                [options] <device>... [--page=PG | --all] [--state-dir=DIR]
     asi-utils reset               [options] <device> [--target | --host | --device]
+    asi-utils inventory           [options] <device>...
+    asi-utils paths               [options] <device>... [--samples=N]
+    asi-utils scan                [options] <device> [--read] [--transfer-size=BLOCKS] [--queue-depth=QD] [--workers=N] [--stripes=N] [--checkpoint=FILE]
+    asi-utils watch               [options] <device>... [--interval=SEC] [--checks=CHECKS] [--rounds=N]
+    asi-utils decode              [options] <capture>... --type=TYPE [--page=PG] [--select=SR] [--extended] [--long] [--processes=N]
+    asi-utils benchmark           [options] [--iterations=N] [--latency=SEC] [--suite=SUITE]
+    asi-utils batch               [options] [--socket=PATH]
 
 Options:
     -n NUM, --number=NUM        number of test_unit_ready commands [default: 1]
+    --queue-depth=QD            number of test_unit_ready (or scan, per worker) commands kept in flight [default: 1]
     -p PG, --page=PG            page number or abbreviation
     -s SR, --select=SR          select report SR [default: 0]
     --extended                  get rtpg extended response instead of length only
@@ -28,30 +39,69 @@ Options:
     --outfile=OFILE             write binary data to OFILE
     --infile=IFILE              read data to send from IFILE [default: <stdin>]
     --send=SLEN                 send SLEN bytes of data (data-out)
+    --count=CNT                 repeat the cdb CNT times, advancing its lba (or buffer offset)
+    --chunk-size=CSZ            move RLEN/SLEN bytes in commands of CSZ bytes each
+    --keys=KEYS                 comma-separated reservation keys every device is expected to have registered
+    --holder=KEY                key expected to hold the reservation (any of the expected keys if omitted)
+    --action=ACTION             persistent reservation action: register, unregister, reserve or release
+    --key=KEY                   reservation key of the action
+    --rollback                  if the action fails on any device, undo it on the devices it succeeded on
+    --dry-run                   read the registered keys of every device instead of changing them
+    --all                       read every supported log page, as named counters
+    --state-dir=DIR             keep the last --all sample of every device in DIR, outputting the counter rates since
+    --script=FILE               run the cdbs listed in FILE in order, one per line with its own options
+    --stop-on-check             skip the rest of a --script after a step that fails (with a check condition or error)
     --target                    target reset
     --host                      host (bus adapter: HBA) reset
     --device                    device (logical unit) reset
+    --cache-dir=DIR             cache identity data (inquiry, vpd pages, capacity) and response lengths in DIR
+    --cache-ttl=SEC             seconds before cached data is read again [default: 3600]
+    --interval=SEC              seconds between polls of each watched device [default: 10]
+    --checks=CHECKS             comma-separated watch checks: turs, alua and logs:<page> [default: turs,alua]
+    --rounds=N                  polls before watch exits, 0 to poll until interrupted [default: 0]
+    --samples=N                 test_unit_ready commands paths sends down each path [default: 10]
+    --read                      scan with READ (16) instead of VERIFY (16)
+    --transfer-size=BLOCKS      blocks per scan command [default: 128]
+    --workers=N                 threads scanning stripes concurrently, each with its own device session [default: 4]
+    --stripes=N                 stripes the scan splits the device into, the cells of its heatmap [default: 256]
+    --checkpoint=FILE           save completed stripes to FILE, and only scan the stripes missing from it
+    --type=TYPE                 command the decoded payloads are responses of: inq, luns, rtpg, readcap, pr_readkeys,
+                                pr_readreservation or logs
+    --processes=N               worker processes decode parses payloads with, 0 for one per cpu [default: 0]
+    --iterations=N              commands to send per benchmarked subcommand [default: 1000]
+    --latency=SEC               latency of the simulated device used for benchmarks [default: 0]
+    --suite=SUITE               benchmark suite: commands, hex (1 MiB and 64 MiB payloads), text or tables [default: commands]
+    --socket=PATH               serve batch requests on a unix socket instead of stdin
+    --path=PATH                 send commands to dm (multipath) devices through one of their paths: a slave name (sdb),
+                                its index, or round-robin to spread commands across the paths
+    --jobs=JOBS                 number of devices to query concurrently [default: 16]
     -r, --raw                   output response in binary
     -h, --hex                   output response in hexadecimal
     -j, --json                  output response in json
+    --ndjson                    output one compact json record (device, command, timestamp, latency, result) per line
+    --stats                     print open/execute/parse/format times per device to stderr on exit
+    --prometheus=FILE           write the same timings to FILE in the prometheus text format on exit
+    --trace=FILE                write every timing event to FILE as csv
+    --record=FILE               append every command sent to the devices, with its response and latency, to FILE
+    --replay=FILE               answer commands from a --record trace in FILE instead of the devices
+    --replay-delay=FACTOR       scale replayed latencies by FACTOR, 0 to answer as fast as possible [default: 1]
     -v, --verbose               increase verbosity
     -V, --version               print version string and exit
 """
 
 from __future__ import print_function
 import sys
-import docopt
-from infi.pyutils.contexts import contextmanager
-from infi.pyutils.decorators import wraps
-from . import formatters
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from .stats import timer, latency_summary
 
 
 def exception_handler(func):
-    from infi.asi.errors import AsiCheckConditionError
-    from infi.asi.errors import AsiOSError, AsiSCSIError
-
     @wraps(func)
     def wrapper(*args, **kwargs):
+        from infi.asi.errors import AsiCheckConditionError
+        from infi.asi.errors import AsiOSError, AsiSCSIError, AsiException
         try:
             return func(*args, **kwargs)
         except AsiCheckConditionError as error:
@@ -62,15 +112,66 @@ def exception_handler(func):
         except (AsiOSError, AsiSCSIError) as error:
             print(error, file=sys.stderr)
             raise SystemExit(1)
+        except AsiException as error:
+            print(describe_error(error), file=sys.stderr)
+            raise SystemExit(1)
     return wrapper
 
 
+def describe_error(error):
+    """ Returns the message of an error along with its type, as infi.asi's internal errors only carry a value """
+    return '%s: %s' % (type(error).__name__, error) if str(error) else type(error).__name__
+
+
+class CapturedOutput(object):
+    def __init__(self):
+        super(CapturedOutput, self).__init__()
+        self.lines = []
+        self.failed = False
+
+    def append(self, string, file):
+        self.lines.append((string, file))
+
+
+class LineWriter(object):
+    """ Writes lines to a file in batches, flushing at most every flush_interval seconds or max_lines lines """
+    def __init__(self, file, flush_interval=1.0, max_lines=4096):
+        super(LineWriter, self).__init__()
+        self.file = file
+        self.flush_interval = flush_interval
+        self.max_lines = max_lines
+        self._lines = []
+        self._last_flush = timer()
+        self._lock = threading.Lock()
+
+    def write(self, line):
+        with self._lock:
+            self._lines.append(line)
+            if len(self._lines) >= self.max_lines or timer() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._lines:
+            self.file.write('\n'.join(self._lines) + '\n')
+            self._lines = []
+        self.file.flush()
+        self._last_flush = timer()
+
+
 class OutputContext(object):
     def __init__(self):
         super(OutputContext, self).__init__()
         self._verbose = False
-        self._command_formatter = formatters.DefaultOutputFormatter()
-        self._result_formatter = formatters.DefaultOutputFormatter()
+        self._command_formatter = None
+        self._result_formatter = None
+        self._writer = None
+        self._local = threading.local()
+        self.ndjson = False
+        self.hooks = []
 
     def enable_verbose(self):
         self._verbose = True
@@ -85,35 +186,229 @@ class OutputContext(object):
         self.set_command_formatter(formatter)
         self.set_result_formatter(formatter)
 
+    def set_ndjson(self, file=sys.stdout):
+        """ Outputs every result as a json record on its own line, written to file (instead of stdout) in batches.
+        Verbose command output goes to stderr so that file only holds records """
+        from .formatters import NdjsonOutputFormatter
+        self.ndjson = True
+        self.set_result_formatter(NdjsonOutputFormatter(self.fields))
+        self._writer = LineWriter(file)
+
+    @contextmanager
+    def formatters(self):
+        """ Restores the command and result formatters when the context exits """
+        previous = (self._command_formatter, self._result_formatter)
+        try:
+            yield
+        finally:
+            self._command_formatter, self._result_formatter = previous
+
+    def flush(self):
+        if self._writer is not None:
+            self._writer.flush()
+
+    def add_hook(self, hook):
+        """ Sends timing events to hook, see instrumentation.py """
+        self.hooks.append(hook)
+
+    def close_hooks(self):
+        hooks, self.hooks = self.hooks, []
+        for hook in hooks:
+            hook.close()
+
+    def emit(self, kind, seconds, **fields):
+        """ Sends a timing event, described by the current thread's fields and the given ones, to the hooks """
+        if not self.hooks:
+            return
+        from time import time
+        from .instrumentation import Event
+        fields = dict(self.fields(), **fields)
+        event = Event(time(), kind, fields.get('device'), fields.get('command'), fields.get('operation'), seconds,
+                      fields.get('bytes_in'), fields.get('bytes_out'))
+        for hook in self.hooks:
+            hook.event(event)
+
+    def fields(self):
+        """ Returns the fields (device, command, latency...) describing the current thread's results """
+        return getattr(self._local, 'fields', {})
+
+    def update_fields(self, **fields):
+        self._local.fields = dict(self.fields(), **fields)
+
+    @contextmanager
+    def scope(self, **fields):
+        """ Adds fields to the current thread's results until the context exits """
+        previous = self.fields()
+        self._local.fields = dict(previous, **fields)
+        try:
+            yield
+        finally:
+            self._local.fields = previous
+
+    @contextmanager
+    def capture(self):
+        """ Collects everything printed by the current thread instead of writing it out """
+        previous = getattr(self._local, 'captured', None)
+        captured = CapturedOutput()
+        self._local.captured = captured
+        try:
+            yield captured
+        finally:
+            self._local.captured = previous
+
     def _print(self, string, file=sys.stdout):
+        captured = getattr(self._local, 'captured', None)
+        if captured is not None:
+            captured.append(string, file)
+            return
+        if self._writer is not None and file is not sys.stderr:
+            self._writer.write(string)
+            return
         print(string, file=file)
 
+    def output_captured(self, device, captured):
+        for string, file in captured.lines:
+            self._print('%s: %s' % (device, string) if file is sys.stderr else string, file=file)
+
+    def result_formatter_name(self):
+        """ Returns the class name of the result formatter, for other processes to create their own """
+        if self._result_formatter is None:
+            self._result_formatter = self._default_formatter()
+        return type(self._result_formatter).__name__
+
+    def _default_formatter(self):
+        from .formatters import DefaultOutputFormatter
+        return DefaultOutputFormatter()
+
     def output_command(self, command, file=sys.stdout):
         if not self._verbose:
             return
-        self._print(self._command_formatter.format(command), file=file)
+        if self._command_formatter is None:
+            self._command_formatter = self._default_formatter()
+        self._print(self._command_formatter.format(command), file=sys.stderr if self.ndjson else file)
 
     def output_result(self, result, file=sys.stdout):
-        self._print(self._result_formatter.format(result), file=file)
+        if self._result_formatter is None:
+            self._result_formatter = self._default_formatter()
+        start = timer()
+        for string in self._result_formatter.iter_format(result):
+            self._print(string, file=file)
+        self.emit('format', timer() - start)
 
     def output_error(self, result, file=sys.stdout):
-        self._print(formatters.ErrorOutputFormatter().format(result), file=file)
+        from .formatters import ErrorOutputFormatter
+        self._print(ErrorOutputFormatter().format(result), file=file)
 
 
 ActiveOutputContext = OutputContext()
 
 
+class ExecuterPool(object):
+    """ Keeps one open executer per device so that consecutive commands skip the device open """
+    def __init__(self):
+        super(ExecuterPool, self).__init__()
+        self._contexts = {}
+        self._opening = {}
+        self._lock = threading.Lock()
+
+    def _get(self, device):
+        # devices are opened under their own lock, so that a device that hangs on open only blocks its own commands
+        with self._lock:
+            opening = self._opening.setdefault(device, threading.Lock())
+        with opening:
+            with self._lock:
+                if device in self._contexts:
+                    return self._contexts[device][1]
+            context = open_executer(device)
+            executer = context.__enter__()
+            with self._lock:
+                self._contexts[device] = (context, executer)
+            return executer
+
+    def discard(self, device):
+        with self._lock:
+            context, _ = self._contexts.pop(device, (None, None))
+        if context is not None:
+            context.__exit__(None, None, None)
+
+    def close(self):
+        for device in list(self._contexts):
+            self.discard(device)
+
+    @contextmanager
+    def executer(self, device):
+        from infi.asi.errors import AsiOSError
+        executer = self._get(device)
+        try:
+            yield executer
+        except (AsiOSError, OSError, IOError):
+            # the device may have gone away, reopen it on the next command
+            self.discard(device)
+            raise
+
+
+ActiveExecuterPool = None
+ActiveResponseCache = None
+ActivePathSelection = None
+ActiveRecorder = None
+ActiveReplay = None
+
+
+def wrap_executer(executer, device):
+    if ActiveRecorder is not None:
+        from .replay import RecordingExecuter
+        executer = RecordingExecuter(executer, ActiveRecorder, device)
+    if ActiveOutputContext.hooks:
+        from .instrumentation import InstrumentedExecuter
+        executer = InstrumentedExecuter(executer, ActiveOutputContext)
+    if ActiveResponseCache is not None:
+        from .cache import CachingExecuter
+        executer = CachingExecuter(executer, ActiveResponseCache, device)
+    return executer
+
+
 @contextmanager
 def asi_context(device):
+    with ActiveOutputContext.scope(device=device):
+        if ActiveExecuterPool is not None:
+            with ActiveExecuterPool.executer(device) as executer:
+                yield executer
+        else:
+            with open_executer(device) as executer:
+                yield executer
+
+@contextmanager
+def open_executer(device):
+    start, closing = timer(), None
+    try:
+        with open_os_executer(device) as executer:
+            ActiveOutputContext.emit('open', timer() - start, device=device)
+            try:
+                yield wrap_executer(executer, device)
+            finally:
+                closing = timer()
+    finally:
+        if closing is not None:
+            ActiveOutputContext.emit('close', timer() - closing, device=device)
+
+@contextmanager
+def open_os_executer(device):
     from infi.asi import executers
     from infi.os_info import get_platform_string
+    from .simulator import SIMULATED_DEVICE_PREFIX
+    if ActiveReplay is not None:
+        yield ActiveReplay.executer(device)
+        return
+    if device.startswith(SIMULATED_DEVICE_PREFIX):
+        from .simulator import simulated_executer
+        yield simulated_executer(device)
+        return
     platform = get_platform_string()
     if platform.startswith('windows'):
         _func = executers.windows
     elif platform.startswith('linux'):
-        if device.startswith('/dev/sd'):
-            from infi.sgutils.sg_map import get_sg_from_sd
-            device = get_sg_from_sd(device)
+        from .devices import resolve_device
+        device = resolve_device(device, ActivePathSelection)
         _func = executers.linux_sg if device.startswith('/dev/sg') else executers.linux_dm
     elif platform.startswith('solaris'):
         _func = executers.solaris
@@ -124,10 +419,56 @@ def asi_context(device):
     with _func(device) as executer:
         yield executer
 
+def run_on_device(func, device, **kwargs):
+    from infi.asi.errors import AsiCheckConditionError
+    from infi.asi.errors import AsiOSError, AsiSCSIError, AsiException
+    with ActiveOutputContext.capture() as captured:
+        try:
+            func(device, **kwargs)
+        except AsiCheckConditionError as error:
+            ActiveOutputContext.output_error(error.sense_obj, file=sys.stderr)
+        except (ValueError, NotImplementedError, AsiOSError, AsiSCSIError, OSError, IOError) as error:
+            ActiveOutputContext._print(error, file=sys.stderr)
+            captured.failed = True
+        except AsiException as error:
+            # e.g. a LUN report infi.asi cannot parse: only this device fails
+            ActiveOutputContext._print(describe_error(error), file=sys.stderr)
+            captured.failed = True
+    return captured
+
+def run_on_devices(func, devices, jobs, **kwargs):
+    """ Runs func on every device concurrently, printing each device's output as soon as it completes """
+    from . import parallel
+    devices = parallel.expand_devices(devices)
+    if not devices:
+        raise ValueError("no devices matched")
+    if len(devices) == 1:
+        with ActiveOutputContext.scope(device=devices[0]):
+            return func(devices[0], **kwargs)
+    fields = ActiveOutputContext.fields()
+
+    def run(device):
+        with ActiveOutputContext.scope(**dict(fields, device=device)):
+            return run_on_device(func, device, **kwargs)
+    failed = False
+    for device, captured in parallel.imap_unordered(run, devices, jobs):
+        if not ActiveOutputContext.ndjson:
+            # records carry their device
+            ActiveOutputContext._print('%s:' % device)
+        ActiveOutputContext.output_captured(device, captured)
+        failed = failed or captured.failed
+    if failed:
+        raise SystemExit(1)
+
 def sync_wait(asi, command, supresss_output=False, additional_data=None):
     from infi.asi.coroutines.sync_adapter import sync_wait as _sync_wait
     ActiveOutputContext.output_command(command)
+    executed = getattr(asi, 'elapsed', 0.0)
+    start = timer()
     result = _sync_wait(command.execute(asi))
+    latency = timer() - start
+    ActiveOutputContext.update_fields(latency=latency)
+    ActiveOutputContext.emit('parse', latency - (getattr(asi, 'elapsed', 0.0) - executed))
     if additional_data:
         for key, value in additional_data.items():
             setattr(result, key, value)
@@ -138,18 +479,19 @@ def sync_wait(asi, command, supresss_output=False, additional_data=None):
 def parse_key(key):
     return int(key, 16) if key.startswith('0x') else int(key)
 
-def pr_in_command(service_action, device):
+def build_pr_in_command(service_action, allocation_length=520):
     from infi.asi.cdb.persist.input import PersistentReserveInCommand
-    allocation_length = 520
+    return PersistentReserveInCommand(service_action=service_action, allocation_length=allocation_length)
+
+def read_pr_in(asi, service_action, device=None):
+    from .allocation import read_variable_length, pr_in_length
+    return read_variable_length(asi, ('pr_in', service_action),
+                                lambda allocation_length: build_pr_in_command(service_action, allocation_length),
+                                pr_in_length, 520, 0xffff, device)
+
+def pr_in_command(service_action, device):
     with asi_context(device) as asi:
-        allocated_enough = False
-        while not allocated_enough:
-            command = PersistentReserveInCommand(service_action=service_action,
-                                                 allocation_length=allocation_length)
-            response = sync_wait(asi, command, supresss_output=True)
-            allocated_enough = allocation_length >= response.required_allocation_length()
-            allocation_length = response.required_allocation_length()
-        ActiveOutputContext.output_result(response)
+        ActiveOutputContext.output_result(read_pr_in(asi, service_action))
 
 def pr_out_command(command, device):
     with asi_context(device) as asi:
@@ -163,24 +505,78 @@ def pr_readreservation(device):
     from infi.asi.cdb.persist.input import PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES
     pr_in_command(PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES.READ_RESERVATION, device)
 
-def turs(device, number):
+def pipelined_turs(asi, number, queue_depth):
+    """ Sends `number` TEST UNIT READY commands built from a single CDB, keeping up to `queue_depth` of them
+    in flight, and returns a summary of the run instead of the individual results """
+    from infi.asi import SCSIReadCommand
     from infi.asi.cdb.tur import TestUnitReadyCommand
+    from infi.asi.coroutines.sync_adapter import sync_wait as _sync_wait
+    from infi.asi.errors import AsiCheckConditionError
+    command = TestUnitReadyCommand()
+    ActiveOutputContext.output_command(command)
+    datagram = command.create_datagram()
+    latencies, errors = [], []
+    pending = set()
+
+    def output_record(latency, exception):
+        # with --ndjson every command gets its own record, ahead of the summary
+        if ActiveOutputContext.ndjson:
+            error = getattr(getattr(exception, 'sense_obj', None), 'sense_key', None) or \
+                (None if exception is None else str(exception))
+            with ActiveOutputContext.scope(latency=latency, error=error):
+                ActiveOutputContext.output_result(None)
+
+    def send(index):
+        submitted = timer()
+
+        def callback(data, exception):
+            latencies.append(timer() - submitted)
+            pending.discard(index)
+            if exception is not None:
+                errors.append(exception)
+            output_record(latencies[-1], exception)
+        pending.add(index)
+        _sync_wait(asi.send(SCSIReadCommand(datagram, 0), callback=callback))
+
+    start = timer()
+    if queue_depth > 1 and hasattr(asi, '_process_pending_response'):
+        sent = 0
+        while sent < number or pending:
+            while sent < number and len(pending) < queue_depth and not asi.is_queue_full():
+                send(sent)
+                sent += 1
+            _sync_wait(asi._process_pending_response())
+    else:
+        for index in range(number):
+            submitted = timer()
+            exception = None
+            try:
+                _sync_wait(asi.call(SCSIReadCommand(datagram, 0)))
+            except AsiCheckConditionError as error:
+                errors.append(error)
+                exception = error
+            latencies.append(timer() - submitted)
+            output_record(latencies[-1], exception)
+    elapsed = timer() - start
+    check_conditions = [error for error in errors if isinstance(error, AsiCheckConditionError)]
+    if check_conditions:
+        ActiveOutputContext.output_error(check_conditions[0].sense_obj, file=sys.stderr)
+    return dict(commands=number, errors=len(errors), queue_depth=queue_depth, elapsed=elapsed,
+                iops=number / elapsed if elapsed else None, latency=latency_summary(latencies))
+
+def turs(device, number, queue_depth=1):
+    from infi.asi.cdb.tur import TestUnitReadyCommand
+    number, queue_depth = int(number), int(queue_depth)
     with asi_context(device) as asi:
-        for i in range(int(number)):
-            command = TestUnitReadyCommand()
-            sync_wait(asi, command)
+        if number == 1 and queue_depth == 1:
+            sync_wait(asi, TestUnitReadyCommand())
+        else:
+            ActiveOutputContext.output_result(pipelined_turs(asi, number, queue_depth))
 
-def inq(device, page, supresss_output=False):
+def build_inq_command(page):
     from infi.asi.cdb.inquiry import standard, vpd_pages
-    additional_data = {}
     if page is None:
-        command = standard.StandardInquiryCommand(allocation_length=219)
-        try:
-            unit_serial_number_command_result = inq(device, '0x80', supresss_output=True)
-        except:
-            additional_data = {'product_serial_number': None}
-        else:
-            additional_data = {'product_serial_number': unit_serial_number_command_result.product_serial_number}
+        return standard.StandardInquiryCommand(allocation_length=219)
     elif page.isdigit():
         command = vpd_pages.get_vpd_page(int(page))()
     elif page.startswith('0x'):
@@ -189,32 +585,100 @@ def inq(device, page, supresss_output=False):
         raise ValueError("invalid vpd page: %s" % page)
     if command is None:
         raise ValueError("unsupported vpd page: %s" % page)
+    return command
+
+def read_serial_number(asi):
+    try:
+        return sync_wait(asi, build_inq_command('0x80'), supresss_output=True).product_serial_number
+    except Exception:
+        return None
+
+def inq(device, page, supresss_output=False):
+    command = build_inq_command(page)
     with asi_context(device) as asi:
+        additional_data = {}
+        if page is None:
+            additional_data = {'product_serial_number': read_serial_number(asi)}
         return sync_wait(asi, command, supresss_output, additional_data)
 
-def pr_register(device, key):
+def collect_inventory(asi):
+    """ Reads the identity of a device in one session: standard INQUIRY, the VPD pages it advertises
+    (unit serial number, device identification), capacity and the ALUA state of its target port group """
+    from binascii import hexlify
+    from infi.asi.errors import AsiCheckConditionError
+    from . import formatters
+    to_dict = formatters.DictOutputFormatter().format
+    record = {}
+    standard = sync_wait(asi, build_inq_command(None), supresss_output=True)
+    record['standard'] = to_dict(standard)
+    try:
+        supported_pages = sync_wait(asi, build_inq_command('0x00'), supresss_output=True).vpd_parameters
+    except AsiCheckConditionError:
+        supported_pages = []
+    record['supported_vpd_pages'] = list(supported_pages)
+    record['serial'] = None
+    if 0x80 in supported_pages:
+        record['serial'] = sync_wait(asi, build_inq_command('0x80'), supresss_output=True).product_serial_number
+    record['designators'], record['wwn'] = [], None
+    target_port_group = None
+    if 0x83 in supported_pages:
+        identification = sync_wait(asi, build_inq_command('0x83'), supresss_output=True)
+        for designator in identification.designators_list:
+            if designator.designator_type == 0x03 and designator.association == 0 and record['wwn'] is None:
+                record['wwn'] = hexlify(designator.pack())[8:].decode()
+            elif designator.designator_type == 0x05:
+                target_port_group = designator.target_port_group
+        record['designators'] = to_dict(identification)['designators_list']
+    try:
+        capacity = sync_wait(asi, build_readcap_command(read_16=True), supresss_output=True)
+    except AsiCheckConditionError:
+        capacity = sync_wait(asi, build_readcap_command(read_16=False), supresss_output=True)
+    record['capacity'] = dict(to_dict(capacity),
+                              size=(capacity.last_logical_block_address + 1) * capacity.block_length_in_bytes)
+    record['target_port_group'], record['alua_state'] = target_port_group, None
+    if standard.tpgs:
+        target_port_groups = read_rtpg(asi, extended=False)
+        record['target_port_groups'] = to_dict(target_port_groups)['descriptor_list']
+        for descriptor in target_port_groups.descriptor_list:
+            if descriptor.target_port_group == target_port_group:
+                record['alua_state'] = formatters.ALUA_STATES.get(descriptor.asymetric_access_state)
+    return record
+
+def inventory(device):
+    with asi_context(device) as asi:
+        record = collect_inventory(asi)
+    record['device'] = device
+    ActiveOutputContext.output_result(record)
+
+def build_pr_out_command(action, key, pr_type=1):
+    """ Builds the PERSISTENT RESERVE OUT command of action (register, unregister, reserve or release) for key,
+    reserving and releasing reservations of pr_type """
     from infi.asi.cdb.persist.output import PersistentReserveOutCommand, PERSISTENT_RESERVE_OUT_SERVICE_ACTION_CODES
-    command = PersistentReserveOutCommand(service_action=PERSISTENT_RESERVE_OUT_SERVICE_ACTION_CODES.REGISTER,
-                                          service_action_reservation_key=parse_key(key))
-    pr_out_command(command, device)
+    if action == 'register':
+        return PersistentReserveOutCommand(service_action=PERSISTENT_RESERVE_OUT_SERVICE_ACTION_CODES.REGISTER,
+                                           service_action_reservation_key=key)
+    if action == 'unregister':
+        return PersistentReserveOutCommand(service_action=PERSISTENT_RESERVE_OUT_SERVICE_ACTION_CODES.REGISTER,
+                                           reservation_key=key)
+    if action == 'reserve':
+        return PersistentReserveOutCommand(service_action=PERSISTENT_RESERVE_OUT_SERVICE_ACTION_CODES.RESERVE,
+                                           reservation_key=key, pr_type=pr_type)
+    if action == 'release':
+        return PersistentReserveOutCommand(service_action=PERSISTENT_RESERVE_OUT_SERVICE_ACTION_CODES.RELEASE,
+                                           reservation_key=key, pr_type=pr_type)
+    raise ValueError("invalid action: %s (expected register, unregister, reserve or release)" % action)
+
+def pr_register(device, key):
+    pr_out_command(build_pr_out_command('register', parse_key(key)), device)
 
 def pr_unregister(device, key):
-    from infi.asi.cdb.persist.output import PersistentReserveOutCommand, PERSISTENT_RESERVE_OUT_SERVICE_ACTION_CODES
-    command = PersistentReserveOutCommand(service_action=PERSISTENT_RESERVE_OUT_SERVICE_ACTION_CODES.REGISTER,
-                                          reservation_key=parse_key(key))
-    pr_out_command(command, device)
+    pr_out_command(build_pr_out_command('unregister', parse_key(key)), device)
 
 def pr_reserve(device, key):
-    from infi.asi.cdb.persist.output import PersistentReserveOutCommand, PERSISTENT_RESERVE_OUT_SERVICE_ACTION_CODES
-    command = PersistentReserveOutCommand(service_action=PERSISTENT_RESERVE_OUT_SERVICE_ACTION_CODES.RESERVE,
-                                          reservation_key=parse_key(key))
-    pr_out_command(command, device)
+    pr_out_command(build_pr_out_command('reserve', parse_key(key)), device)
 
 def pr_release(device, key):
-    from infi.asi.cdb.persist.output import PersistentReserveOutCommand, PERSISTENT_RESERVE_OUT_SERVICE_ACTION_CODES
-    command = PersistentReserveOutCommand(service_action=PERSISTENT_RESERVE_OUT_SERVICE_ACTION_CODES.RELEASE,
-                                          reservation_key=parse_key(key))
-    pr_out_command(command, device)
+    pr_out_command(build_pr_out_command('release', parse_key(key)), device)
 
 def reserve(device, third_party_device_id):
     from infi.asi.cdb.reserve import Reserve10Command
@@ -226,82 +690,182 @@ def release(device, third_party_device_id):
     command = Release10Command(parse_key(third_party_device_id))
     pr_out_command(command, device)
 
+def build_luns_command(select_report, allocation_length=16384):
+    from .tables import CompactReportLunsCommand
+    return CompactReportLunsCommand(select_report=int(select_report), allocation_length=allocation_length)
+
+def read_luns(asi, select_report, device=None):
+    from .allocation import read_variable_length, report_luns_length
+    return read_variable_length(asi, ('luns', int(select_report)),
+                                lambda allocation_length: build_luns_command(select_report, allocation_length),
+                                report_luns_length, 16384, 0xffffffff, device)
+
 def luns(device, select_report):
-    from infi.asi.cdb.report_luns import ReportLunsCommand
-    command = ReportLunsCommand(select_report=int(select_report))
-    pr_out_command(command, device)
+    with asi_context(device) as asi:
+        ActiveOutputContext.output_result(read_luns(asi, select_report))
 
-def rtpg(device, extended):
-    from infi.asi.cdb.rtpg import RTPGCommand
+def build_rtpg_command(extended, allocation_length=16384):
+    from .tables import CompactRTPGCommand
     data_format = 1 if extended else 0
-    command = RTPGCommand(parameter_data_format=data_format)
-    pr_out_command(command, device)
+    return CompactRTPGCommand(parameter_data_format=data_format, allocation_length=allocation_length)
 
-def readcap(device, read_16):
+def read_rtpg(asi, extended, device=None):
+    from .allocation import read_variable_length, rtpg_length
+    return read_variable_length(asi, ('rtpg', bool(extended)),
+                                lambda allocation_length: build_rtpg_command(extended, allocation_length),
+                                lambda data: rtpg_length(data, extended), 16384, 0xffffffff, device)
+
+def rtpg(device, extended):
+    with asi_context(device) as asi:
+        ActiveOutputContext.output_result(read_rtpg(asi, extended))
+
+def build_readcap_command(read_16):
     from infi.asi.cdb.read_capacity import ReadCapacity10Command
     from infi.asi.cdb.read_capacity import ReadCapacity16Command
-    command = ReadCapacity16Command() if read_16 else ReadCapacity10Command()
-    pr_out_command(command, device)
+    return ReadCapacity16Command() if read_16 else ReadCapacity10Command()
 
-def build_raw_command(cdb, request_length, output_file, send_length, input_file):
-    from infi.asi import SCSIReadCommand, SCSIWriteCommand
+def readcap(device, read_16):
+    pr_out_command(build_readcap_command(read_16), device)
+
+class RawCommand(object):
+    def __init__(self, cdb_raw, request_length=0, data=None):
+        super(RawCommand, self).__init__()
+        self.cdb_raw = cdb_raw
+        self.request_length = request_length
+        self.data = data
+
+    def create_datagram(self):
+        return self.cdb_raw
+
+    def execute(self, executer):
+        from infi.asi import SCSIReadCommand, SCSIWriteCommand
+        datagram = self.create_datagram()
+        if self.data:
+            result_datagram = yield executer.call(SCSIWriteCommand(datagram, self.data))
+        else:
+            result_datagram = yield executer.call(SCSIReadCommand(datagram, self.request_length))
+        yield result_datagram
+
+    def __str__(self):
+        return self.cdb_raw
+
+def parse_length(length, description):
+    if length is None:
+        return 0
+    elif length.isdigit():
+        return int(length)
+    elif length.startswith('0x'):
+        return int(length, 16)
+    raise ValueError("invalid %s: %s" % (description, length))
+
+def open_input_file(input_file):
+    if input_file == '<stdin>':
+        return getattr(sys.stdin, 'buffer', sys.stdin)
+    return open(input_file, 'rb')
+
+def restore_cdb(cdb):
     from hexdump import restore
+    return restore(' '.join(cdb) if isinstance(cdb, list) else cdb)
 
-    class CDB(object):
-        def create_datagram(self):
-            return cdb_raw
-
-        def execute(self, executer):
-            datagram = self.create_datagram()
-            if send_length:
-                result_datagram = yield executer.call(SCSIWriteCommand(datagram, data))
-            else:
-                result_datagram = yield executer.call(SCSIReadCommand(datagram, request_length))
-            yield result_datagram
-
-        def __str__(self):
-            return cdb_raw
-
-    cdb_raw = restore(' '.join(cdb) if isinstance(cdb, list) else cdb)
-
-    if request_length is None:
-        request_length = 0
-    elif request_length.isdigit():
-        request_length = int(request_length)
-    elif request_length.startswith('0x'):
-        request_length = int(request_length, 16)
-    else:
-        raise ValueError("invalid request length: %s" % request_length)
-
-    if send_length is None:
-        send_length = 0
-    elif send_length.isdigit():
-        send_length = int(send_length)
-    elif send_length.startswith('0x'):
-        send_length = int(send_length, 16)
-    else:
-        raise ValueError("invalid send length: %s" % send_length)
+def build_raw_command(cdb, request_length, output_file, send_length, input_file):
+    cdb_raw = restore_cdb(cdb)
+    request_length = parse_length(request_length, 'request length')
+    send_length = parse_length(send_length, 'send length')
 
-    data = ''
+    data = b''
     if send_length:
-        if input_file == '<stdin>':
-            data = sys.stdin.read(send_length)
-        else:
-            with open(input_file) as fd:
-                data = fd.read(send_length)
-    assert len(data) == send_length
+        fd = open_input_file(input_file)
+        try:
+            data = fd.read(send_length)
+        finally:
+            if input_file != '<stdin>':
+                fd.close()
+    if len(data) != send_length:
+        raise ValueError("expected %d bytes of data to send, got %d" % (send_length, len(data)))
+
+    return RawCommand(cdb_raw, request_length, data)
+
+def readinto_exactly(fd, view):
+    """ Fills view from fd, returning the number of bytes read (less than len(view) only at end of file) """
+    filled = 0
+    while filled < len(view):
+        count = fd.readinto(view[filled:])
+        if not count:
+            break
+        filled += count
+    return filled
 
-    return CDB()
+def stream_raw(asi, cdb_raw, request_length, send_length, input_fd, output_fd, count, chunk_size):
+    """ Repeats cdb_raw, advancing its LBA or buffer offset each time. With chunk_size, the RLEN/SLEN bytes of
+    cdb_raw are moved in commands of chunk_size bytes (the last one moving the rest), between a single
+    preallocated buffer and the input/output files """
+    from itertools import islice
+    from .cdbs import advance_cdb, chunk_block_size, chunk_cdb
+    total_length = send_length or request_length
+    if chunk_size:
+        if not total_length:
+            raise ValueError("--chunk-size requires --request or --send")
+        block_size = chunk_block_size(cdb_raw, total_length, chunk_size)
+        # generated as they are sent, so that memory stays flat however many chunks there are
+        chunks = ((chunk_cdb(cdb_raw, offset, min(chunk_size, total_length - offset), block_size),
+                   min(chunk_size, total_length - offset)) for offset in range(0, total_length, chunk_size))
+        chunks = islice(chunks, count)
+        buffer_length = min(chunk_size, total_length)
+    else:
+        chunks = ((advance_cdb(cdb_raw, index, total_length), total_length)
+                  for index in range(1 if count is None else count))
+        buffer_length = total_length
+    buffer = memoryview(bytearray(buffer_length if send_length else 0))
+    sent = 0
+    for cdb, length in chunks:
+        if send_length:
+            read = readinto_exactly(input_fd, buffer[:length])
+            if read != length:
+                raise ValueError("input ended after %d bytes" % (sent + read))
+            sent += read
+            # infi.asi copies data-out into its own ctypes buffer, so this is the only other copy made
+            sync_wait(asi, RawCommand(cdb, data=buffer[:length].tobytes()), supresss_output=True)
+        else:
+            result = sync_wait(asi, RawCommand(cdb, request_length=length), supresss_output=True)
+            if output_fd is not None and result:
+                output_fd.write(result[:length])
 
-def raw(device, cdb, request_length, output_file, send_length, input_file):
-    command = build_raw_command(cdb, request_length, output_file, send_length, input_file)
+def raw_script(device, script, stop_on_check=False):
+    from .script import parse_script, run_script
+    with open(script) as fd:
+        steps = parse_script(fd)
     with asi_context(device) as asi:
-        result = sync_wait(asi, command, supresss_output=True)
-        if output_file:
-            with open(output_file, 'w') as fd:
-                fd.write(result)
+        records = run_script(asi, steps, stop_on_check)
+    ActiveOutputContext.output_result(records)
+    return records
 
-def logs(device, page):
+def raw(device, cdb, request_length, output_file, send_length, input_file, count=None, chunk_size=None):
+    if count is None and chunk_size is None:
+        command = build_raw_command(cdb, request_length, output_file, send_length, input_file)
+        with asi_context(device) as asi:
+            result = sync_wait(asi, command, supresss_output=True)
+            if output_file:
+                with open(output_file, 'wb') as fd:
+                    fd.write(result or b'')
+        return
+    count = None if count is None else parse_length(count, 'count')
+    chunk_size = None if chunk_size is None else parse_length(chunk_size, 'chunk size')
+    request_length = parse_length(request_length, 'request length')
+    send_length = parse_length(send_length, 'send length')
+    if send_length and request_length:
+        raise ValueError("cannot both send and request data")
+    input_fd = open_input_file(input_file) if send_length else None
+    output_fd = open(output_file, 'wb') if output_file else None
+    try:
+        with asi_context(device) as asi:
+            stream_raw(asi, restore_cdb(cdb), request_length, send_length, input_fd, output_fd, count, chunk_size)
+    finally:
+        if input_fd is not None and input_file != '<stdin>':
+            input_fd.close()
+        if output_fd is not None:
+            output_fd.close()
+
+def build_logs_command(page, allocation_length=396):
     from infi.asi.cdb.log_sense import LogSenseCommand
     if page is None:
         page = 0
@@ -311,8 +875,24 @@ def logs(device, page):
         page = int(page, 16)
     else:
         raise ValueError("invalid vpd page: %s" % page)
-    command = LogSenseCommand(page_code=page)
-    pr_out_command(command, device)
+    return LogSenseCommand(page_code=page, allocation_length=allocation_length)
+
+def read_logs(asi, page, device=None):
+    from .allocation import read_variable_length, log_sense_length
+    return read_variable_length(asi, ('logs', page),
+                                lambda allocation_length: build_logs_command(page, allocation_length),
+                                log_sense_length, 396, 0xffff, device)
+
+def logs(device, page, all_pages=False, state_directory=None):
+    if not all_pages:
+        with asi_context(device) as asi:
+            ActiveOutputContext.output_result(read_logs(asi, page))
+        return
+    from .logpages import SampleStore, sample_device
+    store = SampleStore(state_directory) if state_directory else None
+    with asi_context(device) as asi:
+        sample = sample_device(asi, device, store)
+    ActiveOutputContext.output_result(sample)
 
 def reset(device, target_reset, host_reset, lun_reset):
     from infi.os_info import get_platform_string
@@ -327,17 +907,36 @@ def reset(device, target_reset, host_reset, lun_reset):
     else:
         raise NotImplementedError("task management commands not supported on this platform")
 
+# Output formatters for specific commands, by class name so formatters are only imported once one is chosen
+RESULT_FORMATTERS = {'turs': 'TursOutputFormatter',
+                     'readcap': 'ReadcapOutputFormatter',
+                     'pr_readkeys': 'ReadkeysOutputFormatter',
+                     'pr_readreservation': 'ReadreservationOutputFormatter',
+                     'pr_audit': 'AuditOutputFormatter',
+                     'pr_bulk': 'BulkOutputFormatter',
+                     'luns': 'LunsOutputFormatter',
+                     'rtpg': 'RtpgOutputFormatter',
+                     'inq': 'InqOutputFormatter',
+                     'inventory': 'JsonOutputFormatter',
+                     'watch': 'WatchOutputFormatter',
+                     'raw': 'ScriptOutputFormatter',
+                     'paths': 'PathsOutputFormatter',
+                     'scan': 'ScanOutputFormatter',
+                     'benchmark': 'BenchmarkOutputFormatter'}
+
+def get_result_formatter(command):
+    from . import formatters
+    return getattr(formatters, RESULT_FORMATTERS.get(command, 'DefaultOutputFormatter'))()
+
 def set_formatters(arguments):
-    # Output formatters for specific commands
-    result_formatters = {'readcap': formatters.ReadcapOutputFormatter,
-                         'pr_readkeys': formatters.ReadkeysOutputFormatter,
-                         'pr_readreservation': formatters.ReadreservationOutputFormatter,
-                         'luns': formatters.LunsOutputFormatter,
-                         'rtpg': formatters.RtpgOutputFormatter,
-                         'inq': formatters.InqOutputFormatter}
-    for key, formatter_class in result_formatters.items():
+    from . import formatters
+    for key in RESULT_FORMATTERS:
         if arguments[key]:
-            ActiveOutputContext.set_result_formatter(formatter_class())
+            ActiveOutputContext.set_result_formatter(get_result_formatter(key))
+    if arguments['logs'] and arguments['--all']:
+        ActiveOutputContext.set_result_formatter(formatters.LogCountersOutputFormatter())
+    if arguments['decode']:
+        ActiveOutputContext.set_result_formatter(get_result_formatter(arguments['--type']))
     # Hex/raw/json modes override
     if arguments['--hex']:
         ActiveOutputContext.set_formatters(formatters.HexOutputFormatter())
@@ -345,48 +944,183 @@ def set_formatters(arguments):
         ActiveOutputContext.set_formatters(formatters.RawOutputFormatter())
     elif arguments['--json']:
         ActiveOutputContext.set_formatters(formatters.JsonOutputFormatter())
+    elif arguments['--ndjson']:
+        ActiveOutputContext.set_ndjson()
 
-@exception_handler
-def main(argv=sys.argv[1:]):
-    from infi.asi_utils.__version__ import __version__
-    arguments = docopt.docopt(__doc__, version=__version__)
+def set_instrumentation(arguments):
+    from . import instrumentation
+    if arguments['--stats']:
+        ActiveOutputContext.add_hook(instrumentation.SummarySink())
+    if arguments['--prometheus']:
+        ActiveOutputContext.add_hook(instrumentation.PrometheusSink(arguments['--prometheus']))
+    if arguments['--trace']:
+        ActiveOutputContext.add_hook(instrumentation.CsvSink(arguments['--trace']))
 
-    if arguments['--verbose']:
-        ActiveOutputContext.enable_verbose()
-    set_formatters(arguments)
+def set_cache(arguments):
+    global ActiveResponseCache
+    if arguments['--cache-dir']:
+        from .cache import ResponseCache
+        ActiveResponseCache = ResponseCache(arguments['--cache-dir'], arguments['--cache-ttl'])
+
+def set_path_selection(arguments):
+    global ActivePathSelection
+    ActivePathSelection = arguments['--path']
+
+def set_replay(arguments):
+    global ActiveRecorder, ActiveReplay
+    if arguments['--replay']:
+        from .replay import TraceReplay
+        ActiveReplay = TraceReplay(arguments['--replay'], arguments['--replay-delay'])
+    if arguments['--record']:
+        from .replay import TraceRecorder
+        ActiveRecorder = TraceRecorder(arguments['--record'])
 
+def close_recorder():
+    global ActiveRecorder
+    recorder, ActiveRecorder = ActiveRecorder, None
+    if recorder is not None:
+        recorder.close()
+
+_usage_grammar = None
+
+def get_usage_grammar():
+    """ Parses the usage docstring once per process. Unlike docopt.docopt(), repeating arguments are fixed
+    before the [options] shortcut is expanded, since only the explicit usage patterns can repeat """
+    global _usage_grammar
+    if _usage_grammar is None:
+        import docopt
+        options = docopt.parse_defaults(__doc__)
+        usage = docopt.printable_usage(__doc__)
+        pattern = docopt.parse_pattern(docopt.formal_usage(usage), options).fix()
+        pattern_options = set(pattern.flat(docopt.Option))
+        for any_options in pattern.flat(docopt.AnyOptions):
+            any_options.children = list(set(options) - pattern_options)
+        _usage_grammar = (usage, options, pattern)
+    return _usage_grammar
+
+def parse_arguments(argv, version=None, help=True):
+    """ Equivalent to docopt.docopt(__doc__, argv, help=help, version=version), reusing the parsed usage grammar """
+    import docopt
+    usage, options, pattern = get_usage_grammar()
+    docopt.DocoptExit.usage = usage
+    argv = docopt.parse_argv(docopt.TokenStream(argv, docopt.DocoptExit), list(options), False)
+    docopt.extras(help, version, argv, __doc__)
+    matched, left, collected = pattern.match(argv)
+    if matched and left == []:
+        return docopt.Dict((a.name, a.value) for a in (pattern.flat() + collected))
+    raise docopt.DocoptExit()
+
+def command_name(arguments):
+    """ Returns the subcommand docopt matched """
+    return next(key for key, value in sorted(arguments.items()) if value is True and key[0] not in '-<')
+
+def dispatch(arguments):
+    with ActiveOutputContext.scope(command=command_name(arguments)):
+        _dispatch(arguments)
+
+def _dispatch(arguments):
+    devices = arguments['<device>']
+    jobs = int(arguments['--jobs'])
     if arguments['turs']:
-        turs(arguments['<device>'], number=arguments['--number'])
+        run_on_devices(turs, devices, jobs, number=arguments['--number'],
+                       queue_depth=arguments['--queue-depth'])
     elif arguments['inq']:
-        inq(arguments['<device>'], page=arguments['--page'])
+        run_on_devices(inq, devices, jobs, page=arguments['--page'])
     elif arguments['luns']:
-        luns(arguments['<device>'], select_report=arguments['--select'])
+        run_on_devices(luns, devices, jobs, select_report=arguments['--select'])
     elif arguments['rtpg']:
-        rtpg(arguments['<device>'], extended=arguments['--extended'])
+        run_on_devices(rtpg, devices, jobs, extended=arguments['--extended'])
     elif arguments['readcap']:
-        readcap(arguments['<device>'], read_16=arguments['--long'])
+        run_on_devices(readcap, devices, jobs, read_16=arguments['--long'])
     elif arguments['pr_readkeys']:
-        pr_readkeys(arguments['<device>'])
+        run_on_devices(pr_readkeys, devices, jobs)
+    elif arguments['pr_audit']:
+        from .audit import audit
+        if audit(devices, jobs, keys=arguments['--keys'], holder=arguments['--holder'])['problems']:
+            raise SystemExit(1)
+    elif arguments['pr_bulk']:
+        from .bulk import bulk
+        report = bulk(devices, jobs, action=arguments['--action'], key=arguments['--key'],
+                      rollback=arguments['--rollback'], dry_run=arguments['--dry-run'])
+        if report['failed'] or report['rolled_back'] or report['rollback_failed'] or report['rollback_incomplete']:
+            raise SystemExit(1)
     elif arguments['pr_register']:
-        pr_register(arguments['<device>'], arguments['<key>'])
+        pr_register(devices[0], arguments['<key>'])
     elif arguments['pr_unregister']:
-        pr_unregister(arguments['<device>'], arguments['<key>'])
+        pr_unregister(devices[0], arguments['<key>'])
     elif arguments['pr_reserve']:
-        pr_reserve(arguments['<device>'], arguments['<key>'])
+        pr_reserve(devices[0], arguments['<key>'])
     elif arguments['pr_release']:
-        pr_release(arguments['<device>'], arguments['<key>'])
+        pr_release(devices[0], arguments['<key>'])
     elif arguments['reserve']:
-        reserve(arguments['<device>'], arguments['<third_party_device_id>'])
+        reserve(devices[0], arguments['<third_party_device_id>'])
     elif arguments['release']:
-        release(arguments['<device>'], arguments['<third_party_device_id>'])
+        release(devices[0], arguments['<third_party_device_id>'])
     elif arguments['pr_readreservation']:
-        pr_readreservation(arguments['<device>'])
+        run_on_devices(pr_readreservation, devices, jobs)
+    elif arguments['raw'] and arguments['--script']:
+        records = raw_script(devices[0], arguments['--script'], stop_on_check=arguments['--stop-on-check'])
+        if any(record['status'] != 'ok' for record in records):
+            raise SystemExit(1)
     elif arguments['raw']:
-        raw(arguments['<device>'], cdb=arguments['<cdb>'],
+        raw(devices[0], cdb=arguments['<cdb>'],
             request_length=arguments['--request'], output_file=arguments['--outfile'],
-            send_length=arguments['--send'], input_file=arguments['--infile'])
+            send_length=arguments['--send'], input_file=arguments['--infile'],
+            count=arguments['--count'], chunk_size=arguments['--chunk-size'])
     elif arguments['logs']:
-        logs(arguments['<device>'], page=arguments['--page'])
+        run_on_devices(logs, devices, jobs, page=arguments['--page'], all_pages=arguments['--all'],
+                       state_directory=arguments['--state-dir'])
+    elif arguments['inventory']:
+        run_on_devices(inventory, devices, jobs)
+    elif arguments['paths']:
+        from .paths import paths
+        paths(devices, jobs, samples=arguments['--samples'])
+    elif arguments['scan']:
+        from .scan import scan
+        report = scan(devices[0], workers=arguments['--workers'], stripes=arguments['--stripes'],
+                      transfer_blocks=arguments['--transfer-size'], queue_depth=arguments['--queue-depth'],
+                      read=arguments['--read'], checkpoint_path=arguments['--checkpoint'])
+        if report['errors']:
+            raise SystemExit(1)
+    elif arguments['watch']:
+        from .watch import watch
+        watch(devices, jobs, interval=arguments['--interval'], checks=arguments['--checks'],
+              rounds=arguments['--rounds'])
+    elif arguments['decode']:
+        from .decode import decode
+        if decode(arguments['<capture>'], arguments['--type'], processes=arguments['--processes'],
+                  page=arguments['--page'], select_report=arguments['--select'], extended=arguments['--extended'],
+                  read_16=arguments['--long']):
+            raise SystemExit(1)
+    elif arguments['benchmark']:
+        from .benchmark import benchmark
+        benchmark(iterations=arguments['--iterations'], latency=arguments['--latency'], suite=arguments['--suite'])
+    elif arguments['batch']:
+        from .batch import batch
+        batch(socket_path=arguments['--socket'])
     elif arguments['reset']:
-        reset(arguments['<device>'], target_reset=arguments['--target'],
+        reset(devices[0], target_reset=arguments['--target'],
               host_reset=arguments['--host'], lun_reset=arguments['--device'])
+
+@exception_handler
+def main(argv=sys.argv[1:]):
+    from infi.asi_utils.__version__ import __version__
+    if '--version' in argv or '-V' in argv:
+        # answer before loading the usage grammar, as docopt would
+        print(__version__)
+        return
+    arguments = parse_arguments(argv, version=__version__)
+
+    if arguments['--verbose']:
+        ActiveOutputContext.enable_verbose()
+    set_formatters(arguments)
+    set_cache(arguments)
+    set_path_selection(arguments)
+    set_replay(arguments)
+    set_instrumentation(arguments)
+    try:
+        dispatch(arguments)
+    finally:
+        ActiveOutputContext.flush()
+        ActiveOutputContext.close_hooks()
+        close_recorder()
@@ -0,0 +1,124 @@
+"""asyncio interface to the asi-utils commands
+
+    async with AsyncDevice('/dev/sg1') as device:
+        standard, serial = await asyncio.gather(device.inq(), device.inq('0x80'))
+
+infi.asi executers block inside their coroutines, so every command is stepped to completion on an
+executor thread. Each device keeps a single open executer and runs its commands one at a time, while
+commands to different devices are in flight together, bounded by the executor's number of workers.
+Results are returned as parsed objects and nothing is printed.
+"""
+
+import asyncio
+from infi.asi_utils import open_executer, build_inq_command, build_readcap_command
+from infi.asi_utils import read_luns, read_rtpg, read_logs, read_pr_in, RawCommand
+
+
+def _execute(executer, command):
+    from infi.asi.coroutines.sync_adapter import sync_wait
+    return sync_wait(command.execute(executer))
+
+
+def _page_string(page):
+    return hex(page) if isinstance(page, int) else page
+
+
+class AsyncDevice(object):
+    def __init__(self, device, executor=None):
+        super(AsyncDevice, self).__init__()
+        self.device = device
+        self._executor = executor
+        self._context = None
+        self._executer = None
+        self._lock = None
+
+    def _get_lock(self):
+        # created on first use, inside the running loop, and never replaced
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _open(self):
+        """ Opens the executer unless it is open, with the lock held """
+        if self._context is not None:
+            return
+        context = open_executer(self.device)
+        self._executer = await self._run(context.__enter__)
+        self._context = context
+
+    async def open(self):
+        async with self._get_lock():
+            await self._open()
+
+    async def close(self):
+        async with self._get_lock():
+            if self._context is None:
+                return
+            context, self._context, self._executer = self._context, None, None
+            await self._run(context.__exit__, None, None, None)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def execute(self, command):
+        """ Sends any infi.asi command object (or a RawCommand) and returns its parsed result """
+        async with self._get_lock():
+            await self._open()
+            return await self._run(_execute, self._executer, command)
+
+    async def _read(self, reader, *args):
+        """ Runs one of the read_* helpers, which repeat a command until its response fits """
+        async with self._get_lock():
+            await self._open()
+            return await self._run(reader, self._executer, *args)
+
+    async def tur(self):
+        from infi.asi.cdb.tur import TestUnitReadyCommand
+        return await self.execute(TestUnitReadyCommand())
+
+    async def inq(self, page=None):
+        return await self.execute(build_inq_command(_page_string(page)))
+
+    async def readcap(self, read_16=False):
+        return await self.execute(build_readcap_command(read_16))
+
+    async def luns(self, select_report=0):
+        return await self._read(read_luns, select_report, self.device)
+
+    async def rtpg(self, extended=False):
+        return await self._read(read_rtpg, extended, self.device)
+
+    async def logs(self, page=None):
+        return await self._read(read_logs, _page_string(page), self.device)
+
+    async def pr_in(self, service_action):
+        return await self._read(read_pr_in, service_action, self.device)
+
+    async def pr_readkeys(self):
+        from infi.asi.cdb.persist.input import PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES
+        return await self.pr_in(PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES.READ_KEYS)
+
+    async def pr_readreservation(self):
+        from infi.asi.cdb.persist.input import PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES
+        return await self.pr_in(PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES.READ_RESERVATION)
+
+    async def raw(self, cdb, request_length=0, data=None):
+        """ Sends a raw CDB (bytes), returning up to request_length bytes of data-in """
+        return await self.execute(RawCommand(cdb, request_length, data))
+
+
+async def gather(devices, func, executor=None):
+    """ Opens every device and awaits func(async_device) on all of them together,
+    returning a {device: result or exception} dict """
+    async def _run(device):
+        async with AsyncDevice(device, executor) as async_device:
+            return await func(async_device)
+    results = await asyncio.gather(*[_run(device) for device in devices], return_exceptions=True)
+    return dict(zip(devices, results))
@@ -0,0 +1,103 @@
+"""reading variable-length responses (PERSISTENT RESERVE IN, REPORT LUNS, RTPG, LOG SENSE) without truncation
+
+The length a response needs is read from its header. It is remembered per device and command for the life of the
+process, and with --cache-dir in the response cache, so the next read of the same data (in this process or a later
+one) starts with an allocation length large enough for it and takes a single round-trip. A response that did not fit
+is read again with the length it needs.
+"""
+
+import json
+import struct
+import threading
+
+_required_lengths = {}
+_lock = threading.Lock()
+
+
+def pr_in_length(data):
+    return struct.unpack('>I', bytes(data[4:8]))[0] + 8
+
+
+def report_luns_length(data):
+    return struct.unpack('>I', bytes(data[0:4]))[0] + 8
+
+
+def rtpg_length(data, extended=False):
+    return struct.unpack('>I', bytes(data[0:4]))[0] + (8 if extended else 4)
+
+
+def log_sense_length(data):
+    return struct.unpack('>H', bytes(data[2:4]))[0] + 4
+
+
+def _cache_name(key):
+    return 'allocation_length:%s' % json.dumps(key)
+
+
+def remembered_length(device, key, default):
+    from . import ActiveResponseCache
+    with _lock:
+        if (device, key) in _required_lengths:
+            return _required_lengths[(device, key)]
+    length = None
+    if ActiveResponseCache is not None and device is not None:
+        length = ActiveResponseCache.get_length(device, _cache_name(key))
+    if length is None:
+        return default
+    with _lock:
+        return _required_lengths.setdefault((device, key), length)
+
+
+def remember_length(device, key, length):
+    from . import ActiveResponseCache
+    with _lock:
+        changed = _required_lengths.get((device, key)) != length
+        _required_lengths[(device, key)] = length
+    if changed and ActiveResponseCache is not None and device is not None:
+        ActiveResponseCache.set_length(device, _cache_name(key), length)
+
+
+def forget_lengths():
+    with _lock:
+        _required_lengths.clear()
+
+
+class ResponseRecorder(object):
+    """ Wraps an executer, keeping the data of the last response it returned """
+    def __init__(self, executer):
+        super(ResponseRecorder, self).__init__()
+        self._executer = executer
+        self.data = None
+
+    def __getattr__(self, name):
+        return getattr(self._executer, name)
+
+    def call(self, command):
+        self.data = yield self._executer.call(command)
+        yield self.data
+
+
+def read_variable_length(asi, key, build, required_length, default_length, max_length, device=None):
+    """ Executes build(allocation_length) on asi, reading it again with a larger allocation length for as long
+    as required_length(response data) says the response did not fit. key identifies the data read, and device
+    defaults to the device of the current thread's output """
+    from . import ActiveOutputContext, sync_wait
+    if device is None:
+        device = ActiveOutputContext.fields().get('device')
+    recorder = ResponseRecorder(asi)
+    allocation_length = remembered_length(device, key, default_length)
+    while True:
+        recorder.data = None
+        try:
+            result = sync_wait(recorder, build(allocation_length), supresss_output=True)
+        except Exception:
+            # a truncated response may fail to parse, in which case its header still tells how much is needed
+            if not recorder.data or len(recorder.data) < 8 or allocation_length >= max_length or \
+                    required_length(recorder.data) <= allocation_length:
+                raise
+            result = None
+        required = required_length(recorder.data) if recorder.data and len(recorder.data) >= 8 else 0
+        remember_length(device, key, min(max(required, default_length), max_length))
+        if required <= allocation_length or allocation_length >= max_length:
+            return result
+        allocation_length = min(required, max_length)
@@ -0,0 +1,99 @@
+"""asi-utils pr_audit: checking the persistent reservations of many LUNs against the expected ones
+
+Every device is read with PERSISTENT RESERVE IN (READ KEYS and READ RESERVATION) from a pool of --jobs threads,
+and a single report lists the devices whose registrations or reservation differ from the expected ones:
+    missing keys        expected keys that are not registered
+    unexpected keys     registered keys that were not expected
+    unexpected holder   a reservation held by a key other than --holder (or by any key that was not expected)
+    no reservation      no reservation is held although --holder was given
+    generation drift    the PR generation changed between the two reads, i.e. registrations changed mid-audit
+"""
+
+from collections import OrderedDict
+
+
+def parse_keys(keys):
+    """ Parses a comma-separated list of reservation keys """
+    from . import parse_key
+    return [parse_key(key.strip()) for key in (keys or '').split(',') if key.strip()]
+
+
+def _hex_keys(keys):
+    return [hex(key).rstrip('L') for key in keys]
+
+
+def compare(keys, holder, generations, expected_keys, expected_holder=None):
+    """ Returns the problems found in a device's registered keys, reservation holder (None if none is held)
+    and the PR generations its two reads returned """
+    problems = []
+    missing = [key for key in expected_keys if key not in keys]
+    unexpected = [key for key in keys if key not in expected_keys]
+    if missing:
+        problems.append('missing keys: %s' % ','.join(_hex_keys(missing)))
+    if unexpected:
+        problems.append('unexpected keys: %s' % ','.join(_hex_keys(sorted(set(unexpected)))))
+    if holder is None:
+        if expected_holder is not None:
+            problems.append('no reservation')
+    elif (holder != expected_holder) if expected_holder is not None else (holder not in expected_keys):
+        problems.append('unexpected holder: %s' % _hex_keys([holder])[0])
+    if len(set(generations)) > 1:
+        problems.append('generation drift: %s' % ' -> '.join(str(generation) for generation in generations))
+    return problems
+
+
+def audit_device(device, expected_keys, expected_holder=None):
+    from infi.asi.cdb.persist.input import PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES as codes
+    from infi.asi.errors import AsiCheckConditionError, AsiOSError, AsiSCSIError
+    from . import asi_context, read_pr_in
+    record = OrderedDict([('device', device), ('generation', None), ('keys', None), ('holder', None),
+                          ('problems', [])])
+    try:
+        with asi_context(device) as asi:
+            keys = read_pr_in(asi, codes.READ_KEYS)
+            reservation = read_pr_in(asi, codes.READ_RESERVATION)
+    except AsiCheckConditionError as error:
+        record['problems'].append('error: %s' % error.sense_obj.sense_key)
+        return record
+    except (ValueError, NotImplementedError, AsiOSError, AsiSCSIError) as error:
+        record['problems'].append('error: %s' % error)
+        return record
+    key_list = keys.key_list or []
+    holder = reservation.reservation_key if reservation.additional_length else None
+    record['generation'] = reservation.pr_generation
+    record['keys'] = _hex_keys(key_list)
+    record['holder'] = None if holder is None else _hex_keys([holder])[0]
+    record['problems'] = compare(key_list, holder, [keys.pr_generation, reservation.pr_generation],
+                                 expected_keys, expected_holder)
+    return record
+
+
+def audit(devices, jobs, keys, holder=None):
+    """ Audits every device, outputting and returning a report of the devices that failed the audit """
+    from . import ActiveOutputContext, parallel
+    from .stats import timer
+    devices = parallel.expand_devices(devices)
+    if not devices:
+        raise ValueError("no devices matched")
+    expected_keys = parse_keys(keys)
+    expected_holder = parse_keys(holder)[0] if holder else None
+    fields = ActiveOutputContext.fields()
+
+    def run(device):
+        with ActiveOutputContext.scope(**dict(fields, device=device)):
+            return audit_device(device, expected_keys, expected_holder)
+    start = timer()
+    records = [record for _, record in parallel.imap_unordered(run, devices, jobs)]
+    elapsed = timer() - start
+    failed = [record for record in records if record['problems']]
+    errors = sum(1 for record in failed if record['generation'] is None)
+    report = OrderedDict([('devices', len(records)),
+                          ('ok', len(records) - len(failed)),
+                          ('mismatched', len(failed) - errors),
+                          ('failed', errors),
+                          ('elapsed', elapsed),
+                          ('expected_keys', _hex_keys(expected_keys)),
+                          ('expected_holder', None if expected_holder is None else _hex_keys([expected_holder])[0]),
+                          ('problems', sorted(failed, key=lambda record: record['device']))])
+    ActiveOutputContext.output_result(report)
+    return report
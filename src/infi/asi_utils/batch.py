@@ -0,0 +1,136 @@
+"""asi-utils batch: a long-lived loop that executes newline-delimited JSON requests
+
+Each request line is either a JSON object of the form
+    {"id": 1, "command": "inq", "device": "/dev/sg1", "options": {"page": "0x83"}}
+or {"id": 1, "argv": ["inq", "/dev/sg1", "--page=0x83"]}, and is answered by a single line
+    {"id": 1, "status": "ok", "results": [...], "errors": [...]}
+Devices are opened on first use and kept open for the following requests. The output options (--json, --hex and
+--raw) apply to the results of their own request; the options that set up the whole process (caching, path selection,
+recording, replay, instrumentation) are rejected, as they cannot change once devices are open. Requests are served one
+at a time, so the subcommands that run for long (scan, benchmark, and watch without --rounds) are rejected too.
+"""
+
+from __future__ import print_function
+import json
+import sys
+
+UNSUPPORTED_OPTIONS = ('--cache-dir', '--path', '--record', '--replay', '--stats', '--prometheus', '--trace',
+                       '--ndjson', '--verbose')
+UNSUPPORTED_COMMANDS = ('batch', 'scan', 'benchmark')
+
+
+def request_to_argv(request):
+    if 'argv' in request:
+        return [str(arg) for arg in request['argv']]
+    argv = [request['command']]
+    devices = request.get('devices', [request['device']] if 'device' in request else [])
+    argv.extend(devices)
+    argv.extend(request.get('args', []))
+    for name, value in sorted(request.get('options', {}).items()):
+        option = name if name.startswith('-') else '--' + name.replace('_', '-')
+        if value is True:
+            argv.append(option)
+        elif value not in (None, False):
+            argv.append('%s=%s' % (option, value))
+    return argv
+
+
+def check_options(arguments):
+    for command in UNSUPPORTED_COMMANDS:
+        if arguments[command]:
+            raise ValueError("%s is unsupported in batch requests" % command)
+    if arguments['watch'] and not int(arguments['--rounds']):
+        raise ValueError("watch is unsupported in batch requests without --rounds")
+    for option in UNSUPPORTED_OPTIONS:
+        if arguments[option]:
+            raise ValueError("%s is unsupported in batch requests" % option)
+
+
+def handle_request(request):
+    from infi.asi.errors import AsiCheckConditionError
+    from docopt import DocoptExit
+    from . import ActiveOutputContext, parse_arguments, dispatch, set_formatters
+    response = dict(id=request.get('id'), status='ok', results=[], errors=[])
+    with ActiveOutputContext.capture() as captured, ActiveOutputContext.formatters():
+        try:
+            # --help would print the usage to stdout, in the middle of the responses
+            arguments = parse_arguments(request_to_argv(request), help=False)
+            check_options(arguments)
+            if arguments['--json'] or arguments['--hex'] or arguments['--raw']:
+                set_formatters(arguments)
+            dispatch(arguments)
+        except AsiCheckConditionError as error:
+            ActiveOutputContext.output_error(error.sense_obj, file=sys.stderr)
+        except DocoptExit:
+            ActiveOutputContext._print("invalid request", file=sys.stderr)
+            captured.failed = True
+        except SystemExit:
+            captured.failed = True
+        except (KeyError, TypeError) as error:
+            ActiveOutputContext._print("invalid request: %s" % error, file=sys.stderr)
+            captured.failed = True
+        except Exception as error:
+            ActiveOutputContext._print(str(error) or type(error).__name__, file=sys.stderr)
+            captured.failed = True
+    for string, file in captured.lines:
+        response['errors' if file is sys.stderr else 'results'].append(string)
+    if captured.failed:
+        response['status'] = 'error'
+    return response
+
+
+def handle_line(line):
+    try:
+        request = json.loads(line)
+    except ValueError as error:
+        return dict(id=None, status='error', results=[], errors=["invalid json: %s" % error])
+    if not isinstance(request, dict):
+        return dict(id=None, status='error', results=[], errors=["request must be a json object"])
+    return handle_request(request)
+
+
+def serve_stream(input_file, output_file):
+    for line in iter(input_file.readline, ''):
+        if not line.strip():
+            continue
+        output_file.write(json.dumps(handle_line(line), default=str) + '\n')
+        output_file.flush()
+
+
+def serve_socket(socket_path):
+    import os
+    import socket
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(socket_path)
+        server.listen(1)
+        while True:
+            connection, _ = server.accept()
+            try:
+                serve_stream(connection.makefile('r'), connection.makefile('w'))
+            except (IOError, OSError):
+                pass    # client went away
+            finally:
+                connection.close()
+    finally:
+        server.close()
+        os.unlink(socket_path)
+
+
+def batch(socket_path=None):
+    import infi.asi_utils
+    from .formatters import DictOutputFormatter
+    infi.asi_utils.ActiveOutputContext.set_formatters(DictOutputFormatter())
+    infi.asi_utils.ActiveExecuterPool = pool = infi.asi_utils.ExecuterPool()
+    try:
+        if socket_path:
+            serve_socket(socket_path)
+        else:
+            serve_stream(sys.stdin, sys.stdout)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        infi.asi_utils.ActiveExecuterPool = None
+        pool.close()
@@ -0,0 +1,221 @@
+"""throughput benchmarks, runnable without hardware so regressions can be caught in CI
+
+The "commands" suite builds, executes, parses and formats the same command as each subcommand does against the
+simulated target, and reports commands/sec together with the average time spent in each stage.
+The "hex" suite reports the throughput of rendering large payloads as --hex does, the "text" suite compares
+the default output's rendering of parsed responses with the json round-trip it used to make, and the "tables"
+suite compares parsing and printing large REPORT LUNS responses as LunTables with doing so through infi.instruct.
+"""
+
+from __future__ import print_function
+from collections import OrderedDict
+
+HEX_BENCHMARK_SIZES = (1 << 20, 64 << 20)
+TABLES_BENCHMARK_LUNS = (256, 4096, 16384)
+
+
+def _benchmarks():
+    from infi.asi.cdb.tur import TestUnitReadyCommand
+    from infi.asi.cdb.persist.input import PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES as codes
+    from . import (build_inq_command, build_readcap_command, build_luns_command, build_rtpg_command,
+                   build_logs_command, build_pr_in_command)
+    # the standard inquiry subcommand attaches the serial number it read from page 0x80
+    serial_number = {'product_serial_number': None}
+    return [('turs', 'turs', TestUnitReadyCommand, None),
+            ('inq', 'inq', lambda: build_inq_command(None), serial_number),
+            ('inq --page=0x00', 'inq', lambda: build_inq_command('0x00'), None),
+            ('inq --page=0x80', 'inq', lambda: build_inq_command('0x80'), None),
+            ('inq --page=0x83', 'inq', lambda: build_inq_command('0x83'), None),
+            ('readcap', 'readcap', lambda: build_readcap_command(False), None),
+            ('readcap --long', 'readcap', lambda: build_readcap_command(True), None),
+            ('luns', 'luns', lambda: build_luns_command(0), None),
+            ('rtpg', 'rtpg', lambda: build_rtpg_command(False), None),
+            ('logs', 'logs', lambda: build_logs_command(None), None),
+            ('pr_readkeys', 'pr_readkeys', lambda: build_pr_in_command(codes.READ_KEYS), None),
+            ('pr_readreservation', 'pr_readreservation', lambda: build_pr_in_command(codes.READ_RESERVATION), None)]
+
+
+def run_benchmark(build, formatter, executer, iterations, additional_data=None):
+    from infi.asi.coroutines.sync_adapter import sync_wait
+    from .stats import timer
+    build_time = execute_time = parse_time = format_time = 0.0
+    start = timer()
+    for _ in range(iterations):
+        before_build = timer()
+        command = build()
+        before_execute = timer()
+        executer.elapsed = 0.0
+        result = sync_wait(command.execute(executer))
+        before_format = timer()
+        for key, value in (additional_data or {}).items():
+            setattr(result, key, value)
+        formatter.format(result)
+        after_format = timer()
+        build_time += before_execute - before_build
+        execute_time += executer.elapsed
+        parse_time += before_format - before_execute - executer.elapsed
+        format_time += after_format - before_format
+    elapsed = timer() - start
+    to_us = 1e6 / iterations
+    return [('commands_per_second', iterations / elapsed if elapsed else 0.0),
+            ('build_us', build_time * to_us),
+            ('execute_us', execute_time * to_us),
+            ('parse_us', parse_time * to_us),
+            ('format_us', format_time * to_us)]
+
+
+def commands_suite(iterations, latency):
+    from . import get_result_formatter
+    from .simulator import SimulatedExecuter, get_target
+    from .stats import TimingExecuter
+    executer = TimingExecuter(SimulatedExecuter(get_target('benchmark'), latency))
+    for name, subcommand, build, additional_data in _benchmarks():
+        formatter = get_result_formatter(subcommand)
+        yield OrderedDict([('command', name)] + run_benchmark(build, formatter, executer, iterations, additional_data))
+
+
+def hex_suite(iterations, latency):
+    """ Renders payloads of HEX_BENCHMARK_SIZES through --hex, each once """
+    import os
+    from .formatters import HexOutputFormatter
+    from .stats import timer
+    for size in HEX_BENCHMARK_SIZES:
+        data = os.urandom(size)
+        start = timer()
+        for _ in HexOutputFormatter().iter_format(data):
+            pass
+        elapsed = timer() - start
+        yield OrderedDict([('payload', '%d MiB' % (size >> 20)),
+                           ('milliseconds', elapsed * 1000),
+                           ('mib_per_second', (size / float(1 << 20)) / elapsed if elapsed else 0.0)])
+
+
+def _reflective_to_dict(item):
+    """ The default output's conversion as it was before per-class plans, as a baseline """
+    import binascii
+    from array import array
+    from infi.instruct.struct import Struct, FieldListContainer, AnonymousField
+    from infi.instruct.buffer import Buffer
+    if isinstance(item, Buffer):
+        return dict((field.attr_name(), _reflective_to_dict(getattr(item, field.attr_name())))
+                    for field in item._all_fields())
+    if isinstance(item, Struct):
+        ret = {}
+        for field in item._container_.fields:
+            if hasattr(field, 'name'):
+                ret[field.name] = _reflective_to_dict(field.get_value(item))
+            elif isinstance(field, FieldListContainer):
+                for inner_field in field.fields:
+                    if not isinstance(inner_field, AnonymousField):
+                        ret[inner_field.name] = _reflective_to_dict(inner_field.get_value(item))
+        return ret
+    if isinstance(item, bytearray) or (bytes is not str and isinstance(item, bytes)):
+        return '0x' + binascii.hexlify(item).decode() if item else ''
+    if hasattr(item, '_asdict'):
+        return dict((name, _reflective_to_dict(value)) for name, value in item._asdict().items())
+    if isinstance(item, (list, array)):
+        return [_reflective_to_dict(x) for x in item]
+    return item
+
+
+def _reflective_default_text(item):
+    from json import dumps
+    return dumps(_reflective_to_dict(item), indent=4, sort_keys=True).replace('"', '').replace(',', '')
+
+
+def text_suite(iterations, latency):
+    """ Renders parsed responses as the default (text) output does, and as it did before per-class plans """
+    from infi.asi.coroutines.sync_adapter import sync_wait
+    from .formatters import DefaultOutputFormatter
+    from .simulator import SimulatedExecuter, get_target
+    from .stats import timer
+    executer = SimulatedExecuter(get_target('benchmark'), latency)
+    formatter = DefaultOutputFormatter()
+    for name, subcommand, build, additional_data in _benchmarks():
+        result = sync_wait(build().execute(executer))
+        if result is None:
+            continue
+        timings = []
+        for render in (_reflective_default_text, formatter.format):
+            start = timer()
+            for _ in range(iterations):
+                render(result)
+            timings.append((timer() - start) * 1e6 / iterations)
+        yield OrderedDict([('command', name),
+                           ('reflective_us', timings[0]),
+                           ('planned_us', timings[1]),
+                           ('speedup', timings[0] / timings[1] if timings[1] else 0.0)])
+
+
+def _report_luns_response(luns):
+    import struct
+    lun_list = b''.join(struct.pack('>HHI', lun, 0, 0) for lun in range(luns))
+    return struct.pack('>II', len(lun_list), 0) + lun_list
+
+
+def _instruct_luns(data):
+    """ Parses and prints a REPORT LUNS response as luns did before LunTables, as a baseline """
+    from infi.asi.cdb.report_luns import ReportLunsData
+    from .formatters import DefaultOutputFormatter
+    result = ReportLunsData.create_from_string(data)
+    result.normalize_lun_list()
+    return '\n'.join([str(lun) for lun in DefaultOutputFormatter()._to_dict(result)['lun_list']])
+
+
+def _compact_luns(data):
+    from .formatters import LunsOutputFormatter
+    from .tables import LunTable
+    return '\n'.join(LunsOutputFormatter().iter_format(LunTable.from_bytes(data)))
+
+
+def _measure(func, data, iterations):
+    """ Returns the average microseconds of func(data), and the peak KiB it allocated (None without
+    tracemalloc) """
+    from .stats import timer
+    start = timer()
+    for _ in range(iterations):
+        func(data)
+    elapsed = (timer() - start) * 1e6 / iterations
+    try:
+        import tracemalloc
+    except ImportError:
+        return elapsed, None
+    tracemalloc.start()
+    try:
+        func(data)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak / 1024.0
+
+
+def tables_suite(iterations, latency):
+    """ Parses and prints REPORT LUNS responses of TABLES_BENCHMARK_LUNS LUNs through infi.instruct and as
+    LunTables, reporting the time and peak memory of each """
+    iterations = max(1, iterations // 100)
+    for luns in TABLES_BENCHMARK_LUNS:
+        data = _report_luns_response(luns)
+        assert _instruct_luns(data) == _compact_luns(data)
+        instruct_us, instruct_kib = _measure(_instruct_luns, data, iterations)
+        compact_us, compact_kib = _measure(_compact_luns, data, iterations)
+        yield OrderedDict([('luns', luns),
+                           ('instruct_us', instruct_us),
+                           ('compact_us', compact_us),
+                           ('speedup', instruct_us / compact_us if compact_us else 0.0),
+                           ('instruct_kib', instruct_kib),
+                           ('compact_kib', compact_kib)])
+
+
+SUITES = {'commands': commands_suite, 'hex': hex_suite, 'text': text_suite, 'tables': tables_suite}
+
+
+def benchmark(iterations, latency, suite='commands'):
+    from . import ActiveOutputContext
+    iterations, latency = int(iterations), float(latency)
+    if iterations <= 0:
+        raise ValueError("invalid number of iterations: %s" % iterations)
+    if suite not in SUITES:
+        raise ValueError("unknown benchmark suite: %s (expected one of %s)" % (suite, ', '.join(sorted(SUITES))))
+    rows = list(SUITES[suite](iterations, latency))
+    ActiveOutputContext.output_result(rows)
+    return rows
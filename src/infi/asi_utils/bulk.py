@@ -0,0 +1,134 @@
+"""asi-utils pr_bulk: applying one persistent reservation action to many devices at once
+
+The action (register, unregister, reserve or release) is sent to every device from a pool of --jobs threads, so a
+failover takes about one round-trip however many LUNs it moves. The outcome of every device is reported.
+With --rollback, each device's registered keys (or reservation) are first read, to tell whether the action changes
+them, and a failure on any device undoes the action on the devices it changed, by sending them the opposite action
+(unregister for register, release for reserve, and so on); devices where the key was already registered (or held the
+reservation) before the run are left as they were. A key unregistered from a device loses the reservation it held
+there, so rolling back unregister also reserves the device again with the type of that reservation; a device where
+this fails is reported as rollback incomplete.
+With --dry-run nothing is changed: the registered keys of every device are read instead, which checks that each
+device is reachable and shows the round-trip a real run would take.
+"""
+
+from collections import OrderedDict
+
+ROLLBACK_ACTIONS = {'register': 'unregister',
+                    'unregister': 'register',
+                    'reserve': 'release',
+                    'release': 'reserve'}
+
+
+def held_reservation(asi, key):
+    """ Returns the type of the reservation key holds, or None """
+    from infi.asi.cdb.persist.input import PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES as codes
+    from . import read_pr_in
+    reservation = read_pr_in(asi, codes.READ_RESERVATION)
+    if reservation.additional_length and reservation.reservation_key == key:
+        return reservation.pr_type
+    return None
+
+
+def key_state(asi, action, key):
+    """ Returns whether key is registered (for register and unregister) or holds the reservation (for reserve
+    and release) """
+    from infi.asi.cdb.persist.input import PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES as codes
+    from . import read_pr_in
+    if action in ('register', 'unregister'):
+        return key in (read_pr_in(asi, codes.READ_KEYS).key_list or [])
+    return held_reservation(asi, key) is not None
+
+
+def apply_action(device, action, key, dry_run=False, rollback=False, pr_type=1):
+    """ Sends the action to device, returning a record of its outcome. With rollback, the state the action changes
+    is read first; only the action itself is timed """
+    from infi.asi.cdb.persist.input import PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES as codes
+    from infi.asi.errors import AsiCheckConditionError, AsiReservationConflictError, AsiOSError, AsiSCSIError
+    from . import asi_context, build_pr_out_command, read_pr_in, sync_wait
+    from .stats import timer
+    record = OrderedDict([('device', device), ('action', action), ('status', 'ok'), ('latency', None),
+                          ('error', None)])
+    start = None
+    try:
+        with asi_context(device) as asi:
+            if dry_run:
+                start = timer()
+                keys = read_pr_in(asi, codes.READ_KEYS)
+                record['status'] = 'dry run'
+                record['registered'] = key in (keys.key_list or [])
+            else:
+                if rollback:
+                    record['changed'] = key_state(asi, action, key) != (action in ('register', 'reserve'))
+                    if action == 'unregister':
+                        record['reservation_type'] = held_reservation(asi, key)
+                start = timer()
+                sync_wait(asi, build_pr_out_command(action, key, pr_type), supresss_output=True)
+    except AsiCheckConditionError as error:
+        record['status'], record['error'] = 'failed', str(error.sense_obj.sense_key)
+    except AsiReservationConflictError:
+        record['status'], record['error'] = 'failed', 'reservation conflict'
+    except (ValueError, NotImplementedError, AsiOSError, AsiSCSIError) as error:
+        record['status'], record['error'] = 'failed', str(error) or type(error).__name__
+    if start is not None:
+        record['latency'] = timer() - start
+    return record
+
+
+def _apply(devices, jobs, action, key, dry_run=False, rollback=False, pr_type=1):
+    from . import ActiveOutputContext, parallel
+    fields = ActiveOutputContext.fields()
+
+    def run(device):
+        with ActiveOutputContext.scope(**dict(fields, device=device)):
+            return apply_action(device, action, key, dry_run, rollback, pr_type)
+    return dict(parallel.imap_unordered(run, devices, jobs))
+
+
+def _roll_back(records, devices, jobs, action, key):
+    """ Undoes the action on the devices it changed """
+    changed = [device for device in devices if records[device]['status'] == 'ok' and records[device]['changed']]
+    for device, record in _apply(changed, jobs, ROLLBACK_ACTIONS[action], key).items():
+        records[device]['status'] = 'rolled back' if record['status'] == 'ok' else 'rollback failed'
+        records[device]['error'] = record['error']
+    held = [device for device in changed
+            if records[device]['status'] == 'rolled back' and records[device].get('reservation_type') is not None]
+    for pr_type in sorted(set(records[device]['reservation_type'] for device in held)):
+        typed = [device for device in held if records[device]['reservation_type'] == pr_type]
+        for device, record in _apply(typed, jobs, 'reserve', key, pr_type=pr_type).items():
+            if record['status'] != 'ok':
+                records[device]['status'] = 'rollback incomplete'
+                records[device]['error'] = 'reservation not restored: %s' % record['error']
+
+
+def bulk(devices, jobs, action, key, rollback=False, dry_run=False):
+    """ Applies action to every device, outputting and returning a report of the outcome on each """
+    from . import ActiveOutputContext, parallel, parse_key
+    from .stats import timer
+    if action not in ROLLBACK_ACTIONS:
+        raise ValueError("invalid action: %s (expected %s)" % (action, ', '.join(sorted(ROLLBACK_ACTIONS))))
+    devices = parallel.expand_devices(devices)
+    if not devices:
+        raise ValueError("no devices matched")
+    key = parse_key(key)
+    start = timer()
+    rollback = rollback and not dry_run
+    records = _apply(devices, jobs, action, key, dry_run, rollback)
+    if rollback and any(records[device]['status'] == 'failed' for device in devices):
+        _roll_back(records, devices, jobs, action, key)
+    elapsed = timer() - start
+    statuses = [records[device]['status'] for device in devices]
+    report = OrderedDict([('action', action),
+                          ('key', hex(key).rstrip('L')),
+                          ('dry_run', dry_run),
+                          ('devices', len(devices)),
+                          ('elapsed', elapsed)])
+    report.update((name, statuses.count(status)) for name, status in (('ok', 'ok'),
+                                                                      ('failed', 'failed'),
+                                                                      ('rolled_back', 'rolled back'),
+                                                                      ('rollback_failed', 'rollback failed'),
+                                                                      ('rollback_incomplete', 'rollback incomplete'),
+                                                                      ('reachable', 'dry run')))
+    report['results'] = [records[device] for device in devices]
+    ActiveOutputContext.output_result(report)
+    return report
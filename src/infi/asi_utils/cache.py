@@ -0,0 +1,131 @@
+"""on-disk cache of static device identity responses (INQUIRY, VPD pages, READ CAPACITY)
+
+Responses are stored per device path, keyed by the CDB that produced them, and expire after a TTL.
+A device's entries are dropped when it reports a UNIT ATTENTION (e.g. capacity or inquiry data changed),
+or when a fresh device identification page (which carries the WWN) differs from the cached one,
+meaning the path now leads to a different logical unit. The allocation lengths learned for variable-length responses
+(see allocation.py) are kept with the device's entries, and do not expire.
+"""
+
+import binascii
+import json
+import os
+import threading
+import time
+
+INQUIRY = 0x12
+READ_CAPACITY_10 = 0x25
+SERVICE_ACTION_IN_16 = 0x9e
+READ_CAPACITY_16_SERVICE_ACTION = 0x10
+DEVICE_IDENTIFICATION_PAGE = 0x83
+
+
+def cache_key(command):
+    """ Returns the cache key of a SCSI read command, or None if its response should not be cached """
+    from infi.asi import SCSIReadCommand
+    if not isinstance(command, SCSIReadCommand) or not command.max_response_length:
+        return None
+    cdb = bytearray(command.command)
+    if not cdb:
+        return None
+    if cdb[0] in (INQUIRY, READ_CAPACITY_10) or \
+            (cdb[0] == SERVICE_ACTION_IN_16 and cdb[1] & 0x1f == READ_CAPACITY_16_SERVICE_ACTION):
+        return binascii.hexlify(bytes(cdb)).decode()
+    return None
+
+
+def is_identification_key(key):
+    cdb = bytearray(binascii.unhexlify(key))
+    return cdb[0] == INQUIRY and cdb[1] & 0x01 and cdb[2] == DEVICE_IDENTIFICATION_PAGE
+
+
+class ResponseCache(object):
+    def __init__(self, directory, ttl):
+        super(ResponseCache, self).__init__()
+        self.directory = directory
+        self.ttl = float(ttl)
+        self._devices = {}
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, device):
+        name = device.strip('/').replace('/', '_') or '_'
+        return os.path.join(self.directory, name + '.json')
+
+    def _entries(self, device):
+        if device not in self._devices:
+            try:
+                with open(self._path(device)) as fd:
+                    self._devices[device] = json.load(fd)
+            except (IOError, OSError, ValueError):
+                self._devices[device] = {}
+        return self._devices[device]
+
+    def _save(self, device):
+        path = self._path(device)
+        temporary_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(temporary_path, 'w') as fd:
+            json.dump(self._devices[device], fd)
+        os.rename(temporary_path, path)
+
+    def get(self, device, key):
+        with self._lock:
+            entry = self._entries(device).get(key)
+        if entry is None or time.time() - entry[0] > self.ttl:
+            return None
+        return binascii.unhexlify(entry[1])
+
+    def set(self, device, key, data):
+        with self._lock:
+            entries = self._entries(device)
+            previous = entries.get(key)
+            data_hex = binascii.hexlify(data).decode()
+            if is_identification_key(key) and previous is not None and previous[1] != data_hex:
+                entries.clear()
+            entries[key] = [time.time(), data_hex]
+            self._save(device)
+
+    def get_length(self, device, name):
+        with self._lock:
+            entry = self._entries(device).get(name)
+        return None if entry is None else entry[1]
+
+    def set_length(self, device, name, length):
+        with self._lock:
+            self._entries(device)[name] = [time.time(), length]
+            self._save(device)
+
+    def invalidate(self, device):
+        with self._lock:
+            self._entries(device).clear()
+            self._save(device)
+
+
+class CachingExecuter(object):
+    """ Wraps an executer, answering cacheable commands from a ResponseCache """
+    def __init__(self, executer, cache, device):
+        super(CachingExecuter, self).__init__()
+        self._executer = executer
+        self._cache = cache
+        self._device = device
+
+    def __getattr__(self, name):
+        return getattr(self._executer, name)
+
+    def call(self, command):
+        from infi.asi.errors import AsiCheckConditionError
+        key = cache_key(command)
+        data = None if key is None else self._cache.get(self._device, key)
+        if data is not None:
+            yield data
+            return
+        try:
+            data = yield self._executer.call(command)
+        except AsiCheckConditionError as error:
+            if getattr(error.sense_obj, 'sense_key', None) == 'UNIT_ATTENTION':
+                self._cache.invalidate(self._device)
+            raise
+        if key is not None and data is not None:
+            self._cache.set(self._device, key, data)
+        yield data
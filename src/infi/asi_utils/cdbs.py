@@ -0,0 +1,88 @@
+"""helpers for manipulating raw CDBs"""
+
+# opcode: (lba offset, lba size, transfer length offset, transfer length size), in bytes
+LBA_CDB_FIELDS = {
+    0x28: (2, 4, 7, 2),     # READ (10)
+    0x2a: (2, 4, 7, 2),     # WRITE (10)
+    0x2e: (2, 4, 7, 2),     # WRITE AND VERIFY (10)
+    0x2f: (2, 4, 7, 2),     # VERIFY (10)
+    0xa8: (2, 4, 6, 4),     # READ (12)
+    0xaa: (2, 4, 6, 4),     # WRITE (12)
+    0xae: (2, 4, 6, 4),     # WRITE AND VERIFY (12)
+    0xaf: (2, 4, 6, 4),     # VERIFY (12)
+    0x88: (2, 8, 10, 4),    # READ (16)
+    0x8a: (2, 8, 10, 4),    # WRITE (16)
+    0x8e: (2, 8, 10, 4),    # WRITE AND VERIFY (16)
+    0x8f: (2, 8, 10, 4),    # VERIFY (16)
+}
+
+# opcode: (buffer offset offset, buffer offset size, length offset, length size), in bytes
+BUFFER_CDB_FIELDS = {
+    0x3b: (3, 3, 6, 3),     # WRITE BUFFER
+    0x3c: (3, 3, 6, 3),     # READ BUFFER
+}
+
+
+def get_field(cdb, offset, size):
+    value = 0
+    for byte in cdb[offset:offset + size]:
+        value = (value << 8) | byte
+    return value
+
+
+def set_field(cdb, offset, size, value):
+    if value >= 1 << (8 * size):
+        raise ValueError("value 0x%x does not fit in %d bytes" % (value, size))
+    for index in range(size):
+        cdb[offset + size - 1 - index] = (value >> (8 * index)) & 0xff
+
+
+def advance_cdb(template, index, length):
+    """ Returns the CDB of the index-th command in a sequence that repeats template: block commands advance their
+    LBA by their transfer length, buffer commands advance their offset by length bytes. Other commands are
+    repeated unchanged. """
+    cdb = bytearray(template)
+    if not cdb:
+        return bytes(cdb)
+    if cdb[0] in LBA_CDB_FIELDS:
+        lba_offset, lba_size, length_offset, length_size = LBA_CDB_FIELDS[cdb[0]]
+        blocks = get_field(cdb, length_offset, length_size)
+        set_field(cdb, lba_offset, lba_size, get_field(cdb, lba_offset, lba_size) + index * blocks)
+    elif cdb[0] in BUFFER_CDB_FIELDS:
+        offset_offset, offset_size, length_offset, length_size = BUFFER_CDB_FIELDS[cdb[0]]
+        set_field(cdb, offset_offset, offset_size, get_field(cdb, offset_offset, offset_size) + index * length)
+    return bytes(cdb)
+
+
+def chunk_block_size(template, total_length, chunk_size):
+    """ Returns the block size of a block command moving total_length bytes, which chunk_size must be a multiple
+    of, or None for other commands """
+    cdb = bytearray(template)
+    if not cdb or cdb[0] not in LBA_CDB_FIELDS:
+        return None
+    _, _, length_offset, length_size = LBA_CDB_FIELDS[cdb[0]]
+    blocks = get_field(cdb, length_offset, length_size)
+    if not blocks or total_length % blocks:
+        raise ValueError("cannot split %d bytes into the %d blocks of the cdb" % (total_length, blocks))
+    block_size = total_length // blocks
+    if chunk_size % block_size:
+        raise ValueError("chunk size %d is not a multiple of the %d byte blocks" % (chunk_size, block_size))
+    return block_size
+
+
+def chunk_cdb(template, offset, length, block_size=None):
+    """ Returns the CDB moving the length bytes at offset bytes into the transfer of template: block commands
+    start offset / block_size blocks later and transfer length / block_size blocks, buffer commands advance their
+    buffer offset by offset and transfer length bytes. Other commands are repeated unchanged. """
+    cdb = bytearray(template)
+    if not cdb:
+        return bytes(cdb)
+    if cdb[0] in LBA_CDB_FIELDS:
+        lba_offset, lba_size, length_offset, length_size = LBA_CDB_FIELDS[cdb[0]]
+        set_field(cdb, lba_offset, lba_size, get_field(cdb, lba_offset, lba_size) + offset // block_size)
+        set_field(cdb, length_offset, length_size, length // block_size)
+    elif cdb[0] in BUFFER_CDB_FIELDS:
+        offset_offset, offset_size, length_offset, length_size = BUFFER_CDB_FIELDS[cdb[0]]
+        set_field(cdb, offset_offset, offset_size, get_field(cdb, offset_offset, offset_size) + offset)
+        set_field(cdb, length_offset, length_size, length)
+    return bytes(cdb)
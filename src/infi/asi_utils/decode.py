@@ -0,0 +1,172 @@
+"""asi-utils decode: parsing captured command responses offline
+
+Every capture is a file (e.g. a raw --outfile) holding the data-in of one command of --type, a directory of such
+files, or a tar or zip archive of them. Each payload is handed to the command's own execute() in place of a device,
+so it is parsed by the same infi.asi result classes (and compact tables) as a live response, and formatted by the
+formatter the command would use. Payloads are parsed and formatted by a pool of --processes worker processes, in
+chunks, and output in the order they were listed; small bundles are decoded in this process, as starting the pool
+would take longer than decoding them.
+"""
+
+import os
+from collections import OrderedDict
+
+DECODE_TYPES = ('inq', 'luns', 'rtpg', 'readcap', 'pr_readkeys', 'pr_readreservation', 'logs')
+INLINE_PAYLOADS = 64        # bundles up to this size are decoded without a process pool
+CHUNKS_PER_PROCESS = 8
+
+
+class CapturedResponse(object):
+    """ An executer answering every command with the same captured data-in """
+    def __init__(self, data):
+        super(CapturedResponse, self).__init__()
+        self.data = data
+
+    def call(self, command):
+        yield self.data
+
+
+def build_decode_command(command, page=None, select_report=0, extended=False, read_16=False):
+    from infi.asi.cdb.persist.input import PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES
+    from . import (build_inq_command, build_luns_command, build_rtpg_command, build_readcap_command,
+                   build_pr_in_command)
+    if command == 'inq':
+        return build_inq_command(page)
+    elif command == 'luns':
+        return build_luns_command(select_report)
+    elif command == 'rtpg':
+        return build_rtpg_command(extended)
+    elif command == 'readcap':
+        return build_readcap_command(read_16)
+    elif command == 'pr_readkeys':
+        return build_pr_in_command(PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES.READ_KEYS)
+    elif command == 'pr_readreservation':
+        return build_pr_in_command(PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES.READ_RESERVATION)
+    elif command == 'logs':
+        return None     # log pages are named by logpages.py, the page code is in the payload
+    raise ValueError("invalid type: %s (expected %s)" % (command, ', '.join(DECODE_TYPES)))
+
+
+def parse_log_page(data):
+    from .logpages import counter_names, parameter_values
+    data = bytearray(data)
+    if len(data) < 4:
+        raise ValueError("truncated log page: %d bytes" % len(data))
+    return OrderedDict((name, value) for name, value, _ in counter_names(data[0] & 0x3f, parameter_values(data)))
+
+
+class Decoder(object):
+    """ Parses and formats the payloads of one command type """
+    def __init__(self, command, options, formatter):
+        from . import formatters
+        super(Decoder, self).__init__()
+        self.command = command
+        self.options = options
+        self.formatter = getattr(formatters, formatter)()
+        # log pages are parsed into named counters, which have no binary form: --hex and --raw show the payload
+        self.binary = isinstance(self.formatter, (formatters.HexOutputFormatter, formatters.RawOutputFormatter))
+        build_decode_command(command, **options)  # raises ValueError on an invalid type or page
+
+    def parse(self, data):
+        from infi.asi.coroutines.sync_adapter import sync_wait
+        if self.command == 'logs':
+            return parse_log_page(data)
+        result = sync_wait(build_decode_command(self.command, **self.options).execute(CapturedResponse(data)))
+        if self.command == 'inq' and self.options.get('page') is None:
+            result.product_serial_number = None     # read from another page on a live device
+        return result
+
+    def __call__(self, task):
+        """ Decodes a (name, path or data) task, returning its name, output and error """
+        name, source = task
+        try:
+            if not isinstance(source, bytes):
+                with open(source, 'rb') as fd:
+                    source = fd.read()
+            result = self.parse(source)
+            if self.binary and self.command == 'logs':
+                result = source
+            return name, self.formatter.format(result), None
+        except Exception as error:     # payloads are arbitrary bytes, which can fail parsing in any way
+            return name, None, str(error) or type(error).__name__
+
+
+def iter_payloads(captures):
+    """ Yields (name, path or data) for every payload of the captures: files, directories or archives """
+    import tarfile
+    import zipfile
+    for capture in captures:
+        if os.path.isdir(capture):
+            for directory, directories, files in os.walk(capture):
+                directories.sort()
+                for name in sorted(files):
+                    yield os.path.join(directory, name), os.path.join(directory, name)
+        elif not os.path.isfile(capture):
+            raise ValueError("no such capture: %s" % capture)
+        elif tarfile.is_tarfile(capture):
+            with tarfile.open(capture) as archive:
+                for member in archive:
+                    if member.isfile():
+                        yield '%s:%s' % (capture, member.name), archive.extractfile(member).read()
+        elif zipfile.is_zipfile(capture):
+            with zipfile.ZipFile(capture) as archive:
+                for member in archive.infolist():
+                    if not member.filename.endswith('/'):
+                        yield '%s:%s' % (capture, member.filename), archive.read(member)
+        else:
+            yield capture, capture
+
+
+_decoder = None
+
+
+def _initialize(command, options, formatter):
+    global _decoder
+    _decoder = Decoder(command, options, formatter)
+
+
+def _decode(task):
+    return _decoder(task)
+
+
+def imap_decoded(decoder, tasks, processes):
+    """ Yields the decoded tasks in order, from a pool of processes unless there are only a few """
+    import multiprocessing
+    if processes <= 0:
+        processes = multiprocessing.cpu_count()
+    if processes == 1 or len(tasks) <= INLINE_PAYLOADS:
+        for task in tasks:
+            yield decoder(task)
+        return
+    pool = multiprocessing.Pool(processes, _initialize,
+                                (decoder.command, decoder.options, type(decoder.formatter).__name__))
+    try:
+        chunksize = max(1, len(tasks) // (processes * CHUNKS_PER_PROCESS))
+        for decoded in pool.imap(_decode, tasks, chunksize):
+            yield decoded
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def decode(captures, command, processes=0, **options):
+    """ Decodes and outputs every payload of the captures, returning the number of payloads that failed """
+    import sys
+    from . import ActiveOutputContext
+    formatter = ActiveOutputContext.result_formatter_name()
+    decoder = Decoder(command, options, 'DictOutputFormatter' if ActiveOutputContext.ndjson else formatter)
+    tasks = list(iter_payloads(captures))
+    if not tasks:
+        raise ValueError("no payloads found")
+    failed = 0
+    for name, output, error in imap_decoded(decoder, tasks, int(processes)):
+        if error is not None:
+            failed += 1
+            ActiveOutputContext._print('%s: %s' % (name, error), file=sys.stderr)
+        elif ActiveOutputContext.ndjson:
+            with ActiveOutputContext.scope(device=name):
+                ActiveOutputContext.output_result(output)
+        else:
+            ActiveOutputContext._print('%s:' % name)
+            ActiveOutputContext._print(output)
+    return failed
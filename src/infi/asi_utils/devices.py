@@ -0,0 +1,138 @@
+"""resolving linux block devices to the SCSI generic devices commands are sent through
+
+A single pass over sysfs indexes
+    sd -> sg        /sys/class/scsi_generic/sgN/device/block/sdX
+    dm -> slaves    /sys/block/dm-N/slaves/sdX, and the multipath name of each dm device (/sys/block/dm-N/dm/name)
+The index is shared by every thread of the process. sysfs does not report changes through inotify or directory
+mtimes, so the index is rebuilt when the listing of /sys/class/scsi_generic or /sys/block changes, which is checked
+at most once every CHECK_INTERVAL seconds.
+
+A dm device is opened as is, unless a path is selected: a slave name (sdb), the index of a slave in sorted order,
+or "round-robin", which picks the next slave of the dm device every time it is resolved.
+"""
+
+import itertools
+import os
+import re
+import threading
+from .stats import timer
+
+SYSFS_ROOT = '/sys'
+CHECK_INTERVAL = 1.0
+ROUND_ROBIN = 'round-robin'
+_PARTITION = re.compile(r'^(sd[a-z]+)\d*$')
+
+
+def _listdir(path):
+    try:
+        return os.listdir(path)
+    except OSError:
+        return []
+
+
+class DeviceIndex(object):
+    def __init__(self, root=SYSFS_ROOT, check_interval=CHECK_INTERVAL):
+        super(DeviceIndex, self).__init__()
+        self.root = root
+        self.check_interval = check_interval
+        self.sd_to_sg = {}
+        self.dm_slaves = {}
+        self.dm_names = {}
+        self._signature = None
+        self._checked = None
+        self._round_robin = {}
+        self._lock = threading.Lock()
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def _listing(self):
+        return (tuple(sorted(_listdir(self._path('class', 'scsi_generic')))),
+                tuple(sorted(_listdir(self._path('block')))))
+
+    def _build(self, signature):
+        sg_names, block_names = signature
+        sd_to_sg, dm_slaves, dm_names = {}, {}, {}
+        for sg in sg_names:
+            for sd in _listdir(self._path('class', 'scsi_generic', sg, 'device', 'block')):
+                sd_to_sg[sd] = sg
+        for name in block_names:
+            if not name.startswith('dm-'):
+                continue
+            dm_slaves[name] = sorted(_listdir(self._path('block', name, 'slaves')))
+            try:
+                with open(self._path('block', name, 'dm', 'name')) as fd:
+                    dm_names[fd.read().strip()] = name
+            except (OSError, IOError):
+                pass
+        self.sd_to_sg, self.dm_slaves, self.dm_names = sd_to_sg, dm_slaves, dm_names
+        self._round_robin = {}
+
+    def refresh(self, force=False):
+        """ Rebuilds the index if sysfs lists different devices than it did when it was built """
+        with self._lock:
+            now = timer()
+            if not force and self._checked is not None and now - self._checked < self.check_interval:
+                return
+            self._checked = now
+            signature = self._listing()
+            if force or signature != self._signature:
+                self._build(signature)
+                self._signature = signature
+
+    def slaves(self, device):
+        """ Returns the slaves (e.g. sdb, sdc) of a dm device, by path (/dev/dm-0, /dev/mapper/mpatha) or name """
+        self.refresh()
+        return list(self.dm_slaves.get(self._dm_name(device), []))
+
+    def _dm_name(self, device):
+        name = os.path.basename(os.path.realpath(device))
+        return self.dm_names.get(name, name)
+
+    def _select(self, dm, slaves, path):
+        if path == ROUND_ROBIN:
+            with self._lock:
+                counter = self._round_robin.setdefault(dm, itertools.count())
+                return slaves[next(counter) % len(slaves)]
+        if path in slaves:
+            return path
+        if path.isdigit() and int(path) < len(slaves):
+            return slaves[int(path)]
+        raise ValueError("no path %s for %s (paths: %s)" % (path, dm, ', '.join(slaves)))
+
+    def resolve(self, device, path=None):
+        """ Returns the device to open for device: its sg device for sd devices and their partitions, the
+        sg device of the selected slave for dm devices if path is given, or device itself """
+        self.refresh()
+        name = os.path.basename(device)
+        if name.startswith('sg'):
+            return device
+        partition = _PARTITION.match(name)
+        if partition:
+            sd = partition.group(1)
+            if sd not in self.sd_to_sg:
+                raise ValueError("no scsi generic device found for %s" % device)
+            return '/dev/' + self.sd_to_sg[sd]
+        dm = self._dm_name(device)
+        if path is None or dm not in self.dm_slaves:
+            return device
+        slaves = self.dm_slaves[dm]
+        if not slaves:
+            raise ValueError("%s has no paths" % device)
+        return self.resolve('/dev/' + self._select(dm, slaves, path))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_device_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DeviceIndex()
+        return _index
+
+
+def resolve_device(device, path=None):
+    return get_device_index().resolve(device, path)
@@ -1,6 +1,148 @@
-from infi.instruct.struct import Struct, FieldListContainer, AnonymousField
-from infi.instruct.buffer import Buffer
 import binascii
+from array import array
+from operator import attrgetter
+
+HEXDUMP_BLOCK_SIZE = 64 * 1024      # bytes rendered per step, a multiple of 16
+_PRINTABLE = bytes(bytearray(byte if 0x20 <= byte <= 0x7e else ord('.') for byte in range(256)))
+
+# obsolete standard INQUIRY bits: (byte, bit)
+OBSOLETE_INQUIRY_BITS = {'aerc': (3, 7),
+                         'trmtsk': (3, 6),
+                         'bque': (6, 7),
+                         'vs': (6, 5),
+                         'mchngr': (6, 3),
+                         'ackreqq': (6, 2),
+                         'reladr': (7, 7),
+                         'linked': (7, 3),
+                         'trandis': (7, 2)}
+
+# SPC-4 asymmetric access states, as reported by REPORT TARGET PORT GROUPS
+ALUA_STATES = {0x0: 'active/optimized',
+               0x1: 'active/non-optimized',
+               0x2: 'standby',
+               0x3: 'unavailable',
+               0x4: 'logical block dependent',
+               0xe: 'offline',
+               0xf: 'transitioning'}
+
+
+# class: the (name, getter) pairs _to_dict reads from its instances, or None for non-instruct classes
+_to_dict_plans = {}
+_SCALAR_TYPES = (int, float, bool, str, type(None))
+_INDENT = '    '
+
+
+def _to_dict_plan(cls):
+    """ Returns the fields of an instruct Struct/Buffer class (or of a compact record class, which lists them
+    in _record_fields) as (name, getter) pairs, computed once per class """
+    plan = _to_dict_plans.get(cls, False)
+    if plan is not False:
+        return plan
+    if hasattr(cls, '_record_fields'):
+        plan = _to_dict_plans[cls] = [(name, attrgetter(name)) for name in cls._record_fields]
+        return plan
+    from infi.instruct.struct import Struct, FieldListContainer, AnonymousField
+    from infi.instruct.buffer import Buffer
+    plan = None
+    if issubclass(cls, Buffer):
+        names = [field.attr_name() for base in cls.mro() for field in getattr(base, '__fields__', [])]
+        plan = [(name, attrgetter(name)) for name in names]
+    elif issubclass(cls, Struct):
+        plan = []
+        for field in cls._container_.fields:
+            if hasattr(field, 'name'):
+                plan.append((field.name, field.get_value))
+            elif isinstance(field, FieldListContainer):
+                plan.extend((inner_field.name, inner_field.get_value) for inner_field in field.fields
+                            if not isinstance(inner_field, AnonymousField))
+    _to_dict_plans[cls] = plan
+    return plan
+
+
+def _render_text(data):
+    """ Returns json.dumps(data, indent=4, sort_keys=True) without quotes and commas, skipping the json round-trip.
+    Raises TypeError for anything it does not render exactly as json does, so callers can fall back to json """
+    from json.encoder import encode_basestring_ascii
+    chunks = []
+    append = chunks.append
+
+    def text(value):
+        return encode_basestring_ascii(value).replace('"', '').replace(',', '')
+
+    def render(value, newline):
+        cls = type(value)
+        if cls is str or isinstance(value, str):
+            append(text(value))
+        elif value is None:
+            append('null')
+        elif value is True or value is False:
+            append('true' if value else 'false')
+        elif isinstance(value, int):
+            append(int.__repr__(value))
+        elif isinstance(value, float) and value - value == 0:     # finite
+            append(float.__repr__(value))
+        elif isinstance(value, dict):
+            if not value:
+                append('{}')
+                return
+            inner_newline = newline + _INDENT
+            append('{')
+            for key in sorted(value):
+                if not isinstance(key, str):
+                    raise TypeError("non-string key %r" % (key,))
+                append(inner_newline)
+                append(text(key))
+                append(': ')
+                render(value[key], inner_newline)
+            append(newline)
+            append('}')
+        elif isinstance(value, (list, tuple)):
+            if not value:
+                append('[]')
+                return
+            inner_newline = newline + _INDENT
+            append('[')
+            for element in value:
+                append(inner_newline)
+                render(element, inner_newline)
+            append(newline)
+            append(']')
+        else:
+            raise TypeError("cannot render %r" % (cls,))
+
+    render(data, '\n')
+    return ''.join(chunks)
+
+
+def _spaced_hex(data):
+    """ Returns data as upper case hex bytes separated by spaces """
+    try:
+        return data.hex(' ').upper()
+    except (AttributeError, TypeError):     # python < 3.8
+        hexed = binascii.hexlify(data).decode().upper()
+        return ' '.join(hexed[index:index + 2] for index in range(0, len(hexed), 2))
+
+
+def iter_hexdump(data):
+    """ Yields the output of hexdump.hexdump(data, result='return') in pieces, each holding the lines of
+    HEXDUMP_BLOCK_SIZE bytes of data (joined, without a trailing newline) """
+    view = memoryview(data)
+    for block_start in range(0, len(view), HEXDUMP_BLOCK_SIZE):
+        block = view[block_start:block_start + HEXDUMP_BLOCK_SIZE].tobytes()
+        hexed = _spaced_hex(block)
+        text = block.translate(_PRINTABLE).decode('ascii')
+        full = len(block) - len(block) % 16
+        lines = ['%08X: %s %s  %s' % (block_start + offset, hexed[offset * 3:offset * 3 + 24],
+                                      hexed[offset * 3 + 24:offset * 3 + 47], text[offset:offset + 16])
+                 for offset in range(0, full, 16)]
+        if full < len(block):
+            length = len(block) - full
+            line_hex = hexed[full * 3:]
+            if length > 8:
+                line_hex = line_hex[:24] + ' ' + line_hex[24:]
+            padding = 2 + 3 * (16 - length) + (1 if length <= 8 else 0)
+            lines.append('%08X: %s%s%s' % (block_start + full, line_hex, ' ' * padding, text[full:]))
+        yield '\n'.join(lines)
 
 
 class OutputFormatter(object):
@@ -9,53 +151,57 @@ class OutputFormatter(object):
         """ Renders the output as string """
         raise NotImplementedError()
 
+    def iter_format(self, item):
+        """ Renders the output as a sequence of strings, each printed on its own """
+        yield self.format(item)
+
     def _to_bytes(self, item):
         """ Utility method that converts the output to a byte sequence """
+        from infi.instruct.struct import Struct
+        from infi.instruct.buffer import Buffer
+        if isinstance(item, (bytes, bytearray, memoryview)):
+            return item
         data = bytes(type(item).write_to_string(item)) if isinstance(item, Struct) else \
                bytes(item.pack()) if isinstance(item, Buffer) else \
-               '' if item is None else bytes(item)
+               b'' if item is None else bytes(item)
         return data
 
     def _to_dict(self, item):
         """ Utility method that converts the output to a dict """
-        if isinstance(item, Buffer):
-            ret = {}
-            fields = item._all_fields()
-            for field in fields:
-                ret[field.attr_name()] = self._to_dict(getattr(item, field.attr_name()))
-            return ret
-
-        if isinstance(item, Struct):
-            ret = {}
-            for field in item._container_.fields:
-                if hasattr(field, 'name'):
-                    ret[field.name] = self._to_dict(field.get_value(item))
-                elif isinstance(field, FieldListContainer):
-                    for inner_field in field.fields:
-                        if not isinstance(inner_field, AnonymousField):
-                            ret[inner_field.name] = self._to_dict(inner_field.get_value(item))
-            return ret
-
-        if isinstance(item, bytearray):
-            return '0x' + binascii.hexlify(item) if item else ''
+        cls = type(item)
+        if cls in _SCALAR_TYPES:
+            return item
+
+        plan = _to_dict_plan(cls)
+        if plan is not None:
+            to_dict = self._to_dict
+            return dict((name, to_dict(getter(item))) for name, getter in plan)
+
+        if isinstance(item, bytearray) or (bytes is not str and isinstance(item, bytes)):
+            return '0x' + binascii.hexlify(item).decode() if item else ''
 
         if isinstance(item, list):
             return [self._to_dict(x) for x in item]
 
+        if isinstance(item, array):
+            return item.tolist()
+
         return item
 
 
 class RawOutputFormatter(OutputFormatter):
 
     def format(self, item):
-        return self._to_bytes(item).decode()
+        return bytes(self._to_bytes(item)).decode()
 
 
 class HexOutputFormatter(OutputFormatter):
 
     def format(self, item):
-        from hexdump import hexdump
-        return hexdump(self._to_bytes(item), result='return')
+        return '\n'.join(self.iter_format(item))
+
+    def iter_format(self, item):
+        return iter_hexdump(self._to_bytes(item))
 
 
 class JsonOutputFormatter(OutputFormatter):
@@ -65,10 +211,39 @@ class JsonOutputFormatter(OutputFormatter):
         return dumps(self._to_dict(item), indent=4, sort_keys=True)
 
 
+class DictOutputFormatter(OutputFormatter):
+
+    def format(self, item):
+        """ Renders the output as a JSON-serializable object, for embedding in other documents """
+        return self._to_dict(item)
+
+
 class DefaultOutputFormatter(JsonOutputFormatter):
 
     def format(self, item):
-        return super(DefaultOutputFormatter, self).format(item).replace('"', '').replace(',', '')
+        """ Renders the json output without quotes and commas """
+        data = self._to_dict(item)
+        try:
+            return _render_text(data)
+        except TypeError:
+            from json import dumps
+            return dumps(data, indent=4, sort_keys=True).replace('"', '').replace(',', '')
+
+
+class NdjsonOutputFormatter(OutputFormatter):
+
+    def __init__(self, fields):
+        super(NdjsonOutputFormatter, self).__init__()
+        self._fields = fields
+
+    def format(self, item):
+        """ Renders the output as one compact json record, along with the fields describing it """
+        from json import dumps
+        from time import time
+        record = dict(device=None, command=None, timestamp=time(), latency=None)
+        record.update(self._fields())
+        record['result'] = self._to_dict(item)
+        return dumps(record, separators=(',', ':'), default=str)
 
 
 class ErrorOutputFormatter(OutputFormatter):
@@ -77,6 +252,36 @@ class ErrorOutputFormatter(OutputFormatter):
         return 'ERROR: %s (%s)' % (item.sense_key, item.additional_sense_code.code_name)
 
 
+class TursOutputFormatter(DefaultOutputFormatter):
+
+    def format(self, item):
+        if not isinstance(item, dict):
+            return super(TursOutputFormatter, self).format(item)
+        lines = [
+            'Completed {commands} Test Unit Ready commands with {errors} errors (queue depth {queue_depth})',
+            '   time {elapsed:.3f} secs, {iops:.1f} operations per second',
+            '   latency (ms): min={min:.3f} avg={avg:.3f} p50={p50:.3f} p99={p99:.3f} max={max:.3f}'
+        ]
+        params = dict(item, iops=item['iops'] or 0)
+        params.update((key, (value or 0) * 1000.0) for key, value in item['latency'].items() if key != 'count')
+        return '\n'.join(lines).format(**params)
+
+
+class BenchmarkOutputFormatter(OutputFormatter):
+
+    def format(self, item):
+        """ Renders benchmark rows, which share the same (ordered) keys, as a table """
+        if not item:
+            return ''
+        columns = list(item[0].keys())
+        widths = [24] + [max(len(column), 12) for column in columns[1:]]
+
+        def render(values):
+            cells = [('%.1f' % value if isinstance(value, float) else str(value)) for value in values]
+            return ' '.join([cells[0].ljust(widths[0])] + [cell.rjust(width) for cell, width in zip(cells[1:], widths[1:])])
+        return '\n'.join([render(columns)] + [render([row[column] for column in columns]) for row in item])
+
+
 class ReadcapOutputFormatter(OutputFormatter):
 
     def format(self, item):
@@ -122,18 +327,8 @@ class InqOutputFormatter(DefaultOutputFormatter):
         # also see:
         # https://www.ibm.com/support/knowledgecenter/en/STQRQ9/com.ibm.storage.ts4500.doc/ts4500_sref_3584_minqv.html
         # http://www.tldp.org/HOWTO/archived/SCSI-Programming-HOWTO/SCSI-Programming-HOWTO-9.html
-        missing_data = {}
-        bytes_as_bits = [''.join(reversed(bin(byte)[2:].zfill(8))) for byte in item.pack()]
-        missing_data['aerc'] = bytes_as_bits[3][7]
-        missing_data['trmtsk'] = bytes_as_bits[3][6]
-        missing_data['bque'] = bytes_as_bits[6][7]
-        missing_data['vs'] = bytes_as_bits[6][5]
-        missing_data['mchngr'] = bytes_as_bits[6][3]
-        missing_data['ackreqq'] = bytes_as_bits[6][2]
-        missing_data['reladr'] = bytes_as_bits[7][7]
-        missing_data['linked'] = bytes_as_bits[7][3]
-        missing_data['trandis'] = bytes_as_bits[7][2]
-        return missing_data
+        header = bytearray(item.pack()[:8])
+        return dict((name, str((header[byte] >> bit) & 1)) for name, (byte, bit) in OBSOLETE_INQUIRY_BITS.items())
 
     def _get_vpd_page_name(self, vpd_page, data):
         from infi.asi.cdb.inquiry.vpd_pages import SCSI_VPD_NAME
@@ -294,11 +489,161 @@ class ReadreservationOutputFormatter(OutputFormatter):
           'Scope: 0x%x' % item.scope]
         return '\n'.join(lines)
 
+class AuditOutputFormatter(OutputFormatter):
+
+    def format(self, item):
+        """ Renders a pr_audit report as one line per device that failed the audit and a summary """
+        lines = ['%-32s %10s  %s' % ('device', 'generation', 'problems')] if item['problems'] else []
+        for record in item['problems']:
+            generation = '-' if record['generation'] is None else str(record['generation'])
+            lines.append('%-32s %10s  %s' % (record['device'], generation, '; '.join(record['problems'])))
+        lines.append('audited {devices} devices in {elapsed:.3f} secs: {ok} ok, {mismatched} mismatched, '
+                     '{failed} failed'.format(**item))
+        return '\n'.join(lines)
+
+class BulkOutputFormatter(OutputFormatter):
+
+    def format(self, item):
+        """ Renders a pr_bulk report as one line per device and a summary """
+        lines = ['%-32s %-20s %12s  %s' % ('device', 'status', 'latency(ms)', 'details')]
+        for record in item['results']:
+            details = record['error'] or ''
+            if 'registered' in record:
+                details = 'key registered' if record['registered'] else 'key not registered'
+            elif record.get('changed') is False:
+                details = 'unchanged, already in place before the run'
+            latency = '-' if record['latency'] is None else '%.3f' % (record['latency'] * 1000)
+            lines.append('%-32s %-20s %12s  %s' % (record['device'], record['status'], latency, details))
+        summary = '{action} {key} on {devices} devices in {elapsed:.3f} secs: '.format(**item)
+        if item['dry_run']:
+            summary += '{reachable} reachable (dry run)'.format(**item)
+        else:
+            summary += ('{ok} ok, {failed} failed, {rolled_back} rolled back, {rollback_failed} rollback failed, '
+                        '{rollback_incomplete} rollback incomplete').format(**item)
+        lines.append(summary)
+        return '\n'.join(lines)
+
+class WatchOutputFormatter(OutputFormatter):
+
+    def _render(self, value):
+        if isinstance(value, dict):
+            return ' '.join('%s=%s' % item for item in value.items())
+        return str(value)
+
+    def format(self, item):
+        """ Renders a watch change record as a single line, listing only the values that changed """
+        from time import strftime
+        from . import ActiveOutputContext
+        prefix = '%s %s %s:' % (strftime('%Y-%m-%d %H:%M:%S'), ActiveOutputContext.fields().get('device'),
+                                item['check'])
+        previous, current = item['previous'], item['current']
+        if 'delta' in item:
+            changes = ['%s %s -> %s (%+d)' % (code, previous[code], current[code], delta)
+                       for code, delta in item['delta'].items()]
+            return ' '.join([prefix] + changes)
+        if isinstance(previous, dict) and isinstance(current, dict):
+            changes = ['%s %s -> %s' % (key, previous.get(key), current.get(key))
+                       for key in sorted(set(previous) | set(current)) if previous.get(key) != current.get(key)]
+            return ' '.join([prefix] + changes)
+        if previous is None:
+            return '%s %s' % (prefix, self._render(current))
+        return '%s %s -> %s' % (prefix, self._render(previous), self._render(current))
+
+class LogCountersOutputFormatter(OutputFormatter):
+
+    def format(self, item):
+        """ Renders a logs --all sample as one line of its nonzero parameters, followed by the rate of every
+        counter that changed since the previous sample """
+        if not isinstance(item, dict):
+            return DefaultOutputFormatter().format(item)
+        values = ['%s=%s' % (name, value) for name, value in sorted(item['counters'].items()) if value]
+        line = ' '.join(values) or 'no nonzero parameters'
+        if item['rates']:
+            line += '\nrates over %.1f secs: %s' % (item['interval'], ' '.join(
+                '%s=%.3f/s' % (name, rate) for name, rate in sorted(item['rates'].items())))
+        return line
+
+class ScriptOutputFormatter(OutputFormatter):
+
+    def format(self, item):
+        """ Renders the records of a raw --script as one line per step """
+        if not isinstance(item, list):
+            return DefaultOutputFormatter().format(item)
+        row = '{:>5} {:<34} {:>6} {:>10} {:>10} {:>10} {:>10}  {}'
+        lines = [row.format('line', 'cdb', 'repeat', 'bytes in', 'bytes out', 'avg(ms)', 'max(ms)', 'status')]
+        for record in item:
+            latency = record['latency']
+            lines.append(row.format(record['line'], record['cdb'], record['repeat'], record['bytes_in'],
+                                    record['bytes_out'], '%.3f' % ((latency['avg'] or 0) * 1000),
+                                    '%.3f' % ((latency['max'] or 0) * 1000), record['status']))
+        return '\n'.join(lines)
+
+class PathsOutputFormatter(OutputFormatter):
+
+    def format(self, item):
+        """ Renders the records of paths as one line per path, fastest first """
+        row = '{:<24} {:<16} {:>5} {:>5} {:<24} {:>9} {:>9} {:>9} {:>7}  {}'
+        lines = [row.format('device', 'path', 'tpg', 'port', 'alua state', 'p50(ms)', 'p99(ms)', 'max(ms)', 'errors',
+                            'error')]
+        for record in item:
+            latency = dict((key, '-' if value is None else '%.3f' % (value * 1000))
+                           for key, value in record['latency'].items() if key != 'count')
+            state = (record['alua_state'] or '-') + (' (preferred)' if record['preferred'] else '')
+            lines.append(row.format(record['device'], record['path'],
+                                    '-' if record['target_port_group'] is None else record['target_port_group'],
+                                    '-' if record['relative_target_port'] is None else record['relative_target_port'],
+                                    state, latency['p50'], latency['p99'], latency['max'], record['errors'],
+                                    record['error'] or ''))
+        return '\n'.join(lines)
+
+class ScanOutputFormatter(OutputFormatter):
+    HEATMAP_SHADES = ' .:-=+*#%@'
+    HEATMAP_WIDTH = 64
+
+    def _heatmap(self, stripes):
+        """ Renders the p99 latency of every stripe as a shade, from the fastest to the slowest stripe, marking
+        stripes with check conditions X """
+        values = [stripe['latency']['p99'] for stripe in stripes if stripe['latency']['p99'] is not None]
+        low, high = (min(values), max(values)) if values else (0.0, 0.0)
+        scale = (len(self.HEATMAP_SHADES) - 1) / (high - low) if high > low else 0
+        cells = ['X' if stripe['errors'] else '?' if stripe['latency']['p99'] is None else
+                 self.HEATMAP_SHADES[int((stripe['latency']['p99'] - low) * scale)] for stripe in stripes]
+        lines = ['p99 latency by stripe, from %.3f ms (" ") to %.3f ms ("@"), X: check conditions' %
+                 (low * 1000, high * 1000)]
+        for offset in range(0, len(cells), self.HEATMAP_WIDTH):
+            lines.append('   lba {:>14} |{}|'.format(stripes[offset]['first_lba'],
+                                                    ''.join(cells[offset:offset + self.HEATMAP_WIDTH])))
+        return lines
+
+    def format(self, item):
+        """ Renders a scan report as its totals, the heatmap of its stripes and its check conditions """
+        latency = dict((key, '-' if value is None else '%.3f' % (value * 1000))
+                       for key, value in item['latency'].items())
+        lines = [
+            'Scanned {scanned_blocks} of {blocks} blocks of {block_size} bytes ({mode}, {transfer_blocks} blocks '
+            'per command, queue depth {queue_depth}, {workers} workers) in {elapsed:.3f} secs'.format(**item),
+            '   {:.1f} MB/s, {:.1f} commands per second{}'.format(
+                (item['throughput'] or 0) / 1000000.0, item['iops'] or 0,
+                ', %d stripes resumed from the checkpoint' % item['resumed_stripes'] if item['resumed_stripes']
+                else ''),
+            '   latency (ms): min={min} avg={avg} max={max}'.format(**latency),
+        ]
+        lines += self._heatmap(item['stripes'])
+        lines.append('%d check conditions' % len(item['errors']) + (':' if item['errors'] else ''))
+        lines += ['   lba {lba} (+{blocks} blocks): {error}'.format(**error) for error in item['errors']]
+        return '\n'.join(lines)
+
 class LunsOutputFormatter(OutputFormatter):
+    LUNS_PER_STEP = 4096
 
     def format(self, item):
-        data = self._to_dict(item)
-        return '\n'.join([str(lun) for lun in data['lun_list']])
+        return '\n'.join(self.iter_format(item))
+
+    def iter_format(self, item):
+        """ Renders the LUN list directly from the response, LUNS_PER_STEP LUNs at a time """
+        lun_list = item.lun_list
+        for start in range(0, len(lun_list), self.LUNS_PER_STEP):
+            yield '\n'.join(map(str, lun_list[start:start + self.LUNS_PER_STEP]))
 
 class RtpgOutputFormatter(DefaultOutputFormatter):
 
@@ -0,0 +1,124 @@
+"""timing events and the sinks that consume them
+
+OutputContext.emit() sends an Event to every hook added with OutputContext.add_hook(); a hook is any object with
+event(event) and close() methods. Events are only built when a hook is registered. The kinds are:
+    open, close     opening/closing the device
+    execute         submitting a CDB until its completion, with the bytes it moved
+    parse           decoding a response (sync_wait time not spent executing)
+    format          rendering a result for output
+"""
+
+from __future__ import print_function
+import csv
+import os
+import sys
+import threading
+from collections import namedtuple
+from .stats import TimingExecuter, timer
+
+Event = namedtuple('Event', ['timestamp', 'kind', 'device', 'command', 'operation', 'seconds', 'bytes_in',
+                             'bytes_out'])
+
+
+class InstrumentedExecuter(TimingExecuter):
+    """ Wraps an executer, emitting an execute event for every CDB it sends """
+    def __init__(self, executer, output_context):
+        super(InstrumentedExecuter, self).__init__(executer)
+        self._output_context = output_context
+
+    def call(self, command):
+        from infi.asi import SCSIWriteCommand
+        start = timer()
+        data = None
+        try:
+            data = yield self._executer.call(command)
+        finally:
+            seconds = timer() - start
+            self.elapsed += seconds
+            cdb = bytearray(command.command)
+            self._output_context.emit('execute', seconds, operation='0x%02x' % cdb[0] if cdb else None,
+                                      bytes_in=len(data or b''),
+                                      bytes_out=len(command.data) if isinstance(command, SCSIWriteCommand) else 0)
+        yield data
+
+
+class SummarySink(object):
+    """ Prints count, time and bytes per device and event kind when closed """
+    def __init__(self, file=sys.stderr):
+        super(SummarySink, self).__init__()
+        self.file = file
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def _key(self, event):
+        return (event.device or '', event.kind)
+
+    def event(self, event):
+        key = self._key(event)
+        with self._lock:
+            count, seconds, maximum, bytes_in, bytes_out = self.totals.get(key, (0, 0.0, 0.0, 0, 0))
+            self.totals[key] = (count + 1, seconds + event.seconds, max(maximum, event.seconds),
+                                bytes_in + (event.bytes_in or 0), bytes_out + (event.bytes_out or 0))
+
+    def close(self):
+        if not self.totals:
+            return
+        row = '{:<24} {:<8} {:>8} {:>12} {:>10} {:>10} {:>12} {:>12}'
+        lines = [row.format('device', 'event', 'count', 'total(ms)', 'avg(ms)', 'max(ms)', 'bytes in', 'bytes out')]
+        for (device, kind), (count, seconds, maximum, bytes_in, bytes_out) in sorted(self.totals.items()):
+            lines.append(row.format(device, kind, count, '%.3f' % (seconds * 1000), '%.3f' % (seconds * 1000 / count),
+                                    '%.3f' % (maximum * 1000), bytes_in, bytes_out))
+        print('\n'.join(lines), file=self.file)
+
+
+class PrometheusSink(SummarySink):
+    """ Writes the totals in the Prometheus text format to path when closed, e.g. for node_exporter's
+    textfile collector """
+    def __init__(self, path):
+        super(PrometheusSink, self).__init__()
+        self.path = path
+
+    def _key(self, event):
+        return (event.device or '', event.command or '', event.kind)
+
+    def _labels(self, device, command, kind, **extra):
+        labels = [('device', device), ('command', command), ('event', kind)] + sorted(extra.items())
+        return ','.join('%s="%s"' % (name, value.replace('\\', '\\\\').replace('"', '\\"')) for name, value in labels)
+
+    def close(self):
+        totals = sorted(self.totals.items())
+        lines = ['# HELP asi_utils_event_seconds Time spent opening devices, executing, parsing and formatting',
+                 '# TYPE asi_utils_event_seconds summary']
+        for (device, command, kind), (count, seconds, _, _, _) in totals:
+            labels = self._labels(device, command, kind)
+            lines.append('asi_utils_event_seconds_count{%s} %d' % (labels, count))
+            lines.append('asi_utils_event_seconds_sum{%s} %r' % (labels, seconds))
+        lines.extend(['# HELP asi_utils_bytes_total Bytes transferred by executed commands',
+                      '# TYPE asi_utils_bytes_total counter'])
+        for (device, command, kind), (_, _, _, bytes_in, bytes_out) in totals:
+            if kind == 'execute':
+                lines.append('asi_utils_bytes_total{%s} %d' % (self._labels(device, command, kind, direction='in'),
+                                                               bytes_in))
+                lines.append('asi_utils_bytes_total{%s} %d' % (self._labels(device, command, kind, direction='out'),
+                                                               bytes_out))
+        temporary_path = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(temporary_path, 'w') as fd:
+            fd.write('\n'.join(lines) + '\n')
+        os.rename(temporary_path, self.path)
+
+
+class CsvSink(object):
+    """ Writes every event as a row of a CSV file """
+    def __init__(self, path):
+        super(CsvSink, self).__init__()
+        self._fd = open(path, 'w')
+        self._writer = csv.writer(self._fd)
+        self._writer.writerow(Event._fields)
+        self._lock = threading.Lock()
+
+    def event(self, event):
+        with self._lock:
+            self._writer.writerow(event)
+
+    def close(self):
+        self._fd.close()
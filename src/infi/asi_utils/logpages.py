@@ -0,0 +1,137 @@
+"""parsing LOG SENSE pages into their parameters, and sampling their counters
+
+A sweep reads the supported log pages list (page 0x00) and then every page it lists, in one device session, and
+names the parameters of the pages in LOG_PAGES ("read_errors.total_uncorrected"); parameters of other pages are
+named by their page and parameter codes ("page_0x34.0x0001"). With a state directory, the last sample of every
+device is kept there, and the next sample reports the per-second rate of every counter that changed since.
+"""
+
+import binascii
+import json
+import os
+import time
+from collections import OrderedDict
+
+SUPPORTED_PAGES = 0x00
+
+# SPC-4 error counter log pages (write, read, read reverse and verify errors)
+ERROR_COUNTER_PARAMETERS = {0x0000: 'corrected_without_delay',
+                            0x0001: 'corrected_with_delay',
+                            0x0002: 'total_rereads_or_rewrites',
+                            0x0003: 'total_corrected',
+                            0x0004: 'correction_algorithm_invocations',
+                            0x0005: 'bytes_processed',
+                            0x0006: 'total_uncorrected'}
+
+# page code: (name, {parameter code: name}, whether its parameters are counters, which have rates, or gauges)
+LOG_PAGES = {0x02: ('write_errors', ERROR_COUNTER_PARAMETERS, True),
+             0x03: ('read_errors', ERROR_COUNTER_PARAMETERS, True),
+             0x04: ('read_reverse_errors', ERROR_COUNTER_PARAMETERS, True),
+             0x05: ('verify_errors', ERROR_COUNTER_PARAMETERS, True),
+             0x06: ('non_medium_errors', {0x0000: 'count'}, True),
+             0x0d: ('temperature', {0x0000: 'temperature', 0x0001: 'reference_temperature'}, False)}
+
+
+def iter_log_parameters(data):
+    """ Yields the (parameter code, control byte, value) of every parameter of a LOG SENSE page, ignoring the
+    padding after the page length """
+    data = bytearray(data)
+    if len(data) < 4:
+        return
+    end = min(len(data), ((data[2] << 8) | data[3]) + 4)
+    offset = 4
+    while offset + 4 <= end:
+        code, control, length = (data[offset] << 8) | data[offset + 1], data[offset + 2], data[offset + 3]
+        yield code, control, bytes(data[offset + 4:offset + 4 + length])
+        offset += 4 + length
+
+
+def parameter_values(data):
+    """ Returns the parameters of a LOG SENSE page as {code: value}, reading each value as a big-endian integer """
+    return OrderedDict((code, int(binascii.hexlify(value), 16) if value else 0)
+                       for code, _, value in iter_log_parameters(data))
+
+
+def supported_pages(data):
+    """ Returns the page codes listed by the supported log pages page """
+    data = bytearray(data)
+    if len(data) < 4:
+        return []
+    return [code & 0x3f for code in data[4:min(len(data), ((data[2] << 8) | data[3]) + 4)]]
+
+
+def counter_names(page, values):
+    """ Returns (name, value, is_counter) for every parameter of a page """
+    name, parameters, counters = LOG_PAGES.get(page, ('page_0x%02x' % page, {}, False))
+    return [('%s.%s' % (name, parameters.get(code, '0x%04x' % code)), value, counters)
+            for code, value in values.items()]
+
+
+def sweep(asi):
+    """ Reads every supported log page, returning the sample of its parameters: {name: value} and the names of
+    those which are counters """
+    from infi.asi.errors import AsiCheckConditionError
+    from . import read_logs
+    values, counters = OrderedDict(), set()
+    for page in supported_pages(read_logs(asi, '0x%02x' % SUPPORTED_PAGES)):
+        if page == SUPPORTED_PAGES:
+            continue
+        try:
+            data = read_logs(asi, '0x%02x' % page)
+        except AsiCheckConditionError:
+            continue    # listed but not readable, e.g. a vendor page needing a subpage
+        for name, value, is_counter in counter_names(page, parameter_values(data)):
+            values[name] = value
+            if is_counter:
+                counters.add(name)
+    return values, counters
+
+
+def rates(previous, sample, counters):
+    """ Returns the per-second rate of every counter that changed between two samples, and the seconds between
+    them """
+    if not previous or sample['timestamp'] <= previous['timestamp']:
+        return None, OrderedDict()
+    interval = sample['timestamp'] - previous['timestamp']
+    previous_values = previous['values']
+    return interval, OrderedDict((name, (value - previous_values[name]) / interval)
+                                 for name, value in sample['values'].items()
+                                 if name in counters and name in previous_values and value != previous_values[name])
+
+
+class SampleStore(object):
+    """ Keeps the last sample of every device as a json file in a directory """
+    def __init__(self, directory):
+        super(SampleStore, self).__init__()
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, device):
+        name = device.strip('/').replace('/', '_') or '_'
+        return os.path.join(self.directory, name + '.logs.json')
+
+    def load(self, device):
+        try:
+            with open(self._path(device)) as fd:
+                return json.load(fd)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def save(self, device, sample):
+        path = self._path(device)
+        temporary_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(temporary_path, 'w') as fd:
+            json.dump(sample, fd)
+        os.rename(temporary_path, path)
+
+
+def sample_device(asi, device, store=None):
+    """ Sweeps the log pages of device, returning its sample with the rates since the stored one """
+    values, counters = sweep(asi)
+    sample = OrderedDict([('timestamp', time.time()), ('values', values)])
+    interval, changed = rates(store.load(device) if store else None, sample, counters)
+    if store:
+        store.save(device, sample)
+    return OrderedDict([('timestamp', sample['timestamp']), ('interval', interval), ('counters', values),
+                        ('rates', changed)])
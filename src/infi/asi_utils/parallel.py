@@ -0,0 +1,34 @@
+import glob
+
+GLOB_CHARACTERS = '*?['
+
+
+def expand_devices(devices):
+    """ Expands shell-style wildcards (e.g. /dev/sg*) in the device list, preserving order. A wildcard matching
+    no device raises ValueError """
+    expanded = []
+    for device in devices:
+        if any(character in device for character in GLOB_CHARACTERS):
+            matched = sorted(glob.glob(device))
+            if not matched:
+                raise ValueError("no devices matched: %s" % device)
+            expanded.extend(matched)
+        else:
+            expanded.append(device)
+    return expanded
+
+
+def imap_unordered(func, items, jobs):
+    """ Calls func on every item from a pool of at most `jobs` threads,
+    yielding (item, result) pairs in the order they complete """
+    from multiprocessing.pool import ThreadPool
+    items = list(items)
+    if not items:
+        return
+    pool = ThreadPool(max(1, min(int(jobs), len(items))))
+    try:
+        for item, result in pool.imap_unordered(lambda item: (item, func(item)), items):
+            yield item, result
+    finally:
+        pool.terminate()
+        pool.join()
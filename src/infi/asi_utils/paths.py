@@ -0,0 +1,105 @@
+"""asi-utils paths: measuring the latency and ALUA state of every path to a device
+
+A dm (multipath) device is expanded to its slaves through the sysfs device index; any other device is measured as
+a single path. All paths are measured concurrently, from a pool of --jobs threads. Each one is sent --samples
+TEST UNIT READY commands, its target port group and relative target port are read from its device identification
+page, and REPORT TARGET PORT GROUPS gives the asymmetric access state of that group. Paths are listed fastest
+(by median latency) first.
+"""
+
+from collections import OrderedDict
+
+
+def expand_paths(devices):
+    """ Returns (device, path) pairs: the slaves of dm devices, and every other device as its own path """
+    from .devices import get_device_index
+    from .simulator import SIMULATED_DEVICE_PREFIX
+    pairs = []
+    for device in devices:
+        slaves = [] if device.startswith(SIMULATED_DEVICE_PREFIX) else get_device_index().slaves(device)
+        if slaves:
+            pairs.extend((device, '/dev/' + slave) for slave in slaves)
+        else:
+            pairs.append((device, device))
+    return pairs
+
+
+def read_port_identity(asi):
+    """ Returns the target port group and relative target port of the path asi sends commands through """
+    from infi.asi.errors import AsiCheckConditionError
+    from . import build_inq_command, sync_wait
+    target_port_group = relative_target_port = None
+    try:
+        identification = sync_wait(asi, build_inq_command('0x83'), supresss_output=True)
+    except AsiCheckConditionError:
+        return target_port_group, relative_target_port
+    for designator in identification.designators_list:
+        if designator.designator_type == 0x04:
+            relative_target_port = designator.relative_target_port_identifier
+        elif designator.designator_type == 0x05:
+            target_port_group = designator.target_port_group
+    return target_port_group, relative_target_port
+
+
+def measure_path(device, path, samples):
+    from infi.asi import SCSIReadCommand
+    from infi.asi.cdb.tur import TestUnitReadyCommand
+    from infi.asi.coroutines.sync_adapter import sync_wait as _sync_wait
+    from infi.asi.errors import AsiCheckConditionError, AsiOSError, AsiSCSIError
+    from . import asi_context, read_rtpg
+    from .formatters import ALUA_STATES
+    from .stats import timer, latency_summary
+    record = OrderedDict([('device', device), ('path', path), ('target_port_group', None),
+                          ('relative_target_port', None), ('alua_state', None), ('preferred', None),
+                          ('latency', latency_summary([])), ('errors', 0), ('error', None)])
+    latencies = []
+    try:
+        with asi_context(path) as asi:
+            datagram = TestUnitReadyCommand().create_datagram()
+            for _ in range(samples):
+                start = timer()
+                try:
+                    _sync_wait(asi.call(SCSIReadCommand(datagram, 0)))
+                    latencies.append(timer() - start)
+                except AsiCheckConditionError as error:
+                    record['errors'] += 1
+                    record['error'] = str(error.sense_obj.sense_key)
+            record['target_port_group'], record['relative_target_port'] = read_port_identity(asi)
+            for descriptor in read_rtpg(asi, extended=False).descriptor_list:
+                if descriptor.target_port_group == record['target_port_group']:
+                    state = descriptor.asymetric_access_state
+                    record['alua_state'] = ALUA_STATES.get(state, hex(state))
+                    record['preferred'] = bool(descriptor.pref)
+    except AsiCheckConditionError as error:
+        record['errors'] += 1
+        record['error'] = str(error.sense_obj.sense_key)
+    except (ValueError, NotImplementedError, AsiOSError, AsiSCSIError) as error:
+        record['errors'] += 1
+        record['error'] = str(error) or type(error).__name__
+    record['latency'] = latency_summary(latencies)
+    return record
+
+
+def _order(record):
+    median = record['latency']['p50']
+    return (record['device'], median is None, median or 0.0, record['path'])
+
+
+def paths(devices, jobs, samples):
+    """ Measures every path of the devices, outputting and returning a record for each """
+    from . import ActiveOutputContext, parallel
+    samples = int(samples)
+    if samples <= 0:
+        raise ValueError("invalid number of samples: %s" % samples)
+    pairs = expand_paths(parallel.expand_devices(devices))
+    if not pairs:
+        raise ValueError("no devices matched")
+    fields = ActiveOutputContext.fields()
+
+    def run(pair):
+        device, path = pair
+        with ActiveOutputContext.scope(**dict(fields, device=path)):
+            return measure_path(device, path, samples)
+    records = sorted((record for _, record in parallel.imap_unordered(run, pairs, jobs)), key=_order)
+    ActiveOutputContext.output_result(records)
+    return records
@@ -0,0 +1,179 @@
+"""recording SCSI exchanges to a binary trace, and answering commands from one
+
+With --record=FILE, every command sent to a device is appended to FILE along with its response and latency. With
+--replay=FILE, devices are not opened: each command is answered with the next recorded exchange of the same device,
+CDB and data-out (cycling through them once they run out), after its recorded latency scaled by --replay-delay, 0
+answering as fast as possible. Any subcommand can so be profiled (--stats, --trace) against the responses, errors and
+latencies of real devices.
+
+The trace is a TRACE_MAGIC header followed by one exchange per command: a RECORD header (status, latency in seconds
+and the length of every field) followed by the device name, CDB, data-out, data-in and sense data. The status is the
+SCSI status byte, or OTHER_ERROR for executer errors, whose message is kept in place of sense data. Commands kept in
+flight by turs --queue-depth bypass the executer's call() and are neither recorded nor replayed.
+"""
+
+import struct
+import threading
+import time
+from collections import namedtuple
+
+TRACE_MAGIC = b'ASITRACE\x01'
+RECORD = struct.Struct('>BdHHHII')     # status, latency, device/cdb/sense/data-out/data-in lengths
+
+GOOD = 0x00
+CHECK_CONDITION = 0x02
+RESERVATION_CONFLICT = 0x18
+OTHER_ERROR = 0xff
+
+Exchange = namedtuple('Exchange', ['device', 'cdb', 'data_out', 'data_in', 'status', 'sense', 'latency'])
+
+
+def pack_exchange(exchange):
+    device = exchange.device.encode('utf-8')
+    return b''.join([RECORD.pack(exchange.status, exchange.latency, len(device), len(exchange.cdb),
+                                 len(exchange.sense), len(exchange.data_out), len(exchange.data_in)),
+                     device, exchange.cdb, exchange.data_out, exchange.data_in, exchange.sense])
+
+
+def read_trace(path):
+    """ Returns the exchanges of a trace """
+    try:
+        with open(path, 'rb') as fd:
+            data = fd.read()
+    except (IOError, OSError) as error:
+        raise ValueError("cannot read trace: %s" % error)
+    if not data.startswith(TRACE_MAGIC):
+        raise ValueError("not a trace: %s" % path)
+    exchanges, offset = [], len(TRACE_MAGIC)
+    while offset < len(data):
+        if offset + RECORD.size > len(data):
+            raise ValueError("truncated trace: %s" % path)
+        status, latency, device_length, cdb_length, sense_length, out_length, in_length = \
+            RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        fields = []
+        for length in (device_length, cdb_length, out_length, in_length, sense_length):
+            fields.append(data[offset:offset + length])
+            offset += length
+        if offset > len(data):
+            raise ValueError("truncated trace: %s" % path)
+        device, cdb, data_out, data_in, sense = fields
+        exchanges.append(Exchange(device.decode('utf-8'), cdb, data_out, data_in, status, sense, latency))
+    return exchanges
+
+
+class TraceRecorder(object):
+    """ Appends exchanges to a trace, from any thread """
+    def __init__(self, path):
+        super(TraceRecorder, self).__init__()
+        self.path = path
+        self._fd = open(path, 'ab')
+        self._lock = threading.Lock()
+        if self._fd.tell() == 0:
+            self._fd.write(TRACE_MAGIC)
+
+    def record(self, exchange):
+        data = pack_exchange(exchange)
+        with self._lock:
+            self._fd.write(data)
+
+    def close(self):
+        with self._lock:
+            self._fd.close()
+
+
+def _data_out(command):
+    from infi.asi import SCSIWriteCommand
+    return bytes(command.data or b'') if isinstance(command, SCSIWriteCommand) else b''
+
+
+class RecordingExecuter(object):
+    """ Wraps an executer, recording every command it sends """
+    def __init__(self, executer, recorder, device):
+        super(RecordingExecuter, self).__init__()
+        self._executer = executer
+        self._recorder = recorder
+        self._device = device
+
+    def __getattr__(self, name):
+        return getattr(self._executer, name)
+
+    def call(self, command):
+        from infi.asi.errors import AsiCheckConditionError, AsiReservationConflictError
+        from .stats import timer
+        start = timer()
+        data, status, sense = None, GOOD, b''
+        try:
+            data = yield self._executer.call(command)
+        except AsiCheckConditionError as error:
+            status, sense = CHECK_CONDITION, bytes(error.sense_buffer)
+            raise
+        except AsiReservationConflictError:
+            status = RESERVATION_CONFLICT
+            raise
+        except Exception as error:
+            status, sense = OTHER_ERROR, str(error).encode('utf-8')
+            raise
+        finally:
+            self._recorder.record(Exchange(self._device, bytes(command.command), _data_out(command),
+                                           bytes(data or b''), status, sense, timer() - start))
+        yield data
+
+
+class TraceReplay(object):
+    """ The exchanges of a trace, by device, CDB and data-out """
+    def __init__(self, path, delay=1.0):
+        super(TraceReplay, self).__init__()
+        self.delay = float(delay)
+        if self.delay < 0:
+            raise ValueError("invalid replay delay: %s" % delay)
+        self._exchanges = {}
+        self._cursors = {}
+        self._lock = threading.Lock()
+        for exchange in read_trace(path):
+            self._exchanges.setdefault((exchange.device, exchange.cdb, exchange.data_out), []).append(exchange)
+        self.devices = set(device for device, _, _ in self._exchanges)
+
+    def next_exchange(self, device, cdb, data_out):
+        key = (device, cdb, data_out)
+        exchanges = self._exchanges.get(key)
+        if not exchanges:
+            return None
+        with self._lock:
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = (cursor + 1) % len(exchanges)
+        return exchanges[cursor]
+
+    def executer(self, device):
+        if device not in self.devices:
+            raise ValueError("device not in the replayed trace: %s" % device)
+        return ReplayExecuter(self, device)
+
+
+class ReplayExecuter(object):
+    """ An executer answering from a TraceReplay """
+    def __init__(self, replay, device):
+        super(ReplayExecuter, self).__init__()
+        self._replay = replay
+        self._device = device
+
+    def call(self, command):
+        import binascii
+        from infi.asi import SCSIReadCommand
+        from infi.asi.errors import AsiCheckConditionError, AsiReservationConflictError, AsiSCSIError
+        from infi.asi.sense import get_sense_object_from_buffer
+        cdb = bytes(command.command)
+        exchange = self._replay.next_exchange(self._device, cdb, _data_out(command))
+        if exchange is None:
+            raise ValueError("no recorded response to cdb %s on %s" % (binascii.hexlify(cdb).decode(),
+                                                                         self._device))
+        if self._replay.delay:
+            time.sleep(exchange.latency * self._replay.delay)
+        if exchange.status == CHECK_CONDITION:
+            raise AsiCheckConditionError(exchange.sense, get_sense_object_from_buffer(exchange.sense))
+        elif exchange.status == RESERVATION_CONFLICT:
+            raise AsiReservationConflictError()
+        elif exchange.status != GOOD:
+            raise AsiSCSIError(exchange.sense.decode('utf-8', 'replace'))
+        expects_data = isinstance(command, SCSIReadCommand) and command.max_response_length
+        yield exchange.data_in if expects_data else None
@@ -0,0 +1,216 @@
+"""asi-utils scan: verifying (or reading) every block of a device
+
+The device is sized with READ CAPACITY (16) and its LBA range is split into --stripes stripes, which a pool of
+--workers threads, each with its own device session, takes in order. A worker sends VERIFY (16) (or READ (16)
+with --read) commands of --transfer-size blocks, keeping up to --queue-depth of them in flight from a fixed set of
+command objects that are refilled in place. Check conditions are collected with their LBA range and the scan goes on;
+any other error stops it. Every stripe is summarized (latency, throughput and check conditions), which makes up the
+per-region latency heatmap of the report. With --checkpoint, the summary of every completed stripe is saved to a
+file as soon as it completes, and a scan resumed with the same file only scans the stripes missing from it.
+"""
+
+import json
+import os
+import struct
+import threading
+from collections import OrderedDict, deque
+
+READ_16 = 0x88
+VERIFY_16 = 0x8f
+CDB_16 = struct.Struct('>BBQIBB')   # operation code, flags, lba, transfer length, group number, control
+
+
+def read_capacity(asi):
+    """ Returns the number of blocks and the block size of a device """
+    from . import build_readcap_command, sync_wait
+    capacity = sync_wait(asi, build_readcap_command(True), supresss_output=True)
+    return capacity.last_logical_block_address + 1, capacity.block_length_in_bytes
+
+
+def split_stripes(blocks, stripes):
+    """ Returns the (first lba, blocks) of stripes of equal size (but for the last) covering blocks """
+    size = max(1, -(-blocks // stripes))
+    return [(first, min(size, blocks - first)) for first in range(0, blocks, size)]
+
+
+class Checkpoint(object):
+    """ Keeps the records of the completed stripes of a scan in a json file """
+    def __init__(self, path, geometry):
+        super(Checkpoint, self).__init__()
+        self.path = path
+        self.geometry = geometry
+        self._lock = threading.Lock()
+
+    def load(self):
+        """ Returns the records of the completed stripes, by stripe index """
+        try:
+            with open(self.path) as fd:
+                checkpoint = json.load(fd)
+        except (IOError, OSError):
+            return {}
+        except ValueError:
+            raise ValueError("invalid checkpoint: %s" % self.path)
+        if checkpoint.get('geometry') != self.geometry:
+            raise ValueError("checkpoint %s is of a different scan: %s" % (self.path, checkpoint.get('geometry')))
+        return dict((record['stripe'], record) for record in checkpoint['stripes'])
+
+    def save(self, records):
+        with self._lock:
+            temporary_path = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(temporary_path, 'w') as fd:
+                json.dump(dict(geometry=self.geometry, stripes=sorted(records.values(),
+                                                                     key=lambda record: record['stripe'])), fd)
+            os.rename(temporary_path, self.path)
+
+
+class StripeScanner(object):
+    """ Scans stripes through one device session """
+    def __init__(self, asi, block_size, transfer_blocks, queue_depth, read):
+        from infi.asi import SCSIReadCommand
+        super(StripeScanner, self).__init__()
+        self.asi = asi
+        self.block_size = block_size
+        self.transfer_blocks = transfer_blocks
+        self.queue_depth = queue_depth
+        self.operation_code = READ_16 if read else VERIFY_16
+        self.read = read
+        self.commands = [SCSIReadCommand(b'', 0) for _ in range(queue_depth)]
+
+    def _prepare(self, command, lba, blocks):
+        command.command = CDB_16.pack(self.operation_code, 0, lba, blocks, 0, 0)
+        command.max_response_length = blocks * self.block_size if self.read else 0
+        return command
+
+    def _error(self, lba, blocks, error):
+        from .formatters import ErrorOutputFormatter
+        return OrderedDict([('lba', lba), ('blocks', blocks),
+                            ('error', ErrorOutputFormatter().format(error.sense_obj))])
+
+    def _pipelined(self, chunks, latencies, errors):
+        from infi.asi.coroutines.sync_adapter import sync_wait as _sync_wait
+        from infi.asi.errors import AsiCheckConditionError
+        from .stats import timer
+        free, failures = list(self.commands), []
+
+        def send(command, lba, blocks):
+            submitted = timer()
+
+            def callback(data, exception):
+                latencies.append(timer() - submitted)
+                free.append(command)
+                if isinstance(exception, AsiCheckConditionError):
+                    errors.append(self._error(lba, blocks, exception))
+                elif exception is not None:
+                    failures.append(exception)
+            _sync_wait(self.asi.send(self._prepare(command, lba, blocks), callback=callback))
+        while (chunks and not failures) or len(free) < len(self.commands):
+            while chunks and free and not failures and not self.asi.is_queue_full():
+                send(free.pop(), *chunks.popleft())
+            _sync_wait(self.asi._process_pending_response())
+        if failures:
+            raise failures[0]
+
+    def _sequential(self, chunks, latencies, errors):
+        from infi.asi.coroutines.sync_adapter import sync_wait as _sync_wait
+        from infi.asi.errors import AsiCheckConditionError
+        from .stats import timer
+        command = self.commands[0]
+        for lba, blocks in chunks:
+            submitted = timer()
+            try:
+                _sync_wait(self.asi.call(self._prepare(command, lba, blocks)))
+            except AsiCheckConditionError as error:
+                errors.append(self._error(lba, blocks, error))
+            latencies.append(timer() - submitted)
+
+    def scan(self, stripe, first, blocks):
+        """ Scans the blocks of a stripe, returning its record """
+        from .stats import timer, latency_summary
+        chunks = deque((lba, min(self.transfer_blocks, first + blocks - lba))
+                       for lba in range(first, first + blocks, self.transfer_blocks))
+        latencies, errors = [], []
+        start = timer()
+        if self.queue_depth > 1 and hasattr(self.asi, '_process_pending_response'):
+            self._pipelined(chunks, latencies, errors)
+        else:
+            self._sequential(chunks, latencies, errors)
+        elapsed = timer() - start
+        return OrderedDict([('stripe', stripe), ('first_lba', first), ('blocks', blocks),
+                            ('commands', len(latencies)), ('elapsed', elapsed),
+                            ('throughput', blocks * self.block_size / elapsed if elapsed else None),
+                            ('latency', latency_summary(latencies)),
+                            ('errors', sorted(errors, key=lambda error: error['lba']))])
+
+
+def _summary(records, elapsed, block_size):
+    """ Sums up the records of the stripes scanned by this run; the p50 and p99 latencies are only known per
+    stripe, and are left to the heatmap """
+    scanned = sum(record['blocks'] for record in records)
+    commands = sum(record['commands'] for record in records)
+    timed = [record['latency'] for record in records if record['commands']]
+    latency = dict(count=commands, min=None, avg=None, max=None)
+    if timed:
+        latency.update(min=min(summary['min'] for summary in timed), max=max(summary['max'] for summary in timed),
+                       avg=sum(summary['avg'] * summary['count'] for summary in timed) / commands)
+    return OrderedDict([('scanned_blocks', scanned), ('commands', commands), ('elapsed', elapsed),
+                        ('throughput', scanned * block_size / elapsed if elapsed else None),
+                        ('iops', commands / elapsed if elapsed else None), ('latency', latency)])
+
+
+def scan(device, workers, stripes, transfer_blocks, queue_depth, read=False, checkpoint_path=None):
+    """ Scans every block of device, outputting and returning the report """
+    from . import ActiveOutputContext, asi_context, parallel
+    from .stats import timer
+    workers, stripes = int(workers), int(stripes)
+    transfer_blocks, queue_depth = int(transfer_blocks), int(queue_depth)
+    for value, description in ((workers, 'workers'), (stripes, 'stripes'), (transfer_blocks, 'transfer size'),
+                               (queue_depth, 'queue depth')):
+        if value <= 0:
+            raise ValueError("invalid %s: %s" % (description, value))
+    with asi_context(device) as asi:
+        blocks, block_size = read_capacity(asi)
+    layout = split_stripes(blocks, stripes)
+    mode = 'read' if read else 'verify'
+    checkpoint = None
+    records = {}
+    if checkpoint_path:
+        checkpoint = Checkpoint(checkpoint_path, dict(device=device, blocks=blocks, block_size=block_size,
+                                                      stripes=stripes, mode=mode))
+        records = checkpoint.load()
+    resumed = set(records)
+    pending = deque(index for index in range(len(layout)) if index not in records)
+    fields = ActiveOutputContext.fields()
+    stopped = threading.Event()
+    lock = threading.Lock()
+
+    def work(worker):
+        with ActiveOutputContext.scope(**fields):
+            with asi_context(device) as asi:
+                scanner = StripeScanner(asi, block_size, transfer_blocks, queue_depth, read)
+                while not stopped.is_set():
+                    try:
+                        index = pending.popleft()
+                    except IndexError:
+                        return
+                    try:
+                        record = scanner.scan(index, *layout[index])
+                    except BaseException:
+                        stopped.set()
+                        raise
+                    with lock:
+                        records[index] = record
+                        if checkpoint is not None:
+                            checkpoint.save(records)
+    start = timer()
+    for _ in parallel.imap_unordered(work, range(min(workers, len(pending))), workers):
+        pass
+    elapsed = timer() - start
+    ordered = [records[index] for index in sorted(records)]
+    report = OrderedDict([('device', device), ('mode', mode), ('blocks', blocks), ('block_size', block_size),
+                          ('transfer_blocks', transfer_blocks), ('queue_depth', queue_depth), ('workers', workers),
+                          ('resumed_stripes', len(resumed))])
+    report.update(_summary([record for record in ordered if record['stripe'] not in resumed], elapsed, block_size))
+    report['errors'] = [error for record in ordered for error in record['errors']]
+    report['stripes'] = ordered
+    ActiveOutputContext.output_result(report)
+    return report
@@ -0,0 +1,133 @@
+"""asi-utils raw --script: running a sequence of CDBs in one device session
+
+Every line of a script is a step: a CDB in hex followed by any of the options
+    --request=RLEN      request up to RLEN bytes of data (data-in)
+    --send=SLEN         send SLEN bytes of data (data-out), read from --infile
+    --infile=IFILE      the file to send data from, or @previous for the data-in of the previous step
+    --outfile=OFILE     write the data-in to OFILE (appending the data-in of every repeat)
+    --repeat=N          send the step N times [default: 1]
+for example
+    # write a firmware image in one buffer and read it back
+    3b 02 00 00 00 00 00 10 00 00 --send=4096 --infile=image.bin
+    3c 02 00 00 00 00 00 10 00 00 --request=4096 --outfile=readback.bin --repeat=2
+Blank lines and everything after a # are ignored. The steps run in order, and every step is reported with its
+status and latency. A step failing with a check condition or another SCSI or OS error is reported with it, and with
+--stop-on-check the steps that follow it are skipped.
+"""
+
+import shlex
+from collections import OrderedDict
+
+STEP_OPTIONS = ('--request', '--send', '--infile', '--outfile', '--repeat')
+PREVIOUS_DATA = '@previous'
+
+
+class Step(object):
+    def __init__(self, line, cdb, request_length=0, send_length=0, input_file=None, output_file=None, repeat=1):
+        super(Step, self).__init__()
+        self.line = line
+        self.cdb = cdb
+        self.request_length = request_length
+        self.send_length = send_length
+        self.input_file = input_file
+        self.output_file = output_file
+        self.repeat = repeat
+
+
+def parse_step(line_number, line):
+    """ Parses a line of a script, returning its Step or None if it has none """
+    from . import parse_length, restore_cdb
+    tokens = shlex.split(line, comments=True)
+    if not tokens:
+        return None
+    cdb = [token for token in tokens if not token.startswith('--')]
+    options = dict(token.split('=', 1) if '=' in token else (token, None)
+                   for token in tokens if token.startswith('--'))
+    unknown = [option for option, value in options.items() if option not in STEP_OPTIONS or value is None]
+    if unknown:
+        raise ValueError("line %d: invalid option %s" % (line_number, unknown[0]))
+    if not cdb:
+        raise ValueError("line %d: no cdb" % line_number)
+    step = Step(line_number, restore_cdb(cdb),
+                request_length=parse_length(options.get('--request'), 'request length'),
+                send_length=parse_length(options.get('--send'), 'send length'),
+                input_file=options.get('--infile'),
+                output_file=options.get('--outfile'),
+                repeat=parse_length(options.get('--repeat', '1'), 'repeat count'))
+    if step.request_length and step.send_length:
+        raise ValueError("line %d: cannot both send and request data" % line_number)
+    if step.send_length and not step.input_file:
+        raise ValueError("line %d: --send requires --infile" % line_number)
+    if step.repeat < 1:
+        raise ValueError("line %d: invalid repeat count: %d" % (line_number, step.repeat))
+    return step
+
+
+def parse_script(lines):
+    steps = [parse_step(line_number, line) for line_number, line in enumerate(lines, 1)]
+    return [step for step in steps if step is not None]
+
+
+def _data_out(step, previous):
+    if step.input_file == PREVIOUS_DATA:
+        data = bytes(previous or b'')[:step.send_length]
+    else:
+        try:
+            with open(step.input_file, 'rb') as fd:
+                data = fd.read(step.send_length)
+        except (IOError, OSError) as error:
+            raise ValueError("line %d: cannot read %s: %s" % (step.line, step.input_file, error.strerror or error))
+    if len(data) != step.send_length:
+        raise ValueError("line %d: expected %d bytes of data to send, got %d" % (step.line, step.send_length,
+                                                                                  len(data)))
+    return data
+
+
+def _record(step, status, completed=0, latencies=(), bytes_in=0):
+    import binascii
+    from .stats import latency_summary
+    return OrderedDict([('line', step.line),
+                        ('cdb', binascii.hexlify(step.cdb).decode()),
+                        ('status', status),
+                        ('repeat', completed),
+                        ('bytes_in', bytes_in),
+                        ('bytes_out', step.send_length * completed),
+                        ('latency', latency_summary(latencies))])
+
+
+def run_script(asi, steps, stop_on_check=False):
+    """ Runs the steps on asi in order, returning a record of every step """
+    from infi.asi.errors import AsiCheckConditionError, AsiOSError, AsiSCSIError
+    from . import RawCommand, sync_wait
+    from .stats import timer
+    records, previous = [], None
+    for index, step in enumerate(steps):
+        data = _data_out(step, previous) if step.send_length else None
+        status, latencies, bytes_in = 'ok', [], 0
+        output_fd = open(step.output_file, 'wb') if step.output_file else None
+        try:
+            for _ in range(step.repeat):
+                start = timer()
+                try:
+                    result = sync_wait(asi, RawCommand(step.cdb, step.request_length, data), supresss_output=True)
+                except AsiCheckConditionError as error:
+                    status = 'check condition: %s (%s)' % (error.sense_obj.sense_key,
+                                                           error.sense_obj.additional_sense_code.code_name)
+                    break
+                except (AsiSCSIError, AsiOSError, OSError, IOError) as error:
+                    # e.g. a reservation conflict: the records of the steps before it are still reported
+                    status = 'error: %s' % (str(error) or type(error).__name__)
+                    break
+                latencies.append(timer() - start)
+                previous = result
+                bytes_in += len(result or b'')
+                if output_fd is not None and result:
+                    output_fd.write(result)
+        finally:
+            if output_fd is not None:
+                output_fd.close()
+        records.append(_record(step, status, len(latencies), latencies, bytes_in))
+        if status != 'ok' and stop_on_check:
+            records.extend(_record(skipped, 'skipped') for skipped in steps[index + 1:])
+            break
+    return records
@@ -0,0 +1,283 @@
+"""a simulated SCSI target, for testing and benchmarking without hardware
+
+A device named "sim:<name>" is served by a SimulatedExecuter instead of an OS executer, for example
+    asi-utils inq sim:lun0 --page=0x83
+Appending "@<seconds>" adds a fixed service latency to every command (sim:lun0@0.0005).
+Targets keep their state (registrations, reservations, log counters) for the life of the process.
+"""
+
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from infi.asi import CommandExecuterBase, SCSIWriteCommand, DEFAULT_MAX_QUEUE_SIZE
+
+SIMULATED_DEVICE_PREFIX = 'sim:'
+
+# sense keys
+MEDIUM_ERROR = 0x03
+ILLEGAL_REQUEST = 0x05
+UNIT_ATTENTION = 0x06
+# additional sense codes
+INVALID_COMMAND_OPERATION_CODE = (0x20, 0x00)
+INVALID_FIELD_IN_CDB = (0x24, 0x00)
+UNRECOVERED_READ_ERROR = (0x11, 0x00)
+LBA_OUT_OF_RANGE = (0x21, 0x00)
+
+SUPPORTED_VPD_PAGES = [0x00, 0x80, 0x83]
+SUPPORTED_LOG_PAGES = [0x00, 0x02, 0x03, 0x05, 0x06, 0x0d]
+ERROR_COUNTER_PARAMETERS = 7
+
+
+class SimulatedCheckCondition(Exception):
+    def __init__(self, sense_key, additional_sense_code):
+        super(SimulatedCheckCondition, self).__init__(sense_key, additional_sense_code)
+        asc, ascq = additional_sense_code
+        self.sense_buffer = struct.pack('>BBBIB4sBBB3s', 0x70, 0, sense_key, 0, 10, b'\x00' * 4, asc, ascq, 0,
+                                        b'\x00' * 3)
+
+
+class SimulatedTarget(object):
+    def __init__(self, name, luns=8, blocks=2097152, block_size=512, target_port_group=0, relative_target_port=1):
+        super(SimulatedTarget, self).__init__()
+        self.name = name
+        self.luns = luns
+        self.blocks = blocks
+        self.block_size = block_size
+        self.target_port_group = target_port_group
+        self.relative_target_port = relative_target_port
+        identifier = zlib.crc32(name.encode('utf-8')) & 0xffffffff
+        self.serial = ('SIM%013X' % identifier).encode('ascii')
+        self.wwn = struct.pack('>QQ', 0x6000000000000000 | identifier, 1)
+        self.alua_states = {0: 0x0, 1: 0x1}
+        self.registrations = []
+        self.reservation = None
+        self.pr_generation = 0
+        self.commands = 0
+        self.pending_unit_attention = None
+        self.medium_errors = set()      # LBAs which fail READ (16) and VERIFY (16) with a medium error
+        self._lock = threading.Lock()
+        self._handlers = {0x00: self._no_data,       # TEST UNIT READY
+                          0x12: self._inquiry,
+                          0x25: self._read_capacity_10,
+                          0x9e: self._service_action_in_16,
+                          0xa0: self._report_luns,
+                          0xa3: self._maintenance_in,
+                          0x4d: self._log_sense,
+                          0x5e: self._persistent_reserve_in,
+                          0x5f: self._persistent_reserve_out,
+                          0x56: self._no_data,     # RESERVE (10)
+                          0x57: self._no_data,     # RELEASE (10)
+                          0x28: self._read,        # READ (10)
+                          0x88: self._medium_16,   # READ (16)
+                          0x2f: self._no_data,     # VERIFY (10)
+                          0x8f: self._medium_16,   # VERIFY (16)
+                          0x3b: self._no_data,     # WRITE BUFFER
+                          0x3c: self._read}        # READ BUFFER
+
+    def execute(self, cdb, allocation_length, data=None):
+        """ Returns the data-in of a command, padded to allocation_length as an sg data buffer would be,
+        or raises SimulatedCheckCondition """
+        cdb = bytearray(cdb)
+        with self._lock:
+            self.commands += 1
+            if self.pending_unit_attention is not None and cdb[0] not in (0x12, 0xa0):
+                additional_sense_code, self.pending_unit_attention = self.pending_unit_attention, None
+                raise SimulatedCheckCondition(UNIT_ATTENTION, additional_sense_code)
+            handler = self._handlers.get(cdb[0])
+            if handler is None:
+                raise SimulatedCheckCondition(ILLEGAL_REQUEST, INVALID_COMMAND_OPERATION_CODE)
+            response = handler(cdb, data)
+        if not allocation_length:
+            return None
+        return response[:allocation_length].ljust(allocation_length, b'\x00')
+
+    def _no_data(self, cdb, data):
+        return b''
+
+    def _read(self, cdb, data):
+        return b''
+
+    def _medium_16(self, cdb, data):
+        # READ (16) and VERIFY (16) of the zeroed medium
+        lba, blocks = struct.unpack_from('>QI', bytes(cdb), 2)
+        if lba + blocks > self.blocks:
+            raise SimulatedCheckCondition(ILLEGAL_REQUEST, LBA_OUT_OF_RANGE)
+        if any(lba <= error < lba + blocks for error in self.medium_errors):
+            raise SimulatedCheckCondition(MEDIUM_ERROR, UNRECOVERED_READ_ERROR)
+        return b''
+
+    def _inquiry(self, cdb, data):
+        if not cdb[1] & 0x01:
+            return self._standard_inquiry()
+        pages = {0x00: self._supported_vpd_pages,
+                 0x80: self._unit_serial_number,
+                 0x83: self._device_identification}
+        if cdb[2] not in pages:
+            raise SimulatedCheckCondition(ILLEGAL_REQUEST, INVALID_FIELD_IN_CDB)
+        return pages[cdb[2]]()
+
+    def _standard_inquiry(self):
+        # SPC-4, HiSup, response data format 2, implicit ALUA, command queueing
+        return struct.pack('>BBBBBBBB8s16s4s', 0x00, 0x00, 0x06, 0x12, 31, 0x10, 0x00, 0x02,
+                           b'INFI-SIM', b'asi-utils target', b'0001')
+
+    def _supported_vpd_pages(self):
+        return struct.pack('>BBH', 0x00, 0x00, len(SUPPORTED_VPD_PAGES)) + bytes(bytearray(SUPPORTED_VPD_PAGES))
+
+    def _unit_serial_number(self):
+        return struct.pack('>BBH', 0x00, 0x80, len(self.serial)) + self.serial
+
+    def _device_identification(self):
+        designators = [
+            struct.pack('>BBBB', 0x01, 0x03, 0, len(self.wwn)) + self.wwn,                      # NAA, lun
+            struct.pack('>BBBBHH', 0x01, 0x14, 0, 4, 0, self.relative_target_port),             # relative port
+            struct.pack('>BBBBHH', 0x01, 0x15, 0, 4, 0, self.target_port_group),                # port group
+        ]
+        body = b''.join(designators)
+        return struct.pack('>BBH', 0x00, 0x83, len(body)) + body
+
+    def _read_capacity_10(self, cdb, data):
+        return struct.pack('>II', min(self.blocks - 1, 0xffffffff), self.block_size)
+
+    def _service_action_in_16(self, cdb, data):
+        if cdb[1] & 0x1f != 0x10:
+            raise SimulatedCheckCondition(ILLEGAL_REQUEST, INVALID_FIELD_IN_CDB)
+        return struct.pack('>QIBBH', self.blocks - 1, self.block_size, 0, 0, 0) + b'\x00' * 16
+
+    def _report_luns(self, cdb, data):
+        lun_list = b''.join(struct.pack('>HHI', lun & 0x3fff if lun < 256 else 0x4000 | lun, 0, 0)
+                            for lun in range(self.luns))
+        return struct.pack('>II', len(lun_list), 0) + lun_list
+
+    def _maintenance_in(self, cdb, data):
+        if cdb[1] & 0x1f != 0x0a:
+            raise SimulatedCheckCondition(ILLEGAL_REQUEST, INVALID_FIELD_IN_CDB)
+        descriptors = b''.join(struct.pack('>BBHBBBBHH', (0x80 if group == 0 else 0) | state, 0x8f, group, 0, 0, 0, 1,
+                                           0, group + 1)
+                               for group, state in sorted(self.alua_states.items()))
+        if cdb[1] >> 5 == 1:
+            return struct.pack('>IBBH', len(descriptors) + 4, 0x10, 0, 0) + descriptors
+        return struct.pack('>I', len(descriptors)) + descriptors
+
+    def _log_counter(self, page, parameter):
+        return (self.commands // 16 + 1) * (page + 1) * parameter if parameter else 0
+
+    def _log_sense(self, cdb, data):
+        page = cdb[2] & 0x3f
+        if page not in SUPPORTED_LOG_PAGES:
+            raise SimulatedCheckCondition(ILLEGAL_REQUEST, INVALID_FIELD_IN_CDB)
+        if page == 0x00:
+            parameters = bytes(bytearray(SUPPORTED_LOG_PAGES))
+        elif page == 0x0d:
+            parameters = struct.pack('>HBBBB', 0, 0x03, 2, 0, 35) + struct.pack('>HBBBB', 1, 0x03, 2, 0, 65)
+        elif page == 0x06:
+            parameters = struct.pack('>HBBQ', 0, 0x02, 8, self._log_counter(page, 1))
+        else:
+            parameters = b''.join(struct.pack('>HBBQ', code, 0x02, 8, self._log_counter(page, code))
+                                  for code in range(ERROR_COUNTER_PARAMETERS))
+        return struct.pack('>BBH', page, 0, len(parameters)) + parameters
+
+    def _persistent_reserve_in(self, cdb, data):
+        service_action = cdb[1] & 0x1f
+        if service_action == 0x00:
+            keys = b''.join(struct.pack('>Q', key) for key in self.registrations)
+            return struct.pack('>II', self.pr_generation, len(keys)) + keys
+        if service_action == 0x01:
+            if self.reservation is None:
+                return struct.pack('>II', self.pr_generation, 0)
+            key, pr_type = self.reservation
+            return struct.pack('>IIQIBBH', self.pr_generation, 16, key, 0, 0, pr_type & 0x0f, 0)
+        raise SimulatedCheckCondition(ILLEGAL_REQUEST, INVALID_FIELD_IN_CDB)
+
+    def _persistent_reserve_out(self, cdb, data):
+        from infi.asi.errors import AsiReservationConflictError
+        service_action, pr_type = cdb[1] & 0x1f, cdb[2] & 0x0f
+        key, service_action_key = struct.unpack('>QQ', bytes(bytearray(data or b''))[:16].ljust(16, b'\x00'))
+        if service_action == 0x00:      # REGISTER
+            if service_action_key:
+                if service_action_key not in self.registrations:
+                    self.registrations.append(service_action_key)
+            elif key in self.registrations:
+                self.registrations.remove(key)
+                if self.reservation is not None and self.reservation[0] == key:
+                    self.reservation = None
+            self.pr_generation += 1
+        elif service_action == 0x01:    # RESERVE
+            if key not in self.registrations:
+                raise AsiReservationConflictError()
+            if self.reservation is not None and self.reservation[0] != key:
+                raise AsiReservationConflictError()
+            self.reservation = (key, pr_type)
+        elif service_action == 0x02:    # RELEASE
+            if self.reservation is not None and self.reservation[0] == key:
+                self.reservation = None
+        elif service_action == 0x03:    # CLEAR
+            self.registrations, self.reservation = [], None
+            self.pr_generation += 1
+        else:
+            raise SimulatedCheckCondition(ILLEGAL_REQUEST, INVALID_FIELD_IN_CDB)
+        return b''
+
+
+_targets = {}
+_targets_lock = threading.Lock()
+
+
+def get_target(name):
+    with _targets_lock:
+        if name not in _targets:
+            _targets[name] = SimulatedTarget(name)
+        return _targets[name]
+
+
+def parse_device(device):
+    """ Splits "sim:<name>[@<latency>]" into (name, latency in seconds) """
+    name = device[len(SIMULATED_DEVICE_PREFIX):]
+    latency = 0.0
+    if '@' in name:
+        name, latency = name.rsplit('@', 1)
+        try:
+            latency = float(latency)
+        except ValueError:
+            raise ValueError("invalid simulated latency: %s" % latency)
+    return name, latency
+
+
+class SimulatedExecuter(CommandExecuterBase):
+    """ An executer answering from a SimulatedTarget. Commands may be queued, in which case their latencies
+    overlap the way they would on a real target """
+    def __init__(self, target, latency=0.0, max_queue_size=DEFAULT_MAX_QUEUE_SIZE):
+        super(SimulatedExecuter, self).__init__(max_queue_size)
+        self.target = target
+        self.latency = latency
+        self._queue = deque()
+
+    def _os_prepare_to_send(self, command, packet_index):
+        return packet_index, command
+
+    def _os_send(self, os_data):
+        self._queue.append((time.time() + self.latency, os_data))
+        yield None
+
+    def _os_receive(self):
+        due, (packet_index, command) = self._queue.popleft()
+        delay = due - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            if isinstance(command, SCSIWriteCommand):
+                result = self.target.execute(command.command, 0, command.data)
+            else:
+                result = self.target.execute(command.command, command.max_response_length)
+        except SimulatedCheckCondition as error:
+            result = self._check_condition(error.sense_buffer)
+        except Exception as error:
+            result = error
+        yield result, packet_index
+
+
+def simulated_executer(device):
+    name, latency = parse_device(device)
+    return SimulatedExecuter(get_target(name), latency)
@@ -0,0 +1,41 @@
+import time
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def percentile(sorted_values, fraction):
+    """ Nearest-rank percentile of an already sorted, non-empty sequence """
+    index = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def latency_summary(latencies):
+    """ Summarizes a sequence of latencies (in seconds) as min/avg/p50/p99/max """
+    values = sorted(latencies)
+    if not values:
+        return dict(count=0, min=None, avg=None, p50=None, p99=None, max=None)
+    return dict(count=len(values),
+                min=values[0],
+                avg=sum(values) / len(values),
+                p50=percentile(values, 0.50),
+                p99=percentile(values, 0.99),
+                max=values[-1])
+
+
+class TimingExecuter(object):
+    """ Wraps an executer, accumulating the time spent inside its call() """
+    def __init__(self, executer):
+        super(TimingExecuter, self).__init__()
+        self._executer = executer
+        self.elapsed = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self._executer, name)
+
+    def call(self, command):
+        start = timer()
+        try:
+            data = yield self._executer.call(command)
+        finally:
+            self.elapsed += timer() - start
+        yield data
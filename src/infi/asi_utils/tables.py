@@ -0,0 +1,150 @@
+"""compact results for REPORT LUNS and REPORT TARGET PORT GROUPS, built directly from the response bytes
+
+A LunTable keeps the LUN numbers of a REPORT LUNS response in an array of 16-bit integers (2 bytes per LUN), decoded
+with slicing rather than one object per LUN, and target port groups are __slots__ records. Both keep the attribute
+names of the infi.asi responses they replace (lun_list, descriptor_list, asymetric_access_state...), and the
+formatters convert them through the same per-class plans as instruct objects.
+"""
+
+import struct
+import sys
+from array import array
+from collections import OrderedDict
+from infi.asi import SCSIReadCommand
+from infi.asi.cdb.report_luns import (ReportLunsCommand, UnsupportedLunAdressing,
+                                      UnsupportedLogicalUnitAddressingMethod)
+from infi.asi.cdb.rtpg import RTPGCommand
+
+
+class Record(object):
+    """ Base class of compact records: _record_fields lists the fields the formatters output, in order """
+    __slots__ = ()
+    _record_fields = ()
+
+    def __init__(self, **fields):
+        super(Record, self).__init__()
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                setattr(self, name, fields.get(name))
+
+    def _asdict(self):
+        return OrderedDict((name, getattr(self, name)) for name in self._record_fields)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._asdict() == other._asdict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join('%s=%r' % item for item in self._asdict().items()))
+
+
+def _unsupported_lun(entries):
+    """ Raises the error infi.asi raises for the first LUN entry using multi-level or non-simple addressing """
+    for offset in range(0, len(entries), 8):
+        item = struct.unpack_from('>Q', entries, offset)[0]
+        if item & 0xFFFFFFFFFFFF:
+            raise UnsupportedLunAdressing(item)
+        if item & 0xC000000000000000:
+            raise UnsupportedLogicalUnitAddressingMethod(item)
+
+
+class LunTable(Record):
+    __slots__ = ('lun_list_length', 'lun_list')
+    _record_fields = __slots__
+
+    def __len__(self):
+        return len(self.lun_list)
+
+    def __iter__(self):
+        return iter(self.lun_list)
+
+    @classmethod
+    def from_bytes(cls, data, allow_unsupported_addressing_format=False):
+        """ Decodes a (possibly truncated) REPORT LUNS response, normalizing LUNs as infi.asi does """
+        data = bytes(data or b'')
+        lun_list_length = struct.unpack('>I', data[0:4])[0] if len(data) >= 4 else 0
+        count = max(0, min(lun_list_length, len(data) - 8)) // 8
+        entries = data[8:8 + count * 8]
+        high, low = entries[0::8], entries[1::8]
+        if not allow_unsupported_addressing_format and entries:
+            # simple addressing: only the first two bytes are set, and the top two bits of the first are clear
+            if max(bytearray(high)) >= 0x40 or any(entries[offset::8].strip(b'\x00') for offset in range(2, 8)):
+                _unsupported_lun(entries)
+        luns = bytearray(count * 2)
+        luns[0::2], luns[1::2] = high, low
+        lun_list = array('H', bytes(luns))
+        if sys.byteorder == 'little':
+            lun_list.byteswap()
+        return cls(lun_list_length=lun_list_length, lun_list=lun_list)
+
+
+class TargetPort(Record):
+    __slots__ = ('relative_target_port_identifier',)
+    _record_fields = __slots__
+
+
+class TargetPortGroup(Record):
+    __slots__ = ('asymetric_access_state', 'pref', 'ao_sup', 'an_sup', 's_sup', 'u_sup', 'lbd_sup', 'o_sup',
+                 't_sup', 'target_port_group', 'status_code', 'target_port_count', 'target_port_list')
+    _record_fields = __slots__
+
+    @classmethod
+    def from_bytes(cls, data, offset):
+        """ Decodes the descriptor at offset, returning it and the offset of the next one """
+        state, support, target_port_group, status_code, count = struct.unpack_from('>BBHxBxB', data, offset)
+        ports = [TargetPort(relative_target_port_identifier=identifier)
+                 for identifier in struct.unpack_from('>' + '2xH' * count, data, offset + 8)]
+        record = cls(asymetric_access_state=state & 0x0f, pref=state >> 7, ao_sup=support & 1,
+                     an_sup=support >> 1 & 1, s_sup=support >> 2 & 1, u_sup=support >> 3 & 1,
+                     lbd_sup=support >> 4 & 1, o_sup=support >> 6 & 1, t_sup=support >> 7,
+                     target_port_group=target_port_group, status_code=status_code, target_port_count=count,
+                     target_port_list=ports)
+        return record, offset + 8 + 4 * count
+
+
+class TargetPortGroupTable(Record):
+    __slots__ = ('data_length', 'format_type', 'descriptor_list')
+    _record_fields = ('data_length', 'descriptor_list')
+
+    @classmethod
+    def from_bytes(cls, data, extended=False):
+        """ Decodes a REPORT TARGET PORT GROUPS response in the length only or (SPC-4) extended header format,
+        skipping a descriptor truncated by the allocation length """
+        data = bytes(data or b'')
+        view = bytearray(data)
+        data_length = struct.unpack('>I', data[0:4])[0] if len(data) >= 4 else 0
+        end = min(len(data), data_length + 4)
+        descriptors, offset = [], 8 if extended else 4
+        while offset + 8 <= end and offset + 8 + 4 * view[offset + 7] <= end:
+            descriptor, offset = TargetPortGroup.from_bytes(data, offset)
+            descriptors.append(descriptor)
+        return cls(data_length=data_length, descriptor_list=descriptors,
+                   format_type=(view[4] >> 4) & 0x07 if extended and len(view) > 4 else None)
+
+
+class ExtendedTargetPortGroupTable(TargetPortGroupTable):
+    __slots__ = ()
+    _record_fields = ('data_length', 'format_type', 'descriptor_list')
+
+
+class CompactReportLunsCommand(ReportLunsCommand):
+    """ REPORT LUNS, returning a LunTable """
+    def execute(self, executer):
+        result_datagram = yield executer.call(SCSIReadCommand(self.create_datagram(), self.allocation_length))
+        yield LunTable.from_bytes(result_datagram, self.allow_unsupported_addressing_format)
+
+
+class CompactRTPGCommand(RTPGCommand):
+    """ REPORT TARGET PORT GROUPS, returning a TargetPortGroupTable (or an ExtendedTargetPortGroupTable) """
+    def __init__(self, parameter_data_format=0, allocation_length=16384):
+        super(CompactRTPGCommand, self).__init__(parameter_data_format, allocation_length)
+        self.extended = bool(parameter_data_format)
+
+    def execute(self, executer):
+        result_datagram = yield executer.call(SCSIReadCommand(self.create_datagram(), self.allocation_length))
+        if self.extended:
+            yield ExtendedTargetPortGroupTable.from_bytes(result_datagram, extended=True)
+        else:
+            yield TargetPortGroupTable.from_bytes(result_datagram)
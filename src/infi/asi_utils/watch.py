@@ -0,0 +1,162 @@
+"""asi-utils watch: polling devices on a fixed schedule, outputting only what changed
+
+Every --interval seconds, each device is sent the chosen --checks from a pool of --jobs threads, through executers
+that stay open between polls. Each poll starts at a fixed tick plus a random delay of up to JITTER of the interval,
+so that many hosts watching the same storage do not poll it in lockstep; a poll that overruns the interval skips the
+ticks it missed instead of being followed by back-to-back polls. The checks are:
+    turs            TEST UNIT READY: ok, or the sense key and additional sense code it failed with
+    alua            the asymmetric access state of every target port group (REPORT TARGET PORT GROUPS)
+    logs:<page>     the parameters of a LOG SENSE page, reported as deltas when counters change
+Each result is compared with the previous one of the same device and check, and a change record is output only
+when they differ. The first poll of every device is output as a change from nothing, as a baseline.
+"""
+
+import random
+import time
+from collections import OrderedDict
+
+JITTER = 0.1
+CHECKS = ('turs', 'alua', 'logs')
+
+
+def parse_checks(checks):
+    """ Parses a comma-separated list of checks, e.g. "turs,alua,logs:0x02", into (check, name, argument) """
+    parsed = []
+    for check in checks.split(','):
+        name, _, argument = check.strip().partition(':')
+        if name not in CHECKS:
+            raise ValueError("invalid check: %s (expected %s)" % (check, ', '.join(CHECKS)))
+        if (name == 'logs') != bool(argument):
+            raise ValueError("invalid check: %s (only logs takes a page, as in logs:0x02)" % check)
+        parsed.append((check.strip(), name, argument or None))
+    return parsed
+
+
+def poll_turs(asi, argument=None):
+    from infi.asi.cdb.tur import TestUnitReadyCommand
+    from infi.asi.errors import AsiCheckConditionError
+    from . import sync_wait
+    try:
+        sync_wait(asi, TestUnitReadyCommand(), supresss_output=True)
+    except AsiCheckConditionError as error:
+        return '%s (%s)' % (error.sense_obj.sense_key, error.sense_obj.additional_sense_code.code_name)
+    return 'ok'
+
+
+def poll_alua(asi, argument=None):
+    from . import read_rtpg
+    from .formatters import ALUA_STATES
+    return OrderedDict((str(descriptor.target_port_group),
+                        ALUA_STATES.get(descriptor.asymetric_access_state, hex(descriptor.asymetric_access_state)))
+                       for descriptor in read_rtpg(asi, extended=False).descriptor_list)
+
+
+def poll_logs(asi, page):
+    from . import read_logs
+    from .logpages import parameter_values
+    return OrderedDict(('0x%04x' % code, value) for code, value in parameter_values(read_logs(asi, page)).items())
+
+
+def _describe(error):
+    sense = getattr(error, 'sense_obj', None)
+    if sense is not None:
+        return 'error: %s (%s)' % (sense.sense_key, sense.additional_sense_code.code_name)
+    return 'error: %s' % (str(error) or type(error).__name__)
+
+
+POLLS = {'turs': poll_turs, 'alua': poll_alua, 'logs': poll_logs}
+
+
+def diff(check, previous, current):
+    """ Returns the change record of a check whose result went from previous to current, or None """
+    if previous == current:
+        return None
+    change = OrderedDict([('check', check), ('previous', previous), ('current', current)])
+    if isinstance(previous, dict) and isinstance(current, dict) and check.startswith('logs'):
+        change['delta'] = OrderedDict((code, value - previous[code]) for code, value in current.items()
+                                      if code in previous and value != previous[code])
+    return change
+
+
+class Watcher(object):
+    def __init__(self, devices, checks, jobs):
+        super(Watcher, self).__init__()
+        self.devices = devices
+        self.checks = parse_checks(checks)
+        self.jobs = jobs
+        self.results = {}
+
+    def poll_device(self, device):
+        """ Runs every check on device, returning their results by check """
+        from infi.asi.errors import AsiOSError, AsiSCSIError
+        from . import asi_context
+        results = OrderedDict()
+        try:
+            with asi_context(device) as asi:
+                for check, name, argument in self.checks:
+                    try:
+                        results[check] = POLLS[name](asi, argument)
+                    except (ValueError, AsiSCSIError) as error:
+                        results[check] = _describe(error)
+        except (NotImplementedError, AsiOSError, OSError, IOError) as error:
+            # e.g. a device node that went away: reported as a change, and reopened on the next poll
+            results.update((check, _describe(error)) for check, _, _ in self.checks)
+        return results
+
+    def poll(self):
+        """ Polls every device once, returning the change records of the results that changed """
+        from . import ActiveOutputContext, parallel
+        fields = ActiveOutputContext.fields()
+
+        def run(device):
+            with ActiveOutputContext.scope(**dict(fields, device=device)):
+                return self.poll_device(device)
+        changes = []
+        for device, results in parallel.imap_unordered(run, self.devices, self.jobs):
+            for check, current in results.items():
+                change = diff(check, self.results.get((device, check)), current)
+                self.results[(device, check)] = current
+                if change is not None:
+                    changes.append((device, change))
+        return sorted(changes, key=lambda item: item[0])
+
+    def run(self, interval, rounds=0):
+        """ Polls every interval seconds (forever if rounds is 0), outputting the changes of every poll """
+        from . import ActiveOutputContext
+        from .stats import timer
+        tick = timer()
+        completed = 0
+        while not rounds or completed < rounds:
+            for device, change in self.poll():
+                with ActiveOutputContext.scope(device=device):
+                    ActiveOutputContext.output_result(change)
+            ActiveOutputContext.flush()
+            completed += 1
+            if rounds and completed >= rounds:
+                break
+            tick += interval
+            if tick < timer():
+                # a poll ran past its interval: skip the missed ticks rather than polling back-to-back to catch up
+                tick = timer()
+            time.sleep(max(0.0, tick + random.uniform(0, JITTER * interval) - timer()))
+
+
+def watch(devices, jobs, interval, checks, rounds=0):
+    import infi.asi_utils
+    from . import parallel
+    interval, rounds = float(interval), int(rounds)
+    if interval <= 0:
+        raise ValueError("invalid interval: %s" % interval)
+    devices = parallel.expand_devices(devices)
+    if not devices:
+        raise ValueError("no devices matched")
+    watcher = Watcher(devices, checks, jobs)
+    infi.asi_utils.ActiveExecuterPool = pool = infi.asi_utils.ExecuterPool()
+    try:
+        watcher.run(interval, rounds)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        infi.asi_utils.ActiveExecuterPool = None
+        pool.close()
+    return watcher
@@ -0,0 +1,72 @@
+import asyncio
+import struct
+import unittest
+from infi.pyutils.contexts import contextmanager
+from infi.asi_utils import aio
+
+
+class FakeExecuter(object):
+    def __init__(self, device):
+        self.device = device
+        self.commands = []
+
+    def call(self, command):
+        self.commands.append(command)
+        if command.command[0:1] == b'\x25':  # READ CAPACITY (10)
+            yield struct.pack('>II', 99, 512)
+        else:
+            yield None
+
+
+@contextmanager
+def fake_open_executer(device):
+    yield FakeExecuter(device)
+
+
+class AioTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._original = aio.open_executer
+        aio.open_executer = fake_open_executer
+
+    def tearDown(self):
+        aio.open_executer = self._original
+
+    def _run(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def test_readcap(self):
+        async def readcap():
+            async with aio.AsyncDevice('/dev/sg1') as device:
+                return await device.readcap()
+        result = self._run(readcap())
+        self.assertEqual(result.last_logical_block_address, 99)
+        self.assertEqual(result.block_length_in_bytes, 512)
+
+    def test_gather(self):
+        async def tur_twice(device):
+            return await asyncio.gather(device.tur(), device.tur())
+        results = self._run(aio.gather(['/dev/sg1', '/dev/sg2'], tur_twice))
+        self.assertEqual(results, {'/dev/sg1': [True, True], '/dev/sg2': [True, True]})
+
+    def test_concurrent_commands_open_once(self):
+        opened = []
+
+        @contextmanager
+        def counting_open_executer(device):
+            opened.append(device)
+            yield FakeExecuter(device)
+        aio.open_executer = counting_open_executer
+
+        async def tur_concurrently():
+            device = aio.AsyncDevice('/dev/sg1')
+            try:
+                return await asyncio.gather(*[device.tur() for _ in range(8)])
+            finally:
+                await device.close()
+        self.assertEqual(self._run(tur_concurrently()), [True] * 8)
+        self.assertEqual(opened, ['/dev/sg1'])
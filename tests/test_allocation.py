@@ -0,0 +1,56 @@
+import unittest
+import infi.asi_utils
+from infi.asi_utils import allocation
+from infi.asi_utils.simulator import SimulatedExecuter, SimulatedTarget
+
+
+class AllocationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        allocation.forget_lengths()
+        self.target = SimulatedTarget('allocation')
+        self.executer = SimulatedExecuter(self.target)
+
+    def tearDown(self):
+        allocation.forget_lengths()
+
+    def test_lengths_from_headers(self):
+        self.assertEqual(allocation.pr_in_length(b'\x00\x00\x00\x01\x00\x00\x03\x20'), 808)
+        self.assertEqual(allocation.report_luns_length(b'\x00\x00\x00\x40\x00\x00\x00\x00'), 72)
+        self.assertEqual(allocation.rtpg_length(b'\x00\x00\x00\x10', extended=True), 24)
+        self.assertEqual(allocation.log_sense_length(b'\x02\x00\x01\x00'), 260)
+
+    def test_pr_in_remembers_required_length(self):
+        from infi.asi.cdb.persist.input import PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES as codes
+        self.target.registrations = list(range(1, 101))
+        response = infi.asi_utils.read_pr_in(self.executer, codes.READ_KEYS, device='sim:allocation')
+        self.assertEqual(len(response.key_list), 100)
+        self.assertEqual(self.target.commands, 2)
+        response = infi.asi_utils.read_pr_in(self.executer, codes.READ_KEYS, device='sim:allocation')
+        self.assertEqual(len(response.key_list), 100)
+        self.assertEqual(self.target.commands, 3)
+        self.assertEqual(allocation.remembered_length('sim:allocation', ('pr_in', codes.READ_KEYS), 0), 808)
+
+    def test_lengths_persist_in_cache(self):
+        import shutil
+        import tempfile
+        from infi.asi.cdb.persist.input import PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES as codes
+        from infi.asi_utils.cache import ResponseCache
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.target.registrations = list(range(1, 101))
+        for _ in range(2):      # the second time as a new process would, with only the cache
+            allocation.forget_lengths()
+            infi.asi_utils.ActiveResponseCache = ResponseCache(directory, 3600)
+            try:
+                infi.asi_utils.read_pr_in(self.executer, codes.READ_KEYS, device='sim:allocation')
+            finally:
+                infi.asi_utils.ActiveResponseCache = None
+        self.assertEqual(self.target.commands, 3)
+
+    def test_truncated_response_is_read_again(self):
+        build = lambda allocation_length: infi.asi_utils.build_luns_command(0, allocation_length)
+        response = allocation.read_variable_length(self.executer, 'luns', build, allocation.report_luns_length,
+                                                   16, 0xffffffff, device='sim:allocation')
+        self.assertEqual(len(response.lun_list), self.target.luns)
+        self.assertEqual(self.target.commands, 2)
@@ -0,0 +1,50 @@
+import unittest
+import infi.asi_utils
+from infi.asi_utils import audit, formatters
+from infi.asi_utils.simulator import get_target
+
+
+class AuditTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.original = infi.asi_utils.ActiveOutputContext
+        infi.asi_utils.ActiveOutputContext = infi.asi_utils.OutputContext()
+
+    def tearDown(self):
+        infi.asi_utils.ActiveOutputContext = self.original
+
+    def _register(self, name, keys, holder=None):
+        target = get_target(name)
+        target.registrations = list(keys)
+        target.reservation = None if holder is None else (holder, 0x01)
+        return 'sim:' + name
+
+    def test_compare(self):
+        self.assertEqual(audit.compare([1, 2], 2, [5, 5], [1, 2]), [])
+        self.assertEqual(audit.compare([1, 3], 3, [5, 6], [1, 2]),
+                         ['missing keys: 0x2', 'unexpected keys: 0x3', 'unexpected holder: 0x3',
+                          'generation drift: 5 -> 6'])
+        self.assertEqual(audit.compare([1, 2], 1, [5, 5], [1, 2], expected_holder=2), ['unexpected holder: 0x1'])
+        self.assertEqual(audit.compare([1, 2], None, [5, 5], [1, 2], expected_holder=2), ['no reservation'])
+
+    def test_audit(self):
+        devices = [self._register('audit-ok-%d' % index, [0x10, 0x20], 0x20) for index in range(20)]
+        devices.append(self._register('audit-missing', [0x10]))
+        devices.append(self._register('audit-holder', [0x10, 0x20], 0x30))
+        with infi.asi_utils.ActiveOutputContext.capture() as captured:
+            report = audit.audit(devices, 8, keys='0x10,0x20', holder='0x20')
+        self.assertEqual((report['devices'], report['ok'], report['mismatched'], report['failed']), (22, 20, 2, 0))
+        self.assertEqual([(record['device'], record['problems']) for record in report['problems']],
+                         [('sim:audit-holder', ['unexpected holder: 0x30']),
+                          ('sim:audit-missing', ['missing keys: 0x20', 'no reservation'])])
+        self.assertEqual(len(captured.lines), 1)
+        lines = formatters.AuditOutputFormatter().format(report).splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[-1].startswith('audited 22 devices'))
+
+    def test_dispatch_fails_on_mismatch(self):
+        device = self._register('audit-dispatch', [0x10])
+        arguments = infi.asi_utils.parse_arguments(['pr_audit', device, '--keys=0x10,0x20'])
+        with infi.asi_utils.ActiveOutputContext.capture():
+            with self.assertRaises(SystemExit):
+                infi.asi_utils.dispatch(arguments)
@@ -0,0 +1,114 @@
+import json
+import unittest
+import infi.asi_utils
+from infi.asi_utils import batch
+from infi.pyutils.contexts import contextmanager
+
+
+class BatchTestCase(unittest.TestCase):
+
+    def test_request_to_argv(self):
+        request = dict(command='inq', device='/dev/sg1', options={'page': '0x83', 'json': True, 'hex': False})
+        self.assertEqual(batch.request_to_argv(request), ['inq', '/dev/sg1', '--json', '--page=0x83'])
+        self.assertEqual(batch.request_to_argv(dict(argv=['turs', '/dev/sg1', '-n', 5])),
+                         ['turs', '/dev/sg1', '-n', '5'])
+
+    def test_invalid_json(self):
+        response = batch.handle_line('{')
+        self.assertEqual(response['status'], 'error')
+
+    def test_invalid_command(self):
+        response = batch.handle_line(json.dumps(dict(id=7, command='no_such_command', device='/dev/sg1')))
+        self.assertEqual(response['id'], 7)
+        self.assertEqual(response['status'], 'error')
+
+    def test_help_request(self):
+        import sys
+        from io import StringIO
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            response = batch.handle_line(json.dumps(dict(id=8, argv=['--help'])))
+        finally:
+            stdout, sys.stdout = sys.stdout, stdout
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertEqual(response['status'], 'error')
+
+    def test_long_running_requests(self):
+        for argv in (['scan', 'sim:batch'], ['benchmark'], ['watch', 'sim:batch'], ['batch']):
+            response = batch.handle_request(dict(id=9, argv=argv))
+            self.assertEqual(response['status'], 'error')
+            self.assertIn('unsupported in batch requests', response['errors'][0])
+
+    def test_request_output_options(self):
+        from infi.asi_utils.formatters import DictOutputFormatter
+        original = infi.asi_utils.ActiveOutputContext
+        infi.asi_utils.ActiveOutputContext = infi.asi_utils.OutputContext()
+        infi.asi_utils.ActiveOutputContext.set_formatters(DictOutputFormatter())
+        try:
+            response = batch.handle_request(dict(id=1, command='readcap', device='sim:batch', options={'json': True}))
+            self.assertEqual(response['status'], 'ok')
+            self.assertEqual(json.loads(response['results'][0])['block_length_in_bytes'], 512)
+            response = batch.handle_request(dict(id=2, command='readcap', device='sim:batch'))
+            self.assertEqual(response['results'][0]['block_length_in_bytes'], 512)
+            response = batch.handle_request(dict(id=3, command='readcap', device='sim:batch',
+                                                 options={'cache_dir': '/tmp'}))
+            self.assertEqual(response['status'], 'error')
+            self.assertEqual(response['errors'], ['--cache-dir is unsupported in batch requests'])
+        finally:
+            infi.asi_utils.ActiveOutputContext = original
+
+    def test_executer_pool_reuses_executers(self):
+        opened = []
+
+        @contextmanager
+        def open_executer(device):
+            opened.append(device)
+            yield object()
+
+        original = infi.asi_utils.open_executer
+        infi.asi_utils.open_executer = open_executer
+        pool = infi.asi_utils.ExecuterPool()
+        try:
+            with pool.executer('/dev/sg1') as first:
+                pass
+            with pool.executer('/dev/sg1') as second:
+                pass
+            self.assertIs(first, second)
+            with self.assertRaises(OSError):
+                with pool.executer('/dev/sg1'):
+                    raise OSError()
+            with pool.executer('/dev/sg1'):
+                pass
+            self.assertEqual(opened, ['/dev/sg1', '/dev/sg1'])
+        finally:
+            infi.asi_utils.open_executer = original
+            pool.close()
+
+    def test_executer_pool_opens_devices_concurrently(self):
+        import threading
+        opening, hung, opened = threading.Event(), threading.Event(), []
+
+        @contextmanager
+        def open_executer(device):
+            if device == '/dev/hung':
+                opening.set()
+                hung.wait(5)
+            opened.append(device)
+            yield object()
+
+        original = infi.asi_utils.open_executer
+        infi.asi_utils.open_executer = open_executer
+        pool = infi.asi_utils.ExecuterPool()
+        try:
+            thread = threading.Thread(target=pool._get, args=('/dev/hung',))
+            thread.start()
+            opening.wait(5)
+            with pool.executer('/dev/sg1'):
+                self.assertEqual(opened, ['/dev/sg1'])
+            hung.set()
+            thread.join()
+            self.assertEqual(opened, ['/dev/sg1', '/dev/hung'])
+        finally:
+            hung.set()
+            infi.asi_utils.open_executer = original
+            pool.close()
@@ -0,0 +1,115 @@
+import unittest
+import infi.asi_utils
+from infi.asi_utils import bulk, formatters
+from infi.asi_utils.simulator import get_target
+
+
+class BulkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.original = infi.asi_utils.ActiveOutputContext
+        infi.asi_utils.ActiveOutputContext = infi.asi_utils.OutputContext()
+
+    def tearDown(self):
+        infi.asi_utils.ActiveOutputContext = self.original
+
+    def _targets(self, prefix, count):
+        targets = [get_target('%s-%d' % (prefix, index)) for index in range(count)]
+        for target in targets:
+            target.registrations, target.reservation = [], None
+        return targets, ['sim:' + target.name for target in targets]
+
+    def _bulk(self, *args, **kwargs):
+        with infi.asi_utils.ActiveOutputContext.capture():
+            return bulk.bulk(*args, **kwargs)
+
+    def test_register_and_reserve(self):
+        targets, devices = self._targets('bulk', 10)
+        report = self._bulk(devices, 4, 'register', '0x10')
+        self.assertEqual((report['ok'], report['failed']), (10, 0))
+        report = self._bulk(devices, 4, 'reserve', '0x10')
+        self.assertEqual(report['ok'], 10)
+        self.assertEqual([target.reservation[0] for target in targets], [0x10] * 10)
+        self.assertEqual([record['device'] for record in report['results']], devices)
+
+    def test_dry_run(self):
+        targets, devices = self._targets('bulk-dry', 3)
+        targets[0].registrations = [0x10]
+        report = self._bulk(devices, 4, 'unregister', '0x10', dry_run=True)
+        self.assertEqual(report['reachable'], 3)
+        self.assertEqual([record['registered'] for record in report['results']], [True, False, False])
+        self.assertEqual(targets[0].registrations, [0x10])
+        self.assertTrue(formatters.BulkOutputFormatter().format(report).endswith('3 reachable (dry run)'))
+
+    def test_rollback(self):
+        targets, devices = self._targets('bulk-rollback', 4)
+        for target in targets:
+            target.registrations = [0x10, 0x20]
+        targets[2].reservation = (0x20, 0x01)
+        report = self._bulk(devices, 4, 'reserve', '0x10', rollback=True)
+        self.assertEqual((report['ok'], report['failed'], report['rolled_back']), (0, 1, 3))
+        self.assertEqual(report['results'][2]['error'], 'reservation conflict')
+        self.assertEqual([target.reservation for target in targets], [None, None, (0x20, 0x01), None])
+
+    def test_rollback_leaves_previous_state(self):
+        targets, devices = self._targets('bulk-previous', 4)
+        for target in targets:
+            target.registrations = [0x10, 0x20]
+        targets[0].reservation = (0x10, 0x01)
+        targets[2].reservation = (0x20, 0x01)
+        report = self._bulk(devices, 4, 'reserve', '0x10', rollback=True)
+        self.assertEqual((report['ok'], report['failed'], report['rolled_back']), (1, 1, 2))
+        self.assertFalse(report['results'][0]['changed'])
+        self.assertEqual([target.reservation for target in targets], [(0x10, 0x01), None, (0x20, 0x01), None])
+
+    def test_rollback_keeps_registered_keys(self):
+        targets, devices = self._targets('bulk-registered', 3)
+        targets[0].registrations = [0x10]
+        targets[2].pending_unit_attention = (0x2a, 0x03)
+        report = self._bulk(devices, 4, 'register', '0x10', rollback=True)
+        self.assertEqual((report['ok'], report['failed'], report['rolled_back']), (1, 1, 1))
+        self.assertEqual([target.registrations for target in targets], [[0x10], [], []])
+
+    def test_reads_state_only_for_rollback(self):
+        targets, devices = self._targets('bulk-reads', 1)
+        commands = targets[0].commands
+        report = self._bulk(devices, 1, 'register', '0x10')
+        self.assertEqual(targets[0].commands - commands, 1)
+        self.assertNotIn('changed', report['results'][0])
+        self._bulk(devices, 1, 'unregister', '0x10', rollback=True)
+        self.assertEqual(targets[0].commands - commands, 4)
+
+    def test_rollback_restores_reservation(self):
+        targets, devices = self._targets('bulk-reservation', 3)
+        for target in targets:
+            target.registrations = [0x10, 0x20]
+        targets[0].reservation = (0x10, 0x05)
+        targets[2].pending_unit_attention = (0x2a, 0x03)
+        report = self._bulk(devices, 4, 'unregister', '0x10', rollback=True)
+        self.assertEqual((report['failed'], report['rolled_back'], report['rollback_incomplete']), (1, 2, 0))
+        self.assertEqual(targets[0].reservation, (0x10, 0x05))
+        self.assertIn(0x10, targets[0].registrations)
+
+    def test_rollback_incomplete(self):
+        targets, devices = self._targets('bulk-incomplete', 2)
+        for target in targets:
+            target.registrations = [0x10, 0x20]
+        targets[0].reservation = (0x10, 0x05)
+        targets[1].pending_unit_attention = (0x2a, 0x03)
+
+        def _apply(devices, jobs, action, key, dry_run=False, rollback=False, pr_type=1):
+            if action == 'reserve':
+                targets[0].reservation = (0x20, 0x05)   # taken over by another host before the rollback
+            return original_apply(devices, jobs, action, key, dry_run, rollback, pr_type)
+        original_apply, bulk._apply = bulk._apply, _apply
+        try:
+            report = self._bulk(devices, 4, 'unregister', '0x10', rollback=True)
+        finally:
+            bulk._apply = original_apply
+        self.assertEqual(report['rollback_incomplete'], 1)
+        self.assertEqual(report['results'][0]['error'], 'reservation not restored: reservation conflict')
+        self.assertIn('1 rollback incomplete', formatters.BulkOutputFormatter().format(report))
+
+    def test_invalid_action(self):
+        with self.assertRaises(ValueError):
+            self._bulk(['sim:bulk-invalid'], 1, 'preempt', '0x10')
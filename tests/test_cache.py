@@ -0,0 +1,70 @@
+import shutil
+import tempfile
+import unittest
+from infi.asi import SCSIReadCommand
+from infi.asi.coroutines.sync_adapter import sync_wait
+from infi.asi.errors import AsiCheckConditionError
+from infi.asi_utils.cache import ResponseCache, CachingExecuter
+
+STANDARD_INQUIRY = b'\x12\x00\x00\x00\xdb\x00'
+SERIAL_NUMBER_PAGE = b'\x12\x01\x80\x00\xff\x00'
+TEST_UNIT_READY = b'\x00' * 6
+
+
+class UnitAttention(object):
+    sense_key = 'UNIT_ATTENTION'
+
+
+class CountingExecuter(object):
+    def __init__(self):
+        self.calls = 0
+        self.unit_attention = False
+
+    def call(self, command):
+        self.calls += 1
+        if self.unit_attention:
+            raise AsiCheckConditionError(b'', UnitAttention())
+        yield b'response %d' % self.calls
+
+
+class CacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.executer = CountingExecuter()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _call(self, executer, cdb, length=255):
+        return sync_wait(executer.call(SCSIReadCommand(cdb, length)))
+
+    def test_cached_across_instances(self):
+        executer = CachingExecuter(self.executer, ResponseCache(self.directory, 60), '/dev/sg1')
+        self.assertEqual(self._call(executer, STANDARD_INQUIRY), b'response 1')
+        self.assertEqual(self._call(executer, STANDARD_INQUIRY), b'response 1')
+        self.assertEqual(self._call(executer, SERIAL_NUMBER_PAGE), b'response 2')
+        executer = CachingExecuter(self.executer, ResponseCache(self.directory, 60), '/dev/sg1')
+        self.assertEqual(self._call(executer, STANDARD_INQUIRY), b'response 1')
+        self.assertEqual(self.executer.calls, 2)
+
+    def test_not_cacheable(self):
+        executer = CachingExecuter(self.executer, ResponseCache(self.directory, 60), '/dev/sg1')
+        self._call(executer, TEST_UNIT_READY, 0)
+        self._call(executer, TEST_UNIT_READY, 0)
+        self.assertEqual(self.executer.calls, 2)
+
+    def test_expired(self):
+        executer = CachingExecuter(self.executer, ResponseCache(self.directory, -1), '/dev/sg1')
+        self._call(executer, STANDARD_INQUIRY)
+        self.assertEqual(self._call(executer, STANDARD_INQUIRY), b'response 2')
+
+    def test_unit_attention_invalidates(self):
+        cache = ResponseCache(self.directory, 60)
+        executer = CachingExecuter(self.executer, cache, '/dev/sg1')
+        self._call(executer, STANDARD_INQUIRY)
+        self.executer.unit_attention = True
+        with self.assertRaises(AsiCheckConditionError):
+            self._call(executer, SERIAL_NUMBER_PAGE)
+        self.executer.unit_attention = False
+        self.assertEqual(self._call(executer, STANDARD_INQUIRY), b'response 3')
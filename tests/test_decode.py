@@ -0,0 +1,89 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+import infi.asi_utils
+from infi.asi_utils import build_inq_command, build_luns_command, decode
+from infi.asi_utils.simulator import get_target
+
+
+class DecodeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.original = infi.asi_utils.ActiveOutputContext
+        infi.asi_utils.ActiveOutputContext = infi.asi_utils.OutputContext()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def tearDown(self):
+        infi.asi_utils.ActiveOutputContext = self.original
+
+    def capture(self, name, command, allocation_length):
+        data = get_target('decode').execute(command.create_datagram(), allocation_length)
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as fd:
+            fd.write(data)
+        return path
+
+    def decode(self, captures, command, **options):
+        with infi.asi_utils.ActiveOutputContext.capture() as captured:
+            failed = decode.decode(captures, command, **options)
+        return failed, [string for string, _ in captured.lines]
+
+    def test_decode_directory(self):
+        os.makedirs(os.path.join(self.directory, 'luns'))
+        self.capture('luns/a', build_luns_command(0), 16384)
+        self.capture('luns/b', build_luns_command(0), 16384)
+        infi.asi_utils.ActiveOutputContext.set_result_formatter(infi.asi_utils.get_result_formatter('luns'))
+        failed, lines = self.decode([os.path.join(self.directory, 'luns')], 'luns')
+        self.assertEqual(failed, 0)
+        self.assertEqual(lines[0], os.path.join(self.directory, 'luns', 'a') + ':')
+        self.assertEqual(lines[2], os.path.join(self.directory, 'luns', 'b') + ':')
+        self.assertEqual(lines[1], lines[3])
+
+    def test_decode_archives_with_pool(self):
+        paths = [self.capture('page%d' % index, build_inq_command('0x83'), 255) for index in range(8)]
+        with tarfile.open(os.path.join(self.directory, 'bundle.tar.gz'), 'w:gz') as archive:
+            for path in paths:
+                archive.add(path, os.path.basename(path))
+        with zipfile.ZipFile(os.path.join(self.directory, 'bundle.zip'), 'w') as archive:
+            for path in paths:
+                archive.write(path, os.path.basename(path))
+        infi.asi_utils.ActiveOutputContext.set_ndjson()
+        captures = [os.path.join(self.directory, 'bundle.tar.gz'), os.path.join(self.directory, 'bundle.zip')]
+        inline = self.decode(captures, 'inq', page='0x83')
+        original_inline_payloads = decode.INLINE_PAYLOADS
+        decode.INLINE_PAYLOADS = 0
+        try:
+            pooled = self.decode(captures, 'inq', processes=2, page='0x83')
+        finally:
+            decode.INLINE_PAYLOADS = original_inline_payloads
+        self.assertEqual(inline[0], 0)
+        self.assertEqual(len(inline[1]), 16)
+        strip = lambda lines: [line.split('"timestamp"')[0] for line in lines]
+        self.assertEqual(strip(inline[1]), strip(pooled[1]))
+        self.assertIn('bundle.zip:page7', inline[1][-1])
+
+    def test_decode_failures(self):
+        path = os.path.join(self.directory, 'short')
+        with open(path, 'wb') as fd:
+            fd.write(b'\x02\x00')
+        failed, lines = self.decode([path], 'logs')
+        self.assertEqual(failed, 1)
+        self.assertEqual(lines, ['%s: truncated log page: 2 bytes' % path])
+        self.assertRaises(ValueError, self.decode, [path], 'turs')
+        self.assertRaises(ValueError, self.decode, [os.path.join(self.directory, 'missing')], 'logs')
+
+    def test_decode_log_page_in_hex(self):
+        from infi.asi_utils.formatters import HexOutputFormatter
+        path = os.path.join(self.directory, 'page2')
+        payload = b'\x02\x00\x00\x08\x00\x05\x00\x04\x00\x00\x01\x00'
+        with open(path, 'wb') as fd:
+            fd.write(payload)
+        infi.asi_utils.ActiveOutputContext.set_formatters(HexOutputFormatter())
+        failed, lines = self.decode([path], 'logs')
+        self.assertEqual(failed, 0)
+        self.assertEqual(lines[0], '%s:' % path)
+        self.assertEqual(lines[1], HexOutputFormatter().format(payload))
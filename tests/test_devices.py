@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+from infi.asi_utils.devices import DeviceIndex
+
+
+class DeviceIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.index = DeviceIndex(self.root, check_interval=0)
+        for sg, sd in (('sg0', 'sda'), ('sg1', 'sdb'), ('sg2', 'sdc')):
+            self._add_sg(sg, sd)
+        self._add_dm('dm-0', 'mpatha', ['sdc', 'sdb'])
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _makedirs(self, *parts):
+        path = os.path.join(self.root, *parts)
+        os.makedirs(path)
+        return path
+
+    def _add_sg(self, sg, sd):
+        self._makedirs('class', 'scsi_generic', sg, 'device', 'block', sd)
+        self._makedirs('block', sd)
+
+    def _add_dm(self, dm, name, slaves):
+        for slave in slaves:
+            self._makedirs('block', dm, 'slaves', slave)
+        with open(os.path.join(self._makedirs('block', dm, 'dm'), 'name'), 'w') as fd:
+            fd.write(name + '\n')
+
+    def test_sd_to_sg(self):
+        self.assertEqual(self.index.resolve('/dev/sdb'), '/dev/sg1')
+        self.assertEqual(self.index.resolve('/dev/sdb2'), '/dev/sg1')
+        self.assertEqual(self.index.resolve('/dev/sg2'), '/dev/sg2')
+        with self.assertRaises(ValueError):
+            self.index.resolve('/dev/sdz')
+
+    def test_dm_paths(self):
+        self.assertEqual(self.index.resolve('/dev/dm-0'), '/dev/dm-0')
+        self.assertEqual(self.index.slaves('/dev/mapper/mpatha'), ['sdb', 'sdc'])
+        self.assertEqual(self.index.resolve('/dev/dm-0', 'sdc'), '/dev/sg2')
+        self.assertEqual(self.index.resolve('/dev/mapper/mpatha', '0'), '/dev/sg1')
+        self.assertEqual([self.index.resolve('/dev/dm-0', 'round-robin') for _ in range(3)],
+                         ['/dev/sg1', '/dev/sg2', '/dev/sg1'])
+        with self.assertRaises(ValueError):
+            self.index.resolve('/dev/dm-0', 'sda')
+
+    def test_rebuilt_when_devices_change(self):
+        self.assertNotIn('sdd', self.index.sd_to_sg)
+        self._add_sg('sg3', 'sdd')
+        self.assertEqual(self.index.resolve('/dev/sdd'), '/dev/sg3')
+
+    def test_not_rebuilt_within_check_interval(self):
+        index = DeviceIndex(self.root, check_interval=3600)
+        index.refresh()
+        self._add_sg('sg3', 'sdd')
+        with self.assertRaises(ValueError):
+            index.resolve('/dev/sdd')
+        index.refresh(force=True)
+        self.assertEqual(index.resolve('/dev/sdd'), '/dev/sg3')
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+import infi.asi_utils
+from infi.asi_utils import instrumentation
+
+
+class RecordingHook(object):
+    def __init__(self):
+        self.events = []
+        self.closed = False
+
+    def event(self, event):
+        self.events.append(event)
+
+    def close(self):
+        self.closed = True
+
+
+class InstrumentationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.original = infi.asi_utils.ActiveOutputContext
+        infi.asi_utils.ActiveOutputContext = infi.asi_utils.OutputContext()
+        self.hook = RecordingHook()
+        infi.asi_utils.ActiveOutputContext.add_hook(self.hook)
+
+    def tearDown(self):
+        infi.asi_utils.ActiveOutputContext = self.original
+        shutil.rmtree(self.directory)
+
+    def _run(self, argv):
+        with infi.asi_utils.ActiveOutputContext.capture():
+            infi.asi_utils.dispatch(infi.asi_utils.parse_arguments(argv))
+
+    def test_events(self):
+        self._run(['readcap', 'sim:instrumented'])
+        kinds = [event.kind for event in self.hook.events]
+        self.assertEqual(kinds, ['open', 'execute', 'parse', 'format', 'close'])
+        execute = self.hook.events[1]
+        self.assertEqual((execute.device, execute.command, execute.operation), ('sim:instrumented', 'readcap', '0x25'))
+        self.assertEqual(execute.bytes_in, 8)
+        infi.asi_utils.ActiveOutputContext.close_hooks()
+        self.assertTrue(self.hook.closed)
+
+    def test_sinks(self):
+        prometheus_path = os.path.join(self.directory, 'asi_utils.prom')
+        csv_path = os.path.join(self.directory, 'trace.csv')
+        infi.asi_utils.ActiveOutputContext.add_hook(instrumentation.PrometheusSink(prometheus_path))
+        infi.asi_utils.ActiveOutputContext.add_hook(instrumentation.CsvSink(csv_path))
+        self._run(['inq', 'sim:instrumented', '--page=0x80'])
+        infi.asi_utils.ActiveOutputContext.close_hooks()
+        with open(prometheus_path) as fd:
+            metrics = fd.read()
+        self.assertIn('asi_utils_event_seconds_count{device="sim:instrumented",command="inq",event="execute"} 1',
+                      metrics)
+        self.assertIn('asi_utils_bytes_total{device="sim:instrumented",command="inq",event="execute",direction="in"}',
+                      metrics)
+        families = [line.split('{')[0].replace('_count', '').replace('_sum', '')
+                    for line in metrics.splitlines() if not line.startswith('#')]
+        self.assertEqual(families, sorted(families, key=['asi_utils_event_seconds', 'asi_utils_bytes_total'].index))
+        self.assertLess(metrics.index('# TYPE asi_utils_bytes_total'), metrics.index('asi_utils_bytes_total{'))
+        with open(csv_path) as fd:
+            rows = fd.read().splitlines()
+        self.assertEqual(rows[0], ','.join(instrumentation.Event._fields))
+        self.assertEqual(len(rows), 1 + len(self.hook.events))
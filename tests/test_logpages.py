@@ -0,0 +1,44 @@
+import shutil
+import struct
+import tempfile
+import unittest
+from infi.asi_utils import logpages
+from infi.asi_utils.simulator import SimulatedExecuter, SimulatedTarget
+
+
+class LogPagesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.target = SimulatedTarget('logpages')
+        self.executer = SimulatedExecuter(self.target)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_parse(self):
+        parameters = struct.pack('>HBBI', 0x0006, 0x02, 4, 7) + struct.pack('>HBBH', 0x8000, 0x03, 2, 1)
+        data = struct.pack('>BBH', 0x03, 0, len(parameters)) + parameters + b'\x00' * 16
+        self.assertEqual(list(logpages.parameter_values(data).items()), [(0x0006, 7), (0x8000, 1)])
+        self.assertEqual(logpages.counter_names(0x03, logpages.parameter_values(data)),
+                         [('read_errors.total_uncorrected', 7, True), ('read_errors.0x8000', 1, True)])
+        self.assertEqual(logpages.supported_pages(b'\x00\x00\x00\x03\x00\x02\x0d' + b'\x00' * 8), [0x00, 0x02, 0x0d])
+
+    def test_rates(self):
+        previous = dict(timestamp=10.0, values={'read_errors.total_corrected': 4, 'temperature.temperature': 30})
+        sample = dict(timestamp=12.0, values={'read_errors.total_corrected': 10, 'temperature.temperature': 35})
+        interval, rates = logpages.rates(previous, sample, {'read_errors.total_corrected'})
+        self.assertEqual((interval, dict(rates)), (2.0, {'read_errors.total_corrected': 3.0}))
+        self.assertEqual(logpages.rates(None, sample, set()), (None, {}))
+
+    def test_sample_device(self):
+        store = logpages.SampleStore(self.directory)
+        first = logpages.sample_device(self.executer, 'sim:logpages', store)
+        self.assertIsNone(first['interval'])
+        self.assertIn('non_medium_errors.count', first['counters'])
+        self.assertEqual(first['counters']['temperature.temperature'], 35)
+        self.target.commands += 64
+        second = logpages.sample_device(self.executer, 'sim:logpages', store)
+        self.assertGreater(second['interval'], 0)
+        self.assertIn('read_errors.total_uncorrected', second['rates'])
+        self.assertNotIn('temperature.temperature', second['rates'])
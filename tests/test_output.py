@@ -60,3 +60,70 @@ class OutputTestCase(unittest.TestCase):
         output.set_formatters(formatters.HexOutputFormatter())
         output.output_result(_buffer)
         self.assertEqual(output.stdout.getvalue(), '00000000: 00                                                .')
+
+    def test_hex__matches_hexdump(self):
+        from hexdump import hexdump
+        data = bytes(bytearray(range(256))) * 3
+        for length in (1, 8, 9, 15, 16, 17, 100, len(data)):
+            self.assertEqual(formatters.HexOutputFormatter().format(data[:length]),
+                             hexdump(data[:length], result='return'))
+
+    def test_hex__streams_blocks(self):
+        data = b'\x41' * (formatters.HEXDUMP_BLOCK_SIZE + 16)
+        pieces = list(formatters.HexOutputFormatter().iter_format(data))
+        self.assertEqual(len(pieces), 2)
+        self.assertEqual(pieces[1], '%08X: %s  %s  %s' % (formatters.HEXDUMP_BLOCK_SIZE, ' '.join(['41'] * 8),
+                                                          ' '.join(['41'] * 8), 'A' * 16))
+
+    def test_obsolete_inquiry_bits(self):
+        class StandardInquiry(object):
+            def pack(self):
+                return b'\x00\x00\x00\x80\x00\x00\x24\x8c'
+        bits = formatters.InqOutputFormatter()._fill_missing_values(StandardInquiry())
+        self.assertEqual(bits, dict(aerc='1', trmtsk='0', bque='0', vs='1', mchngr='0', ackreqq='1',
+                                    reladr='1', linked='1', trandis='1'))
+
+    def test_default__matches_json(self):
+        from json import dumps
+        formatter = formatters.DefaultOutputFormatter()
+        for item in (_struct, _buffer, [_buffer, _struct], {}, [], {'a': [1, 2.5, None, True], 'b': {'c': 'x, "y"'}},
+                     {'nested': {'empty': {}, 'list': []}}, b'\x01\x02', 'text\n', {1: 'non-string key'}):
+            expected = dumps(formatter._to_dict(item), indent=4, sort_keys=True).replace('"', '').replace(',', '')
+            self.assertEqual(formatter.format(item), expected)
+
+    def test_to_dict_plans_are_cached(self):
+        formatters.OutputFormatter()._to_dict(_buffer)
+        plan = formatters._to_dict_plans[MyBuffer]
+        self.assertEqual([name for name, getter in plan], ['x'])
+        formatters.OutputFormatter()._to_dict(MyBuffer(x=1))
+        self.assertIs(formatters._to_dict_plans[MyBuffer], plan)
+
+    def test_ndjson(self):
+        import json
+        stream = six.moves.StringIO()
+        output = infi.asi_utils.OutputContext()
+        output.set_ndjson(file=stream)
+        with output.scope(device='/dev/sg1', command='inq'):
+            output.update_fields(latency=0.5)
+            output.output_result(_buffer)
+            output.output_result({'x': [1, 2]})
+        self.assertEqual(stream.getvalue(), '')
+        output.flush()
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['device'], '/dev/sg1')
+        self.assertEqual(records[0]['command'], 'inq')
+        self.assertEqual(records[0]['latency'], 0.5)
+        self.assertEqual(records[0]['result'], {'x': 0})
+        self.assertEqual(records[1]['result'], {'x': [1, 2]})
+        self.assertEqual(list(records[1].keys()), ['device', 'command', 'timestamp', 'latency', 'result'])
+        self.assertEqual(output.fields(), {})
+
+    def test_line_writer_flushes_in_batches(self):
+        stream = six.moves.StringIO()
+        writer = infi.asi_utils.LineWriter(stream, flush_interval=3600, max_lines=3)
+        writer.write('a')
+        writer.write('b')
+        self.assertEqual(stream.getvalue(), '')
+        writer.write('c')
+        self.assertEqual(stream.getvalue(), 'a\nb\nc\n')
@@ -0,0 +1,60 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import infi.asi_utils
+from infi.asi_utils import parallel
+
+
+def _echo(device, suffix=''):
+    if device == 'bad':
+        raise ValueError("invalid device")
+    infi.asi_utils.ActiveOutputContext.output_result(device + suffix)
+
+
+class ParallelTestCase(unittest.TestCase):
+
+    def test_expand_devices(self):
+        directory = tempfile.mkdtemp()
+        try:
+            for name in ('sg1', 'sg0', 'sda'):
+                open(os.path.join(directory, name), 'w').close()
+            pattern = os.path.join(directory, 'sg*')
+            self.assertEqual(parallel.expand_devices(['x', pattern]),
+                             ['x', os.path.join(directory, 'sg0'), os.path.join(directory, 'sg1')])
+            self.assertRaises(ValueError, parallel.expand_devices, ['x', os.path.join(directory, 'hd*')])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_imap_unordered(self):
+        results = dict(parallel.imap_unordered(lambda item: item * 2, range(10), jobs=3))
+        self.assertEqual(results, dict((item, item * 2) for item in range(10)))
+
+    def test_run_on_devices__tags_output(self):
+        context = infi.asi_utils.ActiveOutputContext
+        with context.capture() as captured:
+            infi.asi_utils.run_on_devices(_echo, ['a', 'b'], jobs=2, suffix='!')
+        lines = [string for string, _ in captured.lines]
+        self.assertEqual(sorted(lines), sorted(['a:', 'a!', 'b:', 'b!']))
+        self.assertEqual(lines.index('a:') + 1, lines.index('a!'))
+
+    def test_run_on_devices__failure(self):
+        context = infi.asi_utils.ActiveOutputContext
+        with context.capture() as captured:
+            with self.assertRaises(SystemExit):
+                infi.asi_utils.run_on_devices(_echo, ['a', 'bad'], jobs=2)
+        self.assertIn(('bad: invalid device', sys.stderr), captured.lines)
+
+    def test_run_on_devices__unparsable_response(self):
+        from infi.asi_utils.simulator import get_target
+        get_target('many-luns').luns = 300
+        context = infi.asi_utils.ActiveOutputContext
+        with context.capture() as captured:
+            with self.assertRaises(SystemExit):
+                infi.asi_utils.run_on_devices(infi.asi_utils.luns, ['sim:few-luns', 'sim:many-luns'], jobs=1,
+                                              select_report=0)
+        lines = [string for string, _ in captured.lines]
+        self.assertIn('sim:few-luns:', lines)
+        self.assertTrue(any(string.startswith('sim:many-luns: UnsupportedLogicalUnitAddressingMethod')
+                            for string in lines))
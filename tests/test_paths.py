@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import unittest
+import infi.asi_utils
+from infi.asi_utils import devices, formatters, paths
+from infi.asi_utils.simulator import get_target
+
+
+class PathsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.original = infi.asi_utils.ActiveOutputContext
+        infi.asi_utils.ActiveOutputContext = infi.asi_utils.OutputContext()
+
+    def tearDown(self):
+        infi.asi_utils.ActiveOutputContext = self.original
+
+    def test_expand_dm_slaves(self):
+        root = tempfile.mkdtemp()
+        original_index = devices._index
+        try:
+            for slave in ('sdc', 'sdb'):
+                os.makedirs(os.path.join(root, 'block', 'dm-0', 'slaves', slave))
+            devices._index = devices.DeviceIndex(root)
+            self.assertEqual(paths.expand_paths(['/dev/dm-0', '/dev/sg5', 'sim:path']),
+                             [('/dev/dm-0', '/dev/sdb'), ('/dev/dm-0', '/dev/sdc'), ('/dev/sg5', '/dev/sg5'),
+                              ('sim:path', 'sim:path')])
+        finally:
+            devices._index = original_index
+            shutil.rmtree(root)
+
+    def test_paths(self):
+        get_target('path-fast').target_port_group = 1
+        with infi.asi_utils.ActiveOutputContext.capture() as captured:
+            records = paths.paths(['sim:path-slow@0.003', 'sim:path-fast'], 2, samples=3)
+        self.assertEqual(len(captured.lines), 1)
+        slow, fast = sorted(records, key=lambda record: record['path'], reverse=True)
+        self.assertEqual((slow['target_port_group'], slow['alua_state'], slow['preferred']),
+                         (0, 'active/optimized', True))
+        self.assertEqual((fast['target_port_group'], fast['alua_state']), (1, 'active/non-optimized'))
+        self.assertEqual(slow['latency']['count'], 3)
+        self.assertGreater(slow['latency']['p50'], fast['latency']['p50'])
+        lines = formatters.PathsOutputFormatter().format(records).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn('active/optimized (preferred)', lines[1] + lines[2])
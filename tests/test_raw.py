@@ -0,0 +1,93 @@
+import io
+import unittest
+import infi.asi_utils
+from infi.asi_utils.cdbs import advance_cdb, chunk_cdb
+
+READ_16 = bytes(bytearray([0x88, 0, 0, 0, 0, 0, 0, 0, 0, 0x10, 0, 0, 0, 8, 0, 0]))
+WRITE_BUFFER = bytes(bytearray([0x3b, 0x07, 0, 0, 0, 0, 0, 0, 0, 0]))
+READ_BUFFER = bytes(bytearray([0x3c, 0x02, 0, 0, 0, 0, 0, 0, 0, 0]))
+
+
+class RecordingExecuter(object):
+    def __init__(self):
+        self.commands = []
+
+    def call(self, command):
+        self.commands.append(command)
+        yield getattr(command, 'max_response_length', 0) * b'\xab'
+
+
+class RawTestCase(unittest.TestCase):
+
+    def test_advance_lba(self):
+        cdb = bytearray(advance_cdb(READ_16, 3, 4096))
+        self.assertEqual(cdb[2:10], bytearray([0, 0, 0, 0, 0, 0, 0, 0x10 + 3 * 8]))
+        self.assertEqual(cdb[10:14], bytearray([0, 0, 0, 8]))
+
+    def test_advance_buffer_offset(self):
+        cdb = bytearray(chunk_cdb(WRITE_BUFFER, 0x2000, 0x1000))
+        self.assertEqual(cdb[3:6], bytearray([0, 0x20, 0]))
+        self.assertEqual(cdb[6:9], bytearray([0, 0x10, 0]))
+
+    def test_stream_send(self):
+        executer = RecordingExecuter()
+        data = bytes(bytearray(range(256))) * 16
+        infi.asi_utils.stream_raw(executer, WRITE_BUFFER, 0, len(data), io.BytesIO(data), None,
+                                  count=None, chunk_size=1024)
+        self.assertEqual(len(executer.commands), 4)
+        self.assertEqual(b''.join(command.data for command in executer.commands), data)
+        self.assertEqual(bytearray(executer.commands[3].command)[3:6], bytearray([0, 0x0c, 0]))
+
+    def test_stream_send__short_input(self):
+        with self.assertRaises(ValueError):
+            infi.asi_utils.stream_raw(RecordingExecuter(), WRITE_BUFFER, 0, 2048, io.BytesIO(b'x' * 1500), None,
+                                      count=None, chunk_size=1024)
+
+    def test_stream_send__partial_last_chunk(self):
+        executer = RecordingExecuter()
+        data = b'x' * 1500
+        infi.asi_utils.stream_raw(executer, WRITE_BUFFER, 0, 1500, io.BytesIO(data), None, count=None,
+                                  chunk_size=1024)
+        self.assertEqual([len(command.data) for command in executer.commands], [1024, 476])
+        self.assertEqual(bytearray(executer.commands[1].command)[3:9], bytearray([0, 0x04, 0, 0, 0x01, 0xdc]))
+
+    def test_stream_request__partial_last_chunk(self):
+        executer = RecordingExecuter()
+        output = io.BytesIO()
+        infi.asi_utils.stream_raw(executer, READ_BUFFER, 1500, 0, None, output, count=None, chunk_size=1024)
+        self.assertEqual([command.max_response_length for command in executer.commands], [1024, 476])
+        self.assertEqual(len(output.getvalue()), 1500)
+
+    def test_stream_request__lba_chunks(self):
+        executer = RecordingExecuter()
+        output = io.BytesIO()
+        infi.asi_utils.stream_raw(executer, READ_16, 4096, 0, None, output, count=None, chunk_size=1536)
+        cdbs = [bytearray(command.command) for command in executer.commands]
+        self.assertEqual([(cdb[9], cdb[13]) for cdb in cdbs], [(0x10, 3), (0x13, 3), (0x16, 2)])
+        self.assertEqual([command.max_response_length for command in executer.commands], [1536, 1536, 1024])
+        self.assertEqual(len(output.getvalue()), 4096)
+        with self.assertRaises(ValueError):
+            infi.asi_utils.stream_raw(executer, READ_16, 4096, 0, None, output, count=None, chunk_size=1000)
+
+    def test_stream_request(self):
+        executer = RecordingExecuter()
+        output = io.BytesIO()
+        infi.asi_utils.stream_raw(executer, READ_16, 4096, 0, None, output, count=3, chunk_size=None)
+        self.assertEqual(len(executer.commands), 3)
+        self.assertEqual(len(output.getvalue()), 3 * 4096)
+
+    def test_stream_request__chunks_generated_lazily(self):
+        executer = RecordingExecuter()
+        infi.asi_utils.stream_raw(executer, READ_BUFFER, 0xffffff, 0, None, None, count=3, chunk_size=1)
+        self.assertEqual(len(executer.commands), 3)
+
+    def test_empty_result_creates_outfile(self):
+        import os
+        import shutil
+        import tempfile
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'out')
+        infi.asi_utils.raw('sim:raw', ['00', '00', '00', '00', '00', '00'], None, path, None, '<stdin>')
+        with open(path, 'rb') as fd:
+            self.assertEqual(fd.read(), b'')
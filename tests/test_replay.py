@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+import infi.asi_utils
+from infi.asi.errors import AsiCheckConditionError
+from infi.asi_utils import asi_context, build_inq_command, sync_wait, replay
+from infi.asi_utils.simulator import get_target
+
+
+class ReplayTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'trace.bin')
+
+    def tearDown(self):
+        infi.asi_utils.close_recorder()
+        infi.asi_utils.ActiveReplay = None
+
+    def run_commands(self, device):
+        from infi.asi.cdb.tur import TestUnitReadyCommand
+        results = []
+        with asi_context(device) as asi:
+            results.append(sync_wait(asi, build_inq_command('0x80'), supresss_output=True).product_serial_number)
+            try:
+                sync_wait(asi, TestUnitReadyCommand(), supresss_output=True)
+                results.append('ok')
+            except AsiCheckConditionError as error:
+                results.append(error.sense_obj.sense_key)
+            results.append(sync_wait(asi, TestUnitReadyCommand(), supresss_output=True))
+        return results
+
+    def test_record_and_replay(self):
+        target = get_target('recorded')
+        target.pending_unit_attention = (0x2a, 0x09)
+        infi.asi_utils.ActiveRecorder = replay.TraceRecorder(self.path)
+        recorded = self.run_commands('sim:recorded@0.002')
+        infi.asi_utils.close_recorder()
+        exchanges = replay.read_trace(self.path)
+        self.assertEqual([exchange.status for exchange in exchanges],
+                         [replay.GOOD, replay.CHECK_CONDITION, replay.GOOD])
+        self.assertEqual(set(exchange.device for exchange in exchanges), set(['sim:recorded@0.002']))
+        self.assertTrue(all(exchange.latency >= 0.002 for exchange in exchanges))
+
+        commands = target.commands
+        infi.asi_utils.ActiveReplay = replay.TraceReplay(self.path, delay=0)
+        self.assertEqual(self.run_commands('sim:recorded@0.002'), recorded)
+        self.assertEqual(recorded[1], 'UNIT_ATTENTION')
+        self.assertEqual(target.commands, commands)
+        self.assertRaises(ValueError, self.run_commands, 'sim:other')
+        with asi_context('sim:recorded@0.002') as asi:
+            self.assertRaises(ValueError, sync_wait, asi, build_inq_command('0x83'), True)
+
+    def test_appends_and_rejects_truncated_traces(self):
+        exchange = replay.Exchange('/dev/sg1', b'\x00' * 6, b'', b'', replay.GOOD, b'', 0.001)
+        for _ in range(2):
+            recorder = replay.TraceRecorder(self.path)
+            recorder.record(exchange)
+            recorder.close()
+        self.assertEqual(replay.read_trace(self.path), [exchange, exchange])
+        with open(self.path, 'rb+') as fd:
+            fd.truncate(os.path.getsize(self.path) - 1)
+        self.assertRaises(ValueError, replay.read_trace, self.path)
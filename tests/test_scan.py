@@ -0,0 +1,63 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import infi.asi_utils
+from infi.asi_utils import formatters, scan
+from infi.asi_utils.simulator import get_target
+
+
+class ScanTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.original = infi.asi_utils.ActiveOutputContext
+        infi.asi_utils.ActiveOutputContext = infi.asi_utils.OutputContext()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def tearDown(self):
+        infi.asi_utils.ActiveOutputContext = self.original
+
+    def scan(self, device, **kwargs):
+        arguments = dict(workers=3, stripes=16, transfer_blocks=100, queue_depth=1)
+        arguments.update(kwargs)
+        with infi.asi_utils.ActiveOutputContext.capture():
+            return scan.scan(device, **arguments)
+
+    def test_split_stripes(self):
+        self.assertEqual(scan.split_stripes(10, 4), [(0, 3), (3, 3), (6, 3), (9, 1)])
+        self.assertEqual(scan.split_stripes(2, 4), [(0, 1), (1, 1)])
+
+    def test_scan_reports_check_conditions(self):
+        target = get_target('scan-errors')
+        target.blocks = 4096
+        target.medium_errors.update([150, 4000])
+        commands = target.commands
+        report = self.scan('sim:scan-errors', queue_depth=4, read=True)
+        self.assertEqual(report['scanned_blocks'], 4096)
+        self.assertEqual(len(report['stripes']), 16)
+        self.assertEqual(report['commands'], sum(len(range(0, 256, 100)) for _ in range(16)))
+        self.assertEqual(target.commands - commands, report['commands'] + 1)    # and READ CAPACITY (16)
+        self.assertEqual([(error['lba'], error['blocks']) for error in report['errors']], [(100, 100), (3940, 100)])
+        self.assertEqual(report['errors'][0]['error'], 'ERROR: MEDIUM_ERROR (UNRECOVERED READ ERROR)')
+        lines = formatters.ScanOutputFormatter().format(report).splitlines()
+        self.assertEqual(lines[4].count('X'), 2)
+        self.assertEqual(lines[5], '2 check conditions:')
+
+    def test_resume_from_checkpoint(self):
+        get_target('scan-resume').blocks = 1024
+        path = os.path.join(self.directory, 'checkpoint.json')
+        first = self.scan('sim:scan-resume', checkpoint_path=path)
+        with open(path) as fd:
+            checkpoint = json.load(fd)
+        self.assertEqual(len(checkpoint['stripes']), 16)
+        checkpoint['stripes'] = checkpoint['stripes'][:10]
+        with open(path, 'w') as fd:
+            json.dump(checkpoint, fd)
+        resumed = self.scan('sim:scan-resume', checkpoint_path=path)
+        self.assertEqual(resumed['resumed_stripes'], 10)
+        self.assertEqual(resumed['scanned_blocks'], 6 * 64)
+        self.assertEqual([stripe['first_lba'] for stripe in resumed['stripes']],
+                         [stripe['first_lba'] for stripe in first['stripes']])
+        self.assertRaises(ValueError, self.scan, 'sim:scan-resume', checkpoint_path=path, read=True)
@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+from infi.asi_utils import script
+from infi.asi_utils.simulator import SimulatedExecuter, SimulatedTarget
+
+
+class ScriptTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.target = SimulatedTarget('script')
+        self.executer = SimulatedExecuter(self.target)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_parse(self):
+        steps = script.parse_script(['# comment', '', '12 00 00 00 60 00 --request=96 --repeat=2  # inquiry',
+                                     '3b 02 00 00 00 00 00 00 10 00 --send=16 --infile=@previous'])
+        self.assertEqual([(step.line, step.cdb, step.request_length, step.repeat) for step in steps],
+                         [(3, b'\x12\x00\x00\x00\x60\x00', 96, 2), (4, b'\x3b\x02\x00\x00\x00\x00\x00\x00\x10\x00', 0, 1)])
+        for line in ('12 00 00 00 60 00 --request=96 --send=4', '--request=96', '00 00 00 00 00 00 --count=2',
+                     '3b 02 00 00 00 00 00 00 10 00 --send=16'):
+            with self.assertRaises(ValueError):
+                script.parse_script([line])
+
+    def test_run(self):
+        steps = script.parse_script(['12 00 00 00 60 00 --request=96 --repeat=3 --outfile=%s' % self._path('inq'),
+                                     '3b 02 00 00 00 00 00 00 10 00 --send=16 --infile=@previous'])
+        records = script.run_script(self.executer, steps)
+        self.assertEqual([(record['status'], record['repeat'], record['bytes_in'], record['bytes_out'])
+                          for record in records], [('ok', 3, 288, 0), ('ok', 1, 0, 16)])
+        self.assertEqual(records[0]['latency']['count'], 3)
+        with open(self._path('inq'), 'rb') as fd:
+            self.assertEqual(len(fd.read()), 288)
+
+    def test_stop_on_check(self):
+        steps = script.parse_script(['ff 00 00 00 00 00', '00 00 00 00 00 00'])
+        statuses = [record['status'] for record in script.run_script(self.executer, steps)]
+        self.assertTrue(statuses[0].startswith('check condition: ILLEGAL_REQUEST'))
+        self.assertEqual(statuses[1], 'ok')
+        statuses = [record['status'] for record in script.run_script(self.executer, steps, stop_on_check=True)]
+        self.assertEqual(statuses[1], 'skipped')
+
+    def test_errors(self):
+        steps = script.parse_script(['00 00 00 00 00 00', '3b 02 00 00 00 00 00 00 10 00 --send=16 --infile=%s'
+                                     % self._path('missing')])
+        with self.assertRaises(ValueError) as context:
+            script.run_script(self.executer, steps)
+        self.assertTrue(str(context.exception).startswith('line 2: cannot read'))
+        self.target.registrations, self.target.reservation = [0x20], (0x20, 0x03)
+        steps = script.parse_script(['00 00 00 00 00 00', '5f 01 00 00 00 00 00 00 18 00 --send=24 --infile=%s'
+                                     % self._path('key'), '00 00 00 00 00 00'])
+        with open(self._path('key'), 'wb') as fd:
+            fd.write(b'\x00' * 7 + b'\x10' + b'\x00' * 16)
+        records = script.run_script(self.executer, steps, stop_on_check=True)
+        self.assertEqual([record['status'] for record in records],
+                         ['ok', 'error: SCSI reservation conflict', 'skipped'])
+        self.assertEqual(records[0]['latency']['count'], 1)
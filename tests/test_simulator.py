@@ -0,0 +1,98 @@
+import unittest
+import infi.asi_utils
+from infi.asi.coroutines.sync_adapter import sync_wait
+from infi.asi.errors import AsiCheckConditionError
+from infi.asi_utils import batch, benchmark, formatters
+from infi.asi_utils.simulator import SimulatedExecuter, SimulatedTarget, parse_device
+
+
+class SimulatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.target = SimulatedTarget('test')
+        self.executer = SimulatedExecuter(self.target)
+
+    def _execute(self, command):
+        return sync_wait(command.execute(self.executer))
+
+    def test_parse_device(self):
+        self.assertEqual(parse_device('sim:lun0'), ('lun0', 0.0))
+        self.assertEqual(parse_device('sim:lun0@0.5'), ('lun0', 0.5))
+
+    def test_inquiry(self):
+        standard = self._execute(infi.asi_utils.build_inq_command(None))
+        self.assertEqual(standard.t10_vendor_identification, 'INFI-SIM')
+        serial = self._execute(infi.asi_utils.build_inq_command('0x80'))
+        self.assertEqual(serial.product_serial_number, self.target.serial.decode())
+        self.assertEqual(SimulatedTarget('test').serial, self.target.serial)
+
+    def test_readcap_and_luns(self):
+        capacity = self._execute(infi.asi_utils.build_readcap_command(read_16=True))
+        self.assertEqual(capacity.last_logical_block_address, self.target.blocks - 1)
+        self.assertEqual(capacity.block_length_in_bytes, self.target.block_size)
+        luns = self._execute(infi.asi_utils.build_luns_command(0))
+        self.assertEqual(len(luns.lun_list), self.target.luns)
+
+    def test_persistent_reservations(self):
+        from infi.asi.cdb.persist.input import PERSISTENT_RESERVE_IN_SERVICE_ACTION_CODES as codes
+        from infi.asi.cdb.persist.output import PersistentReserveOutCommand, PERSISTENT_RESERVE_OUT_SERVICE_ACTION_CODES
+        register = PersistentReserveOutCommand(service_action=PERSISTENT_RESERVE_OUT_SERVICE_ACTION_CODES.REGISTER,
+                                               service_action_reservation_key=0x1234)
+        self._execute(register)
+        keys = self._execute(infi.asi_utils.build_pr_in_command(codes.READ_KEYS))
+        self.assertEqual(keys.key_list, [0x1234])
+        self.assertEqual(keys.pr_generation, 1)
+
+    def test_unit_attention(self):
+        self.target.pending_unit_attention = (0x2a, 0x09)
+        with self.assertRaises(AsiCheckConditionError) as context:
+            self._execute(infi.asi_utils.build_readcap_command(read_16=False))
+        self.assertEqual(context.exception.sense_obj.sense_key, 'UNIT_ATTENTION')
+        self._execute(infi.asi_utils.build_readcap_command(read_16=False))
+
+    def test_inventory(self):
+        record = infi.asi_utils.collect_inventory(self.executer)
+        self.assertEqual(record['serial'], self.target.serial.decode())
+        self.assertEqual(record['alua_state'], 'active/optimized')
+
+    def test_batch_request(self):
+        response = batch.handle_request(dict(command='inq', device='sim:batch', options={'page': '0x80'}))
+        self.assertEqual(response['status'], 'ok')
+        self.assertIn('SIM', response['results'][0])
+
+    def test_benchmark(self):
+        original = infi.asi_utils.ActiveOutputContext
+        infi.asi_utils.ActiveOutputContext = infi.asi_utils.OutputContext()
+        try:
+            with infi.asi_utils.ActiveOutputContext.capture() as captured:
+                rows = benchmark.benchmark(iterations=2, latency=0)
+        finally:
+            infi.asi_utils.ActiveOutputContext = original
+        self.assertIn('inq --page=0x83', [row['command'] for row in rows])
+        self.assertTrue(all(row['commands_per_second'] > 0 for row in rows))
+        self.assertEqual(len(captured.lines), 1)
+        self.assertIn('commands_per_second', formatters.BenchmarkOutputFormatter().format(rows).splitlines()[0])
+
+    def test_text_benchmark(self):
+        rows = list(benchmark.text_suite(iterations=2, latency=0))
+        self.assertIn('inq --page=0x83', [row['command'] for row in rows])
+        self.assertTrue(all(row['planned_us'] > 0 for row in rows))
+
+    def test_ndjson_turs(self):
+        import json
+        import six.moves
+        stream = six.moves.StringIO()
+        original = infi.asi_utils.ActiveOutputContext
+        infi.asi_utils.ActiveOutputContext = infi.asi_utils.OutputContext()
+        infi.asi_utils.ActiveOutputContext.set_ndjson(file=stream)
+        try:
+            infi.asi_utils.dispatch(infi.asi_utils.parse_arguments(['turs', 'sim:ndjson', '-n', '5',
+                                                                     '--queue-depth=2', '--ndjson']))
+            infi.asi_utils.ActiveOutputContext.flush()
+        finally:
+            infi.asi_utils.ActiveOutputContext = original
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(len(records), 6)
+        self.assertTrue(all(record['device'] == 'sim:ndjson' and record['command'] == 'turs' for record in records))
+        self.assertTrue(all(record['latency'] > 0 for record in records[:5]))
+        self.assertEqual(records[-1]['result']['commands'], 5)
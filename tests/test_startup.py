@@ -0,0 +1,48 @@
+import subprocess
+import sys
+import unittest
+import docopt
+import infi.asi_utils
+
+# cumulative microseconds "python -X importtime" may report for importing infi.asi_utils
+IMPORT_TIME_BUDGET = 50000
+HEAVY_MODULES = ('docopt', 'infi.instruct', 'infi.pyutils', 'infi.asi', 'infi.asi_utils.formatters')
+
+
+class StartupTestCase(unittest.TestCase):
+
+    def _run(self, *args):
+        return subprocess.check_output([sys.executable] + list(args), stderr=subprocess.STDOUT).decode()
+
+    def test_heavy_modules_are_deferred(self):
+        output = self._run('-c', 'import sys, infi.asi_utils; print("\\n".join(sys.modules))')
+        loaded = [name for name in output.splitlines()
+                  if name in HEAVY_MODULES or name.startswith(tuple(module + '.' for module in HEAVY_MODULES))]
+        self.assertEqual(loaded, [])
+
+    @unittest.skipIf(sys.version_info < (3, 7), "-X importtime requires python 3.7")
+    def test_import_time_budget(self):
+        output = self._run('-X', 'importtime', '-c', 'import infi.asi_utils')
+        cumulative = [int(line.split('|')[1]) for line in output.splitlines()
+                      if line.startswith('import time:') and line.split('|')[2].strip() == 'infi.asi_utils']
+        self.assertLess(cumulative[0], IMPORT_TIME_BUDGET)
+
+    def test_parse_arguments_matches_docopt(self):
+        for argv in (['inq', '/dev/sg1', '--page=0x83'],
+                     ['turs', '/dev/sg1', '/dev/sg2', '-n', '5', '--queue-depth=4'],
+                     ['pr_register', '/dev/sg1', '0x1234', '--json'],
+                     ['pr_audit', '/dev/sg1', '/dev/sg2', '--keys=0x1,0x2', '--holder=0x1'],
+                     ['pr_bulk', '/dev/sg1', '/dev/sg2', '--action=reserve', '--key=0x1', '--rollback'],
+                     ['logs', '/dev/sg1', '/dev/sg2', '--all', '--state-dir=/tmp/state'],
+                     ['raw', '/dev/sg1', '--script=steps.txt', '--stop-on-check'],
+                     ['paths', '/dev/dm-0', '--samples=100', '--jobs=4'],
+                     ['decode', 'bundle.tar', 'luns/', '--type=inq', '--page=0x83', '--processes=8'],
+                     ['turs', 'sim:lun0', '-n', '100', '--replay=trace.bin', '--replay-delay=0'],
+                     ['scan', '/dev/sg1', '--read', '--queue-depth=8', '--workers=2', '--checkpoint=scan.json'],
+                     ['raw', '/dev/sg1', '12', '00', '00', '00', '60', '00', '--request=96', '-h'],
+                     ['reset', '/dev/sg1', '--host']):
+            self.assertEqual(infi.asi_utils.parse_arguments(argv), docopt.docopt(infi.asi_utils.__doc__, argv))
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(docopt.DocoptExit):
+            infi.asi_utils.parse_arguments(['inq'])
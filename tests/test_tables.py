@@ -0,0 +1,60 @@
+import struct
+import unittest
+from infi.asi import SCSIReadCommand
+from infi.asi.coroutines.sync_adapter import sync_wait
+from infi.asi.cdb.report_luns import ReportLunsData, UnsupportedLogicalUnitAddressingMethod, UnsupportedLunAdressing
+from infi.asi.cdb.rtpg import TargetPortGroupLengthOnlyResponse
+from infi.asi_utils import benchmark, build_rtpg_command, formatters
+from infi.asi_utils.simulator import SimulatedExecuter, SimulatedTarget
+from infi.asi_utils.tables import LunTable, TargetPortGroupTable
+
+
+def report_luns(entries, padding=0):
+    lun_list = b''.join(struct.pack('>Q', entry) for entry in entries)
+    return struct.pack('>II', len(lun_list), 0) + lun_list + b'\x00' * padding
+
+
+class TablesTestCase(unittest.TestCase):
+
+    def test_luns_match_instruct(self):
+        data = report_luns([lun << 48 for lun in (0, 1, 255, 0x3fff)], padding=64)
+        expected = ReportLunsData.create_from_string(data)
+        expected.normalize_lun_list()
+        table = LunTable.from_bytes(data)
+        self.assertEqual(list(table.lun_list), expected.lun_list)
+        self.assertEqual(table.lun_list_length, expected.lun_list_length)
+        formatter = formatters.DefaultOutputFormatter()
+        self.assertEqual(formatter.format(table), formatter.format(expected))
+        self.assertEqual(formatters.LunsOutputFormatter().format(table), '0\n1\n255\n16383')
+
+    def test_truncated_luns(self):
+        data = report_luns([lun << 48 for lun in range(10)])
+        self.assertEqual(list(LunTable.from_bytes(data[:8 + 8 * 3 + 5])), [0, 1, 2])
+
+    def test_unsupported_addressing(self):
+        with self.assertRaises(UnsupportedLogicalUnitAddressingMethod):
+            LunTable.from_bytes(report_luns([0, 0x4100 << 48]))
+        with self.assertRaises(UnsupportedLunAdressing):
+            LunTable.from_bytes(report_luns([0, (1 << 48) | 1]))
+        self.assertEqual(list(LunTable.from_bytes(report_luns([0x4100 << 48]), True)), [0x4100])
+
+    def test_rtpg_matches_instruct(self):
+        executer = SimulatedExecuter(SimulatedTarget('tables'))
+        command = build_rtpg_command(False)
+        data = sync_wait(executer.call(SCSIReadCommand(command.create_datagram(), 16384)))
+        expected = TargetPortGroupLengthOnlyResponse()
+        expected.unpack(data)
+        formatter = formatters.JsonOutputFormatter()
+        self.assertEqual(formatter.format(TargetPortGroupTable.from_bytes(data)), formatter.format(expected))
+
+    def test_extended_rtpg(self):
+        self.assertEqual(bytearray(build_rtpg_command(True).create_datagram())[1], 0x2a)
+        table = sync_wait(build_rtpg_command(True).execute(SimulatedExecuter(SimulatedTarget('tables'))))
+        self.assertEqual(table.format_type, 1)
+        self.assertEqual([(descriptor.target_port_group, descriptor.asymetric_access_state)
+                          for descriptor in table.descriptor_list], [(0, 0), (1, 1)])
+
+    def test_benchmark(self):
+        rows = list(benchmark.tables_suite(iterations=100, latency=0))
+        self.assertEqual([row['luns'] for row in rows], list(benchmark.TABLES_BENCHMARK_LUNS))
+        self.assertTrue(all(row['compact_us'] > 0 for row in rows))
@@ -0,0 +1,42 @@
+import unittest
+import infi.asi_utils
+from infi.asi import CommandExecuterBase
+from infi.asi_utils import formatters, stats
+
+
+class FakeQueuedExecuter(CommandExecuterBase):
+    def __init__(self):
+        super(FakeQueuedExecuter, self).__init__()
+        self.queued = []
+        self.max_in_flight = 0
+
+    def _os_prepare_to_send(self, command, packet_index):
+        return packet_index
+
+    def _os_send(self, os_data):
+        self.queued.append(os_data)
+        self.max_in_flight = max(self.max_in_flight, len(self.pending_packets))
+        yield None
+
+    def _os_receive(self):
+        yield (None, self.queued.pop(0))
+
+
+class TursTestCase(unittest.TestCase):
+
+    def test_latency_summary(self):
+        summary = stats.latency_summary([0.004, 0.001, 0.003, 0.002])
+        self.assertEqual(summary['count'], 4)
+        self.assertEqual(summary['min'], 0.001)
+        self.assertEqual(summary['max'], 0.004)
+        self.assertAlmostEqual(summary['avg'], 0.0025)
+
+    def test_pipelined_turs(self):
+        executer = FakeQueuedExecuter()
+        summary = infi.asi_utils.pipelined_turs(executer, number=100, queue_depth=8)
+        self.assertEqual(summary['commands'], 100)
+        self.assertEqual(summary['errors'], 0)
+        self.assertEqual(summary['latency']['count'], 100)
+        self.assertEqual(executer.max_in_flight, 8)
+        self.assertIn('Completed 100 Test Unit Ready commands with 0 errors',
+                      formatters.TursOutputFormatter().format(summary))
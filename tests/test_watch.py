@@ -0,0 +1,96 @@
+import unittest
+import infi.asi_utils
+from infi.asi_utils import formatters, watch
+from infi.asi_utils.simulator import get_target
+
+
+class WatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.original = infi.asi_utils.ActiveOutputContext
+        infi.asi_utils.ActiveOutputContext = infi.asi_utils.OutputContext()
+
+    def tearDown(self):
+        infi.asi_utils.ActiveOutputContext = self.original
+
+    def test_parse_checks(self):
+        self.assertEqual(watch.parse_checks('turs, logs:0x02'), [('turs', 'turs', None), ('logs:0x02', 'logs', '0x02')])
+        for checks in ('logs', 'turs:1', 'smart'):
+            with self.assertRaises(ValueError):
+                watch.parse_checks(checks)
+
+    def test_diff(self):
+        self.assertIsNone(watch.diff('turs', 'ok', 'ok'))
+        change = watch.diff('logs:0x02', {'0x0001': 3, '0x0002': 5}, {'0x0001': 4, '0x0002': 5})
+        self.assertEqual(change['delta'], {'0x0001': 1})
+
+    def test_only_changes_are_output(self):
+        target = get_target('watch-changes')
+        target.alua_states = {0: 0x0, 1: 0x1}
+        watcher = watch.Watcher(['sim:watch-changes', 'sim:watch-steady'], 'turs,alua', 2)
+        self.assertEqual(len(watcher.poll()), 4)
+        self.assertEqual(watcher.poll(), [])
+        target.alua_states = {0: 0x2, 1: 0x1}
+        target.pending_unit_attention = (0x2a, 0x06)
+        changes = watcher.poll()
+        self.assertEqual([(device, change['check']) for device, change in changes],
+                         [('sim:watch-changes', 'turs'), ('sim:watch-changes', 'alua')])
+        self.assertEqual(changes[0][1]['current'], 'UNIT_ATTENTION (ASYMMETRIC ACCESS STATE CHANGED)')
+        with infi.asi_utils.ActiveOutputContext.scope(device='sim:watch-changes'):
+            line = formatters.WatchOutputFormatter().format(changes[1][1])
+        self.assertTrue(line.endswith('sim:watch-changes alua: 0 active/optimized -> standby'))
+        self.assertEqual(len(watcher.poll()), 1)    # the unit attention cleared
+
+    def test_rounds(self):
+        with infi.asi_utils.ActiveOutputContext.capture() as captured:
+            watch.watch(['sim:watch-rounds'], 1, interval=0.001, checks='turs', rounds=3)
+        self.assertEqual(len(captured.lines), 1)
+        self.assertIsNone(infi.asi_utils.ActiveExecuterPool)
+
+    def test_slow_poll_skips_missed_ticks(self):
+        import time
+        watcher = watch.Watcher(['sim:watch-slow'], 'turs', 1)
+        polls, sleeps = [], []
+        sleep = time.sleep
+
+        def poll():
+            polls.append(None)
+            if len(polls) == 1:
+                sleep(0.2)
+            return []
+
+        def record_sleep(seconds):
+            sleeps.append(seconds)
+        watcher.poll = poll
+        watch.time.sleep = record_sleep
+        try:
+            watcher.run(0.02, rounds=4)
+        finally:
+            watch.time.sleep = sleep
+        self.assertEqual(len(sleeps), 3)
+        self.assertTrue(all(seconds > 0.01 for seconds in sleeps[1:]), sleeps)
+
+    def test_device_vanishing_mid_watch(self):
+        original_open_executer = infi.asi_utils.open_executer
+        vanished = set()
+
+        def open_executer(device):
+            if device in vanished:
+                raise OSError(2, 'No such file or directory', device)
+            return original_open_executer(device)
+        infi.asi_utils.ActiveExecuterPool = pool = infi.asi_utils.ExecuterPool()
+        infi.asi_utils.open_executer = open_executer
+        try:
+            watcher = watch.Watcher(['sim:watch-vanishing', 'sim:watch-staying'], 'turs', 2)
+            self.assertEqual(len(watcher.poll()), 2)
+            vanished.add('sim:watch-vanishing')
+            pool.discard('sim:watch-vanishing')
+            changes = watcher.poll()
+            self.assertEqual([device for device, _ in changes], ['sim:watch-vanishing'])
+            self.assertTrue(changes[0][1]['current'].startswith('error: '))
+            vanished.clear()
+            self.assertEqual(changes[0][1]['previous'], watcher.poll()[0][1]['current'])
+        finally:
+            infi.asi_utils.open_executer = original_open_executer
+            infi.asi_utils.ActiveExecuterPool = None
+            pool.close()